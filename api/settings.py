@@ -87,6 +87,10 @@ DATABASES = {
     }
 }
 
+# Mesma base, conexão própria: a numeração de NF (core/services/fiscal_numbers.py)
+# faz commit na hora, fora da transação de quem está gerando a nota
+DATABASES['fiscal_numbers'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -136,4 +140,36 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 from decouple import config
 
-CERTIFICATE_ENCRYPTION_KEY = config('CERTIFICATE_ENCRYPTION_KEY')
\ No newline at end of file
+CERTIFICATE_ENCRYPTION_KEY = config('CERTIFICATE_ENCRYPTION_KEY')
+# Índice fiscal em memória (core/services/fiscal_index.py): tempo máximo,
+# em segundos, antes de recompilar mesmo sem troca de versão (alteração
+# feita por fora dos signals)
+FISCAL_INDEX_TTL = config('FISCAL_INDEX_TTL', default=300, cast=int)
+# Intervalo entre conferências da versão no banco (troca feita em outro
+# processo vale depois disso) e máximo de empresas com índice por processo
+FISCAL_INDEX_VERSION_CHECK = config('FISCAL_INDEX_VERSION_CHECK', default=5, cast=int)
+FISCAL_INDEX_MAX_BUSINESSES = config('FISCAL_INDEX_MAX_BUSINESSES', default=256, cast=int)
+
+# Fila de tarefas (core.services.jobs): espera base entre tentativas e
+# tempo para considerar morto um job RUNNING (segundos)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=30, cast=int)
+JOB_STALE_AFTER = config('JOB_STALE_AFTER', default=600, cast=int)
+
+# Numeração de NFC-e em blocos por worker (0 = um número por vez) e
+# validade de cada bloco, em segundos; sobras são inutilizadas
+NFCE_NUMBER_BLOCK_SIZE  = config('NFCE_NUMBER_BLOCK_SIZE', default=0, cast=int)
+FISCAL_NUMBER_BLOCK_TTL = config('FISCAL_NUMBER_BLOCK_TTL', default=3600, cast=int)
+
+# Emissão de NF em lote (manage.py emitir_lote / admin): processos no pool
+NF_BATCH_PROCESSES = config('NF_BATCH_PROCESSES', default=4, cast=int)
+
+# URL base que substitui a da SEFAZ em todas as UFs (ex.: servidor local
+# de `manage.py sefaz_local`); vazio = SEFAZ de verdade
+SEFAZ_URL_OVERRIDE = config('SEFAZ_URL_OVERRIDE', default='')
+
+# Aquece no startup o serializador do XML da NF (metadados do nfelib);
+# desligar só encurta o boot de comandos que nunca geram XML
+NFE_XML_WARMUP = config('NFE_XML_WARMUP', default=True, cast=bool)
+
+# Validade (s) do XML da NF em cache, pelo hash do conteúdo da nota
+NFE_XML_CACHE_TTL = config('NFE_XML_CACHE_TTL', default=86400, cast=int)
@@ -1,5 +1,14 @@
-from django.contrib import admin
-from .models import Business, User, Client
+from urllib.parse import urlencode
+
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import (
+    Business, User, Client, EANSequence, Job, Orders,
+    FiscalNumberSequence, FiscalNumberBlock, FiscalNumberVoid,
+)
+from .services.emissao_lote import pending_orders
+from .services.faturamento import enqueue_invoice_chain
 
 @admin.register(Business)
 class BusinessAdmin(admin.ModelAdmin):
@@ -16,3 +25,64 @@ class ClientAdmin(admin.ModelAdmin):
     list_display = ('name', 'email', 'business', 'created_at')
     list_filter = ('business',)
     search_fields = ('name', 'email', 'document')
+
+@admin.register(Orders)
+class OrdersAdmin(admin.ModelAdmin):
+    list_display = ('id', 'business', 'client', 'status', 'document_model', 'total_amount', 'created_at')
+    list_filter = ('status', 'document_model', 'business')
+    search_fields = ('id', 'client__name', 'access_key')
+    raw_id_fields = ('business', 'client')
+    actions = ['emitir_nf_lote']
+
+    @admin.action(description='Emitir NF em lote (gerar, assinar e transmitir)')
+    def emitir_nf_lote(self, request, queryset):
+        # Só enfileira: run_workers gera/assina/transmite, e o andamento
+        # aparece no pedido e em Jobs (pedidos já na fila ficam de fora)
+        orders = list(pending_orders(queryset).order_by('id'))
+        if not orders:
+            self.message_user(request, 'Nenhum pedido faturado pendente de NF na seleção.', messages.WARNING)
+            return
+
+        enqueue_invoice_chain(orders)
+
+        url = reverse('admin:core_job_changelist') + '?' + urlencode({
+            'order__id__in': ','.join(str(order.pk) for order in orders),
+        })
+        self.message_user(
+            request,
+            format_html(
+                '{} pedido(s) enfileirado(s) para emissão de NF. <a href="{}">Acompanhar nos Jobs</a>.',
+                len(orders), url,
+            ),
+            messages.SUCCESS,
+        )
+
+@admin.register(EANSequence)
+class EANSequenceAdmin(admin.ModelAdmin):
+    list_display = ('business', 'prefix', 'next_value', 'updated_at')
+    search_fields = ('business__name', 'prefix')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'order', 'status', 'attempts', 'run_at', 'finished_at', 'result')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'order__id', 'last_error')
+    raw_id_fields = ('business', 'order')
+
+@admin.register(FiscalNumberSequence)
+class FiscalNumberSequenceAdmin(admin.ModelAdmin):
+    list_display = ('business', 'model', 'serie', 'last_number', 'checked_through', 'updated_at')
+    list_filter = ('model',)
+    search_fields = ('business__name',)
+
+@admin.register(FiscalNumberBlock)
+class FiscalNumberBlockAdmin(admin.ModelAdmin):
+    list_display = ('business', 'model', 'serie', 'start', 'end', 'worker', 'status', 'created_at')
+    list_filter = ('status', 'model')
+    search_fields = ('business__name', 'worker')
+
+@admin.register(FiscalNumberVoid)
+class FiscalNumberVoidAdmin(admin.ModelAdmin):
+    list_display = ('business', 'model', 'serie', 'start', 'end', 'status', 'attempts', 'return_code', 'processed_at')
+    list_filter = ('status', 'model')
+    search_fields = ('business__name', 'protocol', 'return_message')
@@ -1,7 +1,23 @@
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Prefetch
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated
-from .models import Client
-from .serializers import ClientSerializer
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated, BasePermission
+from .models import Client, IdempotencyKey, Orders, OrderItem, OrderPayment, StockEntry
+from .serializers import ClientSerializer, IngestOrderSerializer, OrderSerializer, requested_fields
+from .services.order_ingest import ingest_orders
+from .services.order_status import bulk_change_status
+from .services.order_stock import apply_stock_balance
 
 class ClientViewSet(ModelViewSet):
     serializer_class = ClientSerializer
@@ -16,3 +32,228 @@ class ClientViewSet(ModelViewSet):
         serializer.save(
             business=self.request.user.business
         )
+
+
+class HasMarketplaceIntegration(BasePermission):
+    message = 'O plano da empresa não inclui integração com marketplaces.'
+
+    def has_permission(self, request, view):
+        plan = getattr(request.user.business, 'plan', None)
+        return bool(plan and plan.has_marketplace_integration)
+
+
+class OrderIngestView(APIView):
+    """
+    POST /api/orders/ingest/  {"orders": [{...}, ...]}
+
+    Cria até MAX_ORDERS pedidos de uma vez (services/order_ingest.py).
+    Cada pedido volta com ok/id/uid ou com a lista de erros; um pedido
+    inválido não impede os demais.
+
+    Com o header Idempotency-Key a resposta fica gravada: reenvio com a
+    mesma chave e o mesmo corpo devolve a resposta original sem criar
+    nada; com corpo diferente, 422.
+    """
+    permission_classes = [IsAuthenticated, HasMarketplaceIntegration]
+    endpoint = 'orders.ingest'
+    MAX_ORDERS = 500
+
+    def post(self, request):
+        business = request.user.business
+        orders   = request.data.get('orders') if isinstance(request.data, dict) else None
+
+        if not isinstance(orders, list) or not orders:
+            return Response({'error': 'Envie "orders" com ao menos um pedido.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(orders) > self.MAX_ORDERS:
+            return Response(
+                {'error': f'Máximo de {self.MAX_ORDERS} pedidos por requisição.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        key          = request.headers.get('Idempotency-Key', '').strip()[:255]
+        request_hash = hashlib.sha256(
+            json.dumps(request.data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        if key:
+            stored = IdempotencyKey.objects.filter(business=business, key=key).first()
+            if stored:
+                return self._replay(stored, request_hash)
+
+        try:
+            with transaction.atomic():
+                # 🔹 Chave gravada antes de tudo: requisição concorrente com a
+                # mesma chave espera aqui e depois cai no IntegrityError
+                record = None
+                if key:
+                    record = IdempotencyKey.objects.create(
+                        business=business, key=key, endpoint=self.endpoint,
+                        request_hash=request_hash, response_status=0,
+                    )
+
+                body, code = self._ingest(business, orders)
+
+                if record:
+                    record.response_status = code
+                    record.response_body   = body
+                    record.save(update_fields=['response_status', 'response_body'])
+
+        except IntegrityError:
+            if not key:
+                raise
+            # Sem a linha: o IntegrityError veio de _ingest (e desfez a chave)
+            stored = IdempotencyKey.objects.filter(business=business, key=key).first()
+            if stored is None:
+                raise
+            return self._replay(stored, request_hash)
+
+        return Response(body, status=code)
+
+    def _ingest(self, business, orders):
+        results = [None] * len(orders)
+        valid   = []
+
+        for index, raw in enumerate(orders):
+            serializer = IngestOrderSerializer(data=raw)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {
+                    'index': index,
+                    'external_id': raw.get('external_id') if isinstance(raw, dict) else None,
+                    'ok': False, 'id': None, 'uid': None,
+                    'errors': serializer.errors,
+                }
+
+        if valid:
+            ingested = ingest_orders(business, [data for _, data in valid])
+            for (index, _), result in zip(valid, ingested):
+                result['index']  = index
+                results[index]   = result
+
+        created = sum(1 for r in results if r['ok'])
+        body = {
+            'created': created,
+            'failed': len(results) - created,
+            'results': json.loads(json.dumps(results, default=str)),
+        }
+        code = status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        return body, code
+
+    def _replay(self, stored, request_hash):
+        if stored.request_hash != request_hash:
+            return Response(
+                {'error': 'Idempotency-Key já usada com outro conteúdo.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = Response(stored.response_body, status=stored.response_status)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PEDIDOS
+# ─────────────────────────────────────────────────────────────────────────────
+
+class OrderCursorPagination(CursorPagination):
+    # Mesmo índice da listagem HTML: (business, created_at)
+    ordering = ('-created_at', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest())
+
+
+class OrderViewSet(ModelViewSet):
+    """
+    /api/orders/  pedidos com itens, pagamentos e parcelas aninhados.
+
+      ?status=DIGITACAO,ORCAMENTO   filtra por status
+      ?updated_since=<ISO 8601>     só alterados a partir do instante
+      ?fields=id,status,items       campos devolvidos (e relações carregadas)
+      ?cursor= / ?page_size=        paginação por cursor (created_at, id)
+
+    Listagem e detalhe mandam ETag (derivado de updated_at); If-None-Match
+    igual devolve 304 sem serializar nada.
+    """
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        qs = Orders.objects.filter(business=self.request.user.business)
+
+        if params.get('status'):
+            qs = qs.filter(status__in=params['status'].split(','))
+
+        if params.get('updated_since'):
+            try:
+                since = parse_datetime(params['updated_since'])
+            except ValueError:   # bem formada, mas impossível (ex.: 2024-02-30)
+                since = None
+            if since is None:
+                raise ValidationError({'updated_since': 'Data/hora inválida (use ISO 8601).'})
+            qs = qs.filter(updated_at__gte=since)
+
+        # 🔹 Um prefetch por relação pedida: página inteira em poucas consultas
+        fields = requested_fields(self.request)
+        if fields is None or 'items' in fields:
+            qs = qs.prefetch_related(Prefetch(
+                'items', queryset=OrderItem.objects.select_related('variant').order_by('id'),
+            ))
+        if fields is None or 'payments' in fields:
+            qs = qs.prefetch_related(Prefetch(
+                'payments', queryset=OrderPayment.objects.prefetch_related('parcels_records').order_by('id'),
+            ))
+        return qs
+
+    def _not_modified(self, etag):
+        return etag in parse_etags(self.request.headers.get('If-None-Match', ''))
+
+    def list(self, request, *args, **kwargs):
+        summary = self.get_queryset().order_by().aggregate(count=Count('id'), last=Max('updated_at'))
+        etag    = _etag(request.user.business_id, request.get_full_path(), summary['count'], summary['last'])
+
+        if self._not_modified(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        updated_at = (
+            Orders.objects.filter(business=request.user.business, pk=kwargs['pk'])
+            .values_list('updated_at', flat=True).first()
+        )
+        etag = _etag(kwargs['pk'], request.get_full_path(), updated_at)
+
+        if updated_at is not None and self._not_modified(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        if not instance.can_edit():
+            raise ValidationError(f'Pedido {instance.get_status_display()} não pode ser excluído.')
+
+        apply_stock_balance(StockEntry.objects.filter(order_item__order=instance), reverse=True)
+        instance.delete()
+
+    @action(detail=True, methods=['post'], url_path='status')
+    def change_status(self, request, pk=None):
+        """POST {"status": "EM_SEPARACAO"} → mesma regra da troca em lote."""
+        order  = self.get_object()
+        result = bulk_change_status(request.user.business, [order.pk], request.data.get('status'))[0]
+
+        if not result['ok']:
+            return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(self.get_serializer(self.get_queryset().get(pk=order.pk)).data)
@@ -1,7 +1,11 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .api import ClientViewSet
+from .api import ClientViewSet, OrderViewSet, OrderIngestView
 
 router = DefaultRouter()
 router.register(r'clients', ClientViewSet, basename='clients')
+router.register(r'orders', OrderViewSet, basename='orders')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('orders/ingest/', OrderIngestView.as_view(), name='api_order_ingest'),
+] + router.urls
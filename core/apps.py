@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from core import signals  # noqa: F401
+        from core.services import faturamento  # noqa: F401  (registra as tarefas da fila)
+
+        # Metadados do nfelib montados uma vez por processo, antes da 1ª NF
+        if getattr(settings, 'NFE_XML_WARMUP', True):
+            from core.services.fiscal.xml_builder import warm_up
+            warm_up()
@@ -3,7 +3,9 @@ from django.forms import inlineformset_factory
 from .models import Client, Sizechart, colorchart, modelchart, Product, StockEntry, Orders, OrderItem, ProductImage, Sizes, ProductVariant, FinancialMovement, FinancialMovementParcel, PaymentMethod, BankAccount, OrderPayment, OrderPaymentParcel, Business, Plan, User
 from django.forms import inlineformset_factory
 from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from core.services.fiscal_numbers import peek_next_number
 
 class AdminBusinessForm(forms.ModelForm):
     class Meta:
@@ -426,13 +428,50 @@ class OrderForm(forms.ModelForm):
             self.fields['document_model'].disabled = True
 
 
+class LazyVariantSelect(forms.Select):
+    """
+    <select> de variantes que só renderiza a opção selecionada; as demais
+    vêm da busca em ajax_variants (select2 no template). Não percorre o
+    queryset do campo.
+    """
+
+    def __init__(self, attrs=None):
+        attrs = {'class': 'form-control variant-select', **(attrs or {})}
+        super().__init__(attrs)
+        self.labels = {}  # id (str) → texto das variantes já carregadas
+
+    def optgroups(self, name, value, attrs=None):
+        options = [self.create_option(name, '', '---------', not any(value), 0)]
+        for index, selected in enumerate(v for v in value if v):
+            options.append(self.create_option(
+                name, selected, self.labels.get(str(selected), selected), True, index + 1,
+            ))
+        return [(None, options, 0)]
+
+
+class VariantChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField que usa as variantes pré-carregadas pelo formset."""
+
+    widget = LazyVariantSelect
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preloaded = {}
+
+    def to_python(self, value):
+        if value not in self.empty_values and str(value) in self.preloaded:
+            return self.preloaded[str(value)]
+        return super().to_python(value)
+
+
 class OrderItemForm(forms.ModelForm):
     class Meta:
         model = OrderItem
         fields = ['variant', 'quantity', 'price', 'discount', 'addition']
+        field_classes = {'variant': VariantChoiceField}
 
         widgets = {
-            'variant': forms.Select(attrs={'class': 'form-control'}),
+            'variant': LazyVariantSelect(),
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
             'price': forms.NumberInput(attrs={'class': 'form-control'}),
             'discount': forms.NumberInput(attrs={'class': 'form-control'}),
@@ -441,6 +480,7 @@ class OrderItemForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         business = kwargs.pop('business', None)
+        variants = kwargs.pop('variants', None) or {}
         super().__init__(*args, **kwargs)
 
         if business:
@@ -448,11 +488,63 @@ class OrderItemForm(forms.ModelForm):
                 product__business=business
             ).select_related('product', 'size', 'color')
 
+        field = self.fields['variant']
+        field.preloaded     = variants
+        field.widget.labels = {vid: str(variant) for vid, variant in variants.items()}
+
+    def _get_validation_exclusions(self):
+        # Variante já conferida pelo campo (pré-carregada na empresa):
+        # evita o SELECT de existência da FK por item em full_clean()
+        exclude = super()._get_validation_exclusions()
+        variant = self.cleaned_data.get('variant')
+        if variant is not None and str(variant.pk) in self.fields['variant'].preloaded:
+            exclude.add('variant')
+        return exclude
+
+
+class BaseOrderItemFormSet(forms.BaseInlineFormSet):
+    """
+    Passa a empresa aos formulários e carrega, numa consulta só, as
+    variantes selecionadas (itens gravados + enviadas no POST).
+    """
+
+    def __init__(self, *args, business=None, **kwargs):
+        self.business = business
+        super().__init__(*args, **kwargs)
+
+    def _selected_variant_ids(self):
+        ids = set()
+        if self.is_bound:
+            for key, value in self.data.items():
+                if key.startswith(f'{self.prefix}-') and key.endswith('-variant') and str(value).isdigit():
+                    ids.add(int(value))
+        else:
+            ids.update(item.variant_id for item in self.get_queryset() if item.variant_id)
+        return ids
+
+    @cached_property
+    def selected_variants(self):
+        ids = self._selected_variant_ids()
+        if not ids:
+            return {}
+
+        qs = ProductVariant.objects.filter(id__in=ids).select_related('product', 'size', 'color')
+        if self.business:
+            qs = qs.filter(product__business=self.business)
+        return {str(v.id): v for v in qs}
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['business'] = self.business
+        kwargs['variants'] = self.selected_variants
+        return kwargs
+
 
 OrderItemFormSet = inlineformset_factory(
     Orders,
     OrderItem,
     form=OrderItemForm,
+    formset=BaseOrderItemFormSet,
     extra=0,
     can_delete=True
 )
@@ -708,12 +800,36 @@ class BusinessForm(forms.ModelForm):
         label='Validade do Certificado'
     )
 
+    # 🔹 Numeração vem de FiscalNumberSequence: a tela mostra o próximo
+    # número (somente leitura) e só aceita salto explícito para frente
+    nfe_jump_to = forms.IntegerField(
+        min_value=1,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Pular NF-e para o nº'
+    )
+
+    nfce_jump_to = forms.IntegerField(
+        min_value=1,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Pular NFC-e para o nº'
+    )
+
+    JUMPS = (
+        # campo do salto, modelo, campo da série, campo do último número em Business
+        ('nfe_jump_to', '55', 'nfe_series', 'nfe_last_number'),
+        ('nfce_jump_to', '65', 'nfce_series', 'nfce_last_number'),
+    )
+
     class Meta:
         model = Business
         exclude = (
             'uid',
             'created_at',
             'country_code',
+            'nfe_last_number',
+            'nfce_last_number',
         )
 
         widgets = {
@@ -745,10 +861,6 @@ class BusinessForm(forms.ModelForm):
             'nfe_series': forms.TextInput(attrs={'class': 'form-control'}),
             'nfce_series': forms.TextInput(attrs={'class': 'form-control'}),
 
-            # ================= ÚLTIMOS NUMEROS =================
-            'nfe_last_number': forms.NumberInput(attrs={'class': 'form-control'}),
-            'nfce_last_number': forms.NumberInput(attrs={'class': 'form-control'}),
-
             # ================= CERTIFICADO =================
             'certificate_file': forms.ClearableFileInput(attrs={'class': 'form-control'}),
 
@@ -775,13 +887,48 @@ class BusinessForm(forms.ModelForm):
             'nfce_csc_id': 'ID CSC',
             'nfe_series': 'Série NF-e',
             'nfce_series': 'Série NFC-e',
-            'nfe_last_number': 'Último número NF-e',
-            'nfce_last_number': 'Último número NFC-e',
             'nfe_environment': 'Ambiente',
             'certificate_file': 'Certificado A1',
             'active': 'Empresa Ativa',
         }
 
+    def next_number(self, modelo, serie=None):
+        """Próximo número da série (sequência ou Business, o que estiver à frente)."""
+        if serie is None:
+            serie = self.instance.nfe_series if modelo == '55' else self.instance.nfce_series
+        return peek_next_number(self.instance, modelo, serie or '1')
+
+    @property
+    def nfe_next_number(self):
+        return self.next_number('55')
+
+    @property
+    def nfce_next_number(self):
+        return self.next_number('65')
+
+    def clean(self):
+        cleaned = super().clean()
+
+        for field, modelo, serie_field, _ in self.JUMPS:
+            jump = cleaned.get(field)
+            if not jump:
+                continue
+            proximo = self.next_number(modelo, cleaned.get(serie_field))
+            if jump < proximo:
+                self.add_error(field, f'A numeração só avança: o próximo número já é {proximo}.')
+
+        return cleaned
+
+    def save(self, commit=True):
+        # Salto vira o novo "último número" em Business; a sequência
+        # (services/fiscal_numbers._locked_sequence) adota na próxima NF
+        for field, _, _, last_field in self.JUMPS:
+            jump = self.cleaned_data.get(field)
+            if jump:
+                setattr(self.instance, last_field, max(getattr(self.instance, last_field), jump - 1))
+
+        return super().save(commit=commit)
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import User
@@ -0,0 +1,75 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from nfelib.nfe.bindings.v4_0.nfe_v4_00 import Tnfe
+from xsdata.formats.dataclass.context import XmlContext
+from xsdata.formats.dataclass.serializers import XmlSerializer
+
+from core.models import Business, Orders, Invoice, InvoiceItem
+from core.services.fiscal.xml_builder import build_nfe, get_serializer, warm_up
+
+
+def _ms(func, repeat):
+    """Mediana de `repeat` execuções, em milissegundos."""
+    times = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(times)
+
+
+class Command(BaseCommand):
+    help = 'Mede a serialização do XML da NF por quantidade de itens, com contexto frio e aquecido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50, 500], help='Itens por NF')
+        parser.add_argument('--repeat', type=int, default=5, help='Repetições por medida (mediana)')
+
+    def _nfe(self, business, size):
+        """NF de teste com `size` itens → árvore Tnfe (nada é serializado aqui)."""
+        invoice = Invoice.objects.create(
+            order=Orders.objects.create(business=business, document_model='55'),
+            model='55', serie='1', number=size, code_nf='12345678',
+            nature_operation='VENDA DE MERCADORIA', issue_date=timezone.now(),
+            emit_name='EMPRESA BENCHMARK', emit_cnpj='00000000000191', emit_tax_regime='1',
+            emit_street='RUA A', emit_number='1', emit_district='CENTRO', emit_city='SAO PAULO',
+            emit_city_code='3550308', emit_state='SP', emit_zip_code='01000000',
+            dest_name='CONSUMIDOR',
+        )
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(
+                invoice=invoice, item_number=n, product_code=f'SKU{n}', description=f'PRODUTO {n}',
+                ncm='61091000', cfop='5102', unit='UN', quantity=Decimal('1'),
+                unit_price=Decimal('10'), gross_total=Decimal('10'),
+            )
+            for n in range(1, size + 1)
+        ], batch_size=500)
+
+        return build_nfe(invoice)
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+
+        # Dados de teste só existem dentro da transação
+        with transaction.atomic():
+            business = Business.objects.create(name='Benchmark XML', document='00000000000191')
+            trees    = {size: self._nfe(business, size) for size in options['sizes']}
+            transaction.set_rollback(True)
+
+        context_ms = _ms(lambda: XmlContext().build_recursive(Tnfe), repeat)
+        warm_up()
+        serializer = get_serializer()
+
+        self.stdout.write(f'Montar XmlContext da árvore Tnfe: {context_ms:.1f} ms')
+        self.stdout.write(f'{"itens":>6}  {"frio (ms)":>10}  {"aquecido (ms)":>14}  {"ganho":>6}')
+
+        for size, tree in trees.items():
+            # Frio: contexto novo a cada NF (como era antes do cache por processo)
+            cold = _ms(lambda: XmlSerializer(context=XmlContext()).render(tree), repeat)
+            warm = _ms(lambda: serializer.render(tree), repeat)
+            self.stdout.write(f'{size:>6}  {cold:>10.2f}  {warm:>14.2f}  {cold / warm:>5.1f}x')
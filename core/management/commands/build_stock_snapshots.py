@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Business
+from core.services.stock_snapshot import build_stock_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Fecha os snapshots diários de estoque (incremental, desde o último dia fechado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help='Limita a uma empresa (id)')
+        parser.add_argument('--until', help='Último dia a fechar (AAAA-MM-DD). Padrão: ontem')
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            try:
+                until = date.fromisoformat(options['until'])
+            except ValueError:
+                raise CommandError('Data inválida em --until (use AAAA-MM-DD).')
+
+        businesses = Business.objects.order_by('id')
+        if options['business']:
+            businesses = businesses.filter(id=options['business'])
+
+        total = 0
+
+        # 🔹 Uma empresa por vez: cada uma tem seu próprio último dia fechado
+        for business in businesses:
+            created = build_stock_snapshots(business=business, until=until)
+            total += created
+            if created:
+                self.stdout.write(f'{business}: {created} snapshots')
+
+        self.stdout.write(self.style.SUCCESS(f'{total} snapshots gravados.'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Orders
+from core.services.emissao_lote import emitir_lote, pending_orders
+
+
+class Command(BaseCommand):
+    help = 'Gera, assina e transmite as NFs de pedidos faturados num pool de processos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('orders', nargs='*', type=int, help='Ids dos pedidos (padrão: todos os pendentes)')
+        parser.add_argument('--business', type=int, help='Limita a uma empresa (id)')
+        parser.add_argument('--since', help='Só pedidos alterados a partir desta data (AAAA-MM-DD)')
+        parser.add_argument('--limit', type=int, help='Máximo de pedidos no lote')
+        parser.add_argument('--processes', type=int, help='Processos no pool (padrão NF_BATCH_PROCESSES; 1 = sem pool)')
+
+    def handle(self, *args, **options):
+        queryset = Orders.objects.all()
+        if options['orders']:
+            queryset = queryset.filter(id__in=options['orders'])
+        if options['business']:
+            queryset = queryset.filter(business_id=options['business'])
+        if options['since']:
+            queryset = queryset.filter(updated_at__date__gte=options['since'])
+
+        ids = list(pending_orders(queryset).order_by('id').values_list('id', flat=True)[:options['limit']])
+        if not ids:
+            raise CommandError('Nenhum pedido faturado pendente de NF.')
+
+        self.stdout.write(f'Emitindo {len(ids)} NF(s)...')
+
+        def progress(result):
+            line = f'Pedido #{result["order"]} · NF {result["invoice"] or "-"}: {result["message"]}'
+            self.stdout.write(self.style.SUCCESS(line) if result['ok'] else self.style.ERROR(line))
+
+        lote = emitir_lote(ids, processes=options['processes'], on_result=progress)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{lote["authorized"]}/{len(lote["results"])} autorizada(s) em {lote["seconds"]:.1f}s '
+            f'({lote["per_minute"]:.0f} NF/min).'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from core.services.fiscal_numbers import find_unused_numbers, inutilizar_pendentes
+
+
+class Command(BaseCommand):
+    help = 'Registra e envia à SEFAZ a inutilização de números de NF reservados e não usados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Máximo de inutilizações enviadas')
+        parser.add_argument('--dry-run', action='store_true', help='Só registra, não envia à SEFAZ')
+
+    def handle(self, *args, **options):
+        for void in find_unused_numbers():
+            self.stdout.write(
+                f'Empresa {void.business_id} · modelo {void.model} · série {void.serie}: '
+                f'{void.start} a {void.end}'
+            )
+
+        if options['dry_run']:
+            return
+
+        ok, erro = inutilizar_pendentes(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Inutilizações homologadas: {ok} · com erro: {erro}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.services.order_stats import rebuild_order_stats
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo de pedidos (OrderStats) a partir de Orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help='Limita a uma empresa (id)')
+
+    def handle(self, *args, **options):
+        rebuild_order_stats(options['business'])
+        self.stdout.write(self.style.SUCCESS('Resumo de pedidos reconstruído com sucesso.'))
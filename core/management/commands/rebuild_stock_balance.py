@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import ProductVariant, StockBalance
+from core.services.order_stock import ledger_stock_totals
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói (ou confere, com --verify) o saldo materializado a partir do ledger StockEntry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Só confere, não grava')
+        parser.add_argument('--business', type=int, help='Limita a uma empresa (id)')
+
+    def handle(self, *args, **options):
+        variants = ProductVariant.objects.all()
+        if options['business']:
+            variants = variants.filter(product__business_id=options['business'])
+
+        variant_ids = list(variants.values_list('id', flat=True))
+
+        # 🔹 Uma consulta agrupada no ledger + uma no saldo
+        ledger   = ledger_stock_totals(variant_ids)
+        balances = {b.variant_id: b for b in StockBalance.objects.filter(variant_id__in=variant_ids)}
+
+        divergent = []
+        for variant_id in variant_ids:
+            real, reserved = ledger.get(variant_id, (0, 0))
+            balance = balances.get(variant_id)
+
+            current = (balance.real, balance.reserved, balance.available) if balance else (0, 0, 0)
+            if current != (real, reserved, real - reserved):
+                divergent.append((variant_id, current, (real, reserved, real - reserved)))
+
+        if options['verify']:
+            for variant_id, current, expected in divergent:
+                self.stdout.write(f'Variante {variant_id}: saldo {current} ≠ ledger {expected}')
+
+            if divergent:
+                self.stdout.write(self.style.ERROR(f'{len(divergent)} variantes divergentes.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Saldo conferido: nenhuma divergência.'))
+            return
+
+        with transaction.atomic():
+            to_create = []
+            to_update = []
+
+            for variant_id, _, (real, reserved, available) in divergent:
+                balance = balances.get(variant_id)
+                if balance is None:
+                    to_create.append(StockBalance(
+                        variant_id=variant_id, real=real, reserved=reserved, available=available,
+                    ))
+                else:
+                    balance.real, balance.reserved, balance.available = real, reserved, available
+                    to_update.append(balance)
+
+            StockBalance.objects.bulk_create(to_create, batch_size=1000)
+            StockBalance.objects.bulk_update(to_update, ['real', 'reserved', 'available'], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(divergent)} saldos corrigidos.'))
@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, close_old_connections
+
+
+def _worker_loop(number, batch, sleep, once, stop):
+    """Um processo do pool: reserva lotes da fila e executa até mandarem parar."""
+    django.setup()
+    from core.services.jobs import claim_jobs, run_job
+    from core.services.fiscal_numbers import use_blocks, release_blocks
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # quem para é o processo pai
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{number}'
+    use_blocks(worker_id)  # NFC-e numerada por blocos (NFCE_NUMBER_BLOCK_SIZE)
+
+    while not stop.is_set():
+        close_old_connections()
+        ids = claim_jobs(worker_id, batch)
+
+        if not ids:
+            if once:
+                break
+            stop.wait(sleep)
+            continue
+
+        for job_id in ids:
+            run_job(job_id)
+
+    # Sobra dos blocos de numeração → inutilização (manage.py inutilizar_numeros)
+    release_blocks()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Executa a fila de tarefas em segundo plano (Job) com um pool de processos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Processos no pool (padrão 2)')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs reservados por vez (padrão 10)')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Espera com a fila vazia, em segundos')
+        parser.add_argument('--once', action='store_true', help='Esvazia a fila e sai')
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        stop      = multiprocessing.Event()
+
+        # Conexões não podem ser herdadas pelos filhos
+        connections.close_all()
+
+        pool = [
+            multiprocessing.Process(
+                target=_worker_loop,
+                args=(n, max(options['batch'], 1), options['sleep'], options['once'], stop),
+                daemon=True,
+            )
+            for n in range(processes)
+        ]
+        for process in pool:
+            process.start()
+
+        self.stdout.write(f'{processes} worker(s) iniciados.')
+
+        def shutdown(*_):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+
+        try:
+            while any(p.is_alive() for p in pool):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write('Parando workers (terminando os jobs em andamento)...')
+
+        for process in pool:
+            process.join()
+
+        self.stdout.write(self.style.SUCCESS('Workers finalizados.'))
@@ -0,0 +1,119 @@
+import itertools
+import re
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+_WS = 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeAutorizacao4'
+
+_WSDL = """<?xml version="1.0" encoding="utf-8"?>
+<wsdl:definitions xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap12="http://schemas.xmlsoap.org/wsdl/soap12/"
+    xmlns:s="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="{ws}" targetNamespace="{ws}">
+  <wsdl:types>
+    <s:schema elementFormDefault="qualified" targetNamespace="{ws}">
+      <s:element name="nfeAutorizacaoLote">
+        <s:complexType><s:sequence><s:element name="nfeDadosMsg" type="s:anyType"/></s:sequence></s:complexType>
+      </s:element>
+      <s:element name="nfeResultMsg"><s:complexType mixed="true"><s:sequence><s:any/></s:sequence></s:complexType></s:element>
+    </s:schema>
+  </wsdl:types>
+  <wsdl:message name="nfeAutorizacaoLoteSoapIn"><wsdl:part name="parameters" element="tns:nfeAutorizacaoLote"/></wsdl:message>
+  <wsdl:message name="nfeAutorizacaoLoteSoapOut"><wsdl:part name="nfeAutorizacaoLoteResult" element="tns:nfeResultMsg"/></wsdl:message>
+  <wsdl:portType name="NFeAutorizacao4Soap">
+    <wsdl:operation name="nfeAutorizacaoLote">
+      <wsdl:input message="tns:nfeAutorizacaoLoteSoapIn"/>
+      <wsdl:output message="tns:nfeAutorizacaoLoteSoapOut"/>
+    </wsdl:operation>
+  </wsdl:portType>
+  <wsdl:binding name="NFeAutorizacao4Soap12" type="tns:NFeAutorizacao4Soap">
+    <soap12:binding transport="http://schemas.xmlsoap.org/soap/http"/>
+    <wsdl:operation name="nfeAutorizacaoLote">
+      <soap12:operation soapAction="{ws}/nfeAutorizacaoLote" style="document"/>
+      <wsdl:input><soap12:body use="literal"/></wsdl:input>
+      <wsdl:output><soap12:body use="literal"/></wsdl:output>
+    </wsdl:operation>
+  </wsdl:binding>
+  <wsdl:service name="NFeAutorizacao4">
+    <wsdl:port name="NFeAutorizacao4Soap12" binding="tns:NFeAutorizacao4Soap12">
+      <soap12:address location="{url}"/>
+    </wsdl:port>
+  </wsdl:service>
+</wsdl:definitions>"""
+
+# Retorno síncrono: lote processado (104) + protocolo da nota
+_RESPOSTA = """<?xml version="1.0" encoding="utf-8"?>
+<soap12:Envelope xmlns:soap12="http://www.w3.org/2003/05/soap-envelope"><soap12:Body>
+<nfeResultMsg xmlns="{ws}">
+<retEnviNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">
+<tpAmb>2</tpAmb><verAplic>LOCAL</verAplic><cStat>104</cStat><xMotivo>Lote processado</xMotivo>
+<dhRecbto>{agora}</dhRecbto>
+<protNFe versao="4.00"><infProt>
+<tpAmb>2</tpAmb><verAplic>LOCAL</verAplic><chNFe>{chave}</chNFe><dhRecbto>{agora}</dhRecbto>
+<nProt>{protocolo}</nProt><digVal></digVal><cStat>{cstat}</cStat><xMotivo>{motivo}</xMotivo>
+</infProt></protNFe>
+</retEnviNFe>
+</nfeResultMsg>
+</soap12:Body></soap12:Envelope>"""
+
+_MOTIVOS = {
+    '100': 'Autorizado o uso da NF-e',
+    '204': 'Rejeicao: Duplicidade de NF-e',
+}
+
+
+class Command(BaseCommand):
+    help = 'Servidor local no lugar da SEFAZ (NFeAutorizacao4) para testar emissão sem rede'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency', type=float, default=0.3, help='Espera por requisição, em segundos')
+        parser.add_argument('--cstat', default='100', help='cStat devolvido para cada nota (padrão 100)')
+
+    def handle(self, *args, **options):
+        url       = f'http://127.0.0.1:{options["port"]}'
+        latency   = options['latency']
+        cstat     = options['cstat']
+        protocols = itertools.count(135000000000001)
+        stdout    = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, body, content_type):
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send(_WSDL.format(ws=_WS, url=url + self.path.split('?')[0]), 'text/xml; charset=utf-8')
+
+            def do_POST(self):
+                request = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+                time.sleep(latency)
+
+                chave = re.search(r'Id="NFe(\d{44})"', request)
+                chave = chave.group(1) if chave else ''
+                self._send(_RESPOSTA.format(
+                    ws=_WS, chave=chave, protocolo=next(protocols), cstat=cstat,
+                    motivo=_MOTIVOS.get(cstat, 'Rejeicao simulada'),
+                    agora=datetime.now().astimezone().isoformat(timespec='seconds'),
+                ), 'application/soap+xml; charset=utf-8')
+                stdout.write(f'{cstat} {chave}')
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(f'SEFAZ local em {url} (use SEFAZ_URL_OVERRIDE={url})')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
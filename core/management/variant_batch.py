@@ -0,0 +1,103 @@
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import ProductVariant
+from core.services.ean import allocate_ean13
+
+
+class VariantBatchCommand(ABC, BaseCommand):
+    """
+    Base dos comandos que regravam SKU/EAN13 das variantes em lote.
+
+    Lê em streaming (.iterator) por ordem de id, grava um bulk_update por
+    lote numa transação curta e mostra o último id concluído, para
+    retomar com --resume-from-id se a execução for interrompida.
+
+    Subclasses implementam build_sku(variant) (abstrato: sem ele a classe
+    nem instancia) e, se precisarem, restringem get_queryset().
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Variantes por lote (padrão 1000)')
+        parser.add_argument('--business', type=int, help='Limita a uma empresa (id)')
+        parser.add_argument('--resume-from-id', type=int, default=0, help='Começa a partir deste id de variante')
+        parser.add_argument('--dry-run', action='store_true', help='Só conta o que mudaria, não grava')
+
+    def get_queryset(self):
+        return ProductVariant.objects.all()
+
+    @abstractmethod
+    def build_sku(self, variant):
+        """SKU que a variante deve ter."""
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        dry_run    = options['dry_run']
+
+        qs = self.get_queryset().select_related('product')
+        if options['business']:
+            qs = qs.filter(product__business_id=options['business'])
+        if options['resume_from_id']:
+            qs = qs.filter(id__gte=options['resume_from_id'])
+
+        processed = changed = 0
+        started   = time.monotonic()
+        batch     = []
+
+        for variant in qs.order_by('id').iterator(chunk_size=batch_size):
+            batch.append(variant)
+            if len(batch) >= batch_size:
+                changed   += self._process_batch(batch, dry_run)
+                processed += len(batch)
+                self._progress(processed, changed, batch[-1].id, started)
+                batch = []
+
+        if batch:
+            changed   += self._process_batch(batch, dry_run)
+            processed += len(batch)
+            self._progress(processed, changed, batch[-1].id, started)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'[dry-run] {changed} de {processed} variantes seriam alteradas.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{changed} de {processed} variantes atualizadas com sucesso.'
+            ))
+
+    def _process_batch(self, batch, dry_run):
+        """Calcula SKU/EAN do lote e grava só as linhas que mudaram."""
+        to_update   = []
+        missing_ean = defaultdict(list)
+
+        for variant in batch:
+            sku = self.build_sku(variant)
+            if not variant.ean13:
+                missing_ean[variant.product.business_id].append(variant)
+            if sku != variant.sku or not variant.ean13:
+                variant.sku = sku
+                to_update.append(variant)
+
+        if dry_run or not to_update:
+            return len(to_update)
+
+        with transaction.atomic():
+            # 🔹 EAN13 em bloco por empresa (contador, sem sorteio/retentativa)
+            for business_id, variants in missing_ean.items():
+                for variant, ean in zip(variants, allocate_ean13(business_id, len(variants))):
+                    variant.ean13 = ean
+
+            ProductVariant.objects.bulk_update(to_update, ['sku', 'ean13'])
+
+        return len(to_update)
+
+    def _progress(self, processed, changed, last_id, started):
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.stdout.write(
+            f'{processed} variantes lidas ({changed} alteradas) | '
+            f'último id {last_id} | {processed / elapsed:.0f} variantes/s'
+        )
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def backfill_stock_balance(apps, schema_editor):
+    StockEntry   = apps.get_model('core', 'StockEntry')
+    StockBalance = apps.get_model('core', 'StockBalance')
+
+    rows = StockEntry.objects.values('variant_id').annotate(
+        total_in=Sum('quantity', filter=Q(entry_type='in'), default=0),
+        total_out=Sum('quantity', filter=Q(entry_type='out'), default=0),
+        total_reserve=Sum('quantity', filter=Q(movement_type='RESERVE'), default=0),
+        total_release=Sum('quantity', filter=Q(movement_type='RELEASE'), default=0),
+    ).order_by()
+
+    balances = []
+    for r in rows:
+        real     = r['total_in'] - r['total_out']
+        reserved = r['total_reserve'] - r['total_release']
+        balances.append(StockBalance(
+            variant_id=r['variant_id'], real=real, reserved=reserved, available=real - reserved,
+        ))
+
+    StockBalance.objects.bulk_create(balances, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_plan_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('real', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_balance', to='core.productvariant')),
+            ],
+        ),
+        migrations.RunPython(backfill_stock_balance, migrations.RunPython.noop),
+    ]
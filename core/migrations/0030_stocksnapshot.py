@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_stockbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('real', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='core.productvariant')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('variant', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockentry',
+            index=models.Index(fields=['variant', 'timestamp', 'id'], name='core_stocke_variant_3540d9_idx'),
+        ),
+    ]
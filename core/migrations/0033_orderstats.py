@@ -0,0 +1,52 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_order_stats(apps, schema_editor):
+    Orders     = apps.get_model('core', 'Orders')
+    OrderStats = apps.get_model('core', 'OrderStats')
+
+    rows = (
+        Orders.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('business_id', 'day', 'status')
+        .annotate(count=Count('id'), total=Sum('total_amount'))
+        .order_by()
+    )
+
+    OrderStats.objects.bulk_create([
+        OrderStats(
+            business_id=r['business_id'], date=r['day'], status=r['status'],
+            count=r['count'], total_amount=r['total'] or 0,
+        )
+        for r in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_eansequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('DIGITACAO', 'Em Digitação'), ('ORCAMENTO', 'Orçamento'), ('EM_SEPARACAO', 'Em Separação'), ('SEPARADO', 'Separado'), ('FATURADO', 'Faturado'), ('CANCELADO', 'Cancelado')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_stats', to='core.business')),
+            ],
+            options={
+                'unique_together': {('business', 'date', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_order_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_orderstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['business', 'created_at'], name='core_orders_busines_fdf2c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['business', 'status', 'created_at'], name='core_orders_busines_e1f4b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['business', 'client', 'created_at'], name='core_orders_busines_d95f6b_idx'),
+        ),
+    ]
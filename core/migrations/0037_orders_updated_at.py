@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:35
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    Orders = apps.get_model('core', 'Orders')
+    Orders.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orders',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['business', 'updated_at'], name='core_orders_busines_abeddc_idx'),
+        ),
+    ]
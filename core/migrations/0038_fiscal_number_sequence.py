@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_orders_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FiscalNumberVoid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('55', 'NF-e (55)'), ('65', 'NFC-e (65)')], max_length=2)),
+                ('serie', models.CharField(max_length=3)),
+                ('start', models.PositiveIntegerField()),
+                ('end', models.PositiveIntegerField()),
+                ('justification', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendente'), ('DONE', 'Homologada'), ('ERROR', 'Erro')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('protocol', models.CharField(blank=True, max_length=60)),
+                ('return_code', models.CharField(blank=True, max_length=10)),
+                ('return_message', models.TextField(blank=True)),
+                ('xml_return', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fiscal_number_voids', to='core.business')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FiscalNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('55', 'NF-e (55)'), ('65', 'NFC-e (65)')], max_length=2)),
+                ('serie', models.CharField(max_length=3)),
+                ('start', models.PositiveIntegerField()),
+                ('end', models.PositiveIntegerField()),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(choices=[('OPEN', 'Em uso'), ('CLOSED', 'Fechado'), ('CHECKED', 'Conferido')], default='OPEN', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fiscal_number_blocks', to='core.business')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_fiscal_status_713f18_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FiscalNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('55', 'NF-e (55)'), ('65', 'NFC-e (65)')], max_length=2)),
+                ('serie', models.CharField(max_length=3)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('checked_through', models.PositiveIntegerField(default=0)),
+                ('scan_through', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fiscal_sequences', to='core.business')),
+            ],
+            options={
+                'unique_together': {('business', 'model', 'serie')},
+            },
+        ),
+    ]
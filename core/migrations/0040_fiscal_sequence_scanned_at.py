@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_fiscal_index_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fiscalnumbersequence',
+            name='scanned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,8 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from datetime import timedelta
 from django.utils import timezone
 
@@ -422,17 +423,37 @@ class Product(models.Model):
         default='0'
     )
 
+    def _get_stock_levels(self):
+        """
+        Totais de estoque do produto, calculados uma vez por instância.
+        Com variants (+ stock_balance) pré-carregados soma em memória;
+        senão, uma única consulta agregada.
+        """
+        if not hasattr(self, '_stock_levels'):
+            if 'variants' in getattr(self, '_prefetched_objects_cache', {}):
+                variants = self.variants.all()
+                self._stock_levels = {
+                    'real':      sum(v.stock_real for v in variants),
+                    'reserved':  sum(v.stock_reserved for v in variants),
+                    'available': sum(v.stock_available for v in variants),
+                }
+            else:
+                from core.services.order_stock import sum_stock_levels
+                self._stock_levels = sum_stock_levels(self.variants.all())
+
+        return self._stock_levels
+
     @property
     def stock_real(self):
-        return sum(v.stock_real for v in self.variants.all())
+        return self._get_stock_levels()['real']
 
     @property
     def stock_reserved(self):
-        return sum(v.stock_reserved for v in self.variants.all())
+        return self._get_stock_levels()['reserved']
 
     @property
     def stock_available(self):
-        return sum(v.stock_available for v in self.variants.all())
+        return self._get_stock_levels()['available']
 
 
 class ProductVariant(models.Model):
@@ -449,34 +470,31 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.size} - {self.color}"
 
+    def _get_stock_balance(self):
+        """
+        Saldo materializado (StockBalance). Variante sem nenhuma
+        movimentação ainda não tem linha → saldo zero.
+        """
+        try:
+            return self.stock_balance
+        except StockBalance.DoesNotExist:
+            return None
+
     # 🔥 ESTOQUE REAL POR VARIANTE
     @property
     def stock_real(self):
-        entrada = self.stock_entries.filter(entry_type='in').aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-
-        saida = self.stock_entries.filter(entry_type='out').aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-
-        return entrada - saida
+        balance = self._get_stock_balance()
+        return balance.real if balance else 0
 
     @property
     def stock_reserved(self):
-        reservado = self.stock_entries.filter(
-            movement_type='RESERVE'
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-
-        liberado = self.stock_entries.filter(
-            movement_type='RELEASE'
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-
-        return reservado - liberado
+        balance = self._get_stock_balance()
+        return balance.reserved if balance else 0
 
     @property
     def stock_available(self):
-        return self.stock_real - self.stock_reserved
+        balance = self._get_stock_balance()
+        return balance.available if balance else 0
 
 
 class ProductImage(models.Model):
@@ -519,6 +537,12 @@ class StockEntry(models.Model):
     quantity = models.IntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Histórico por variante com paginação por cursor (timestamp, id)
+            models.Index(fields=['variant', 'timestamp', 'id']),
+        ]
+
     def __str__(self):
         return (
             f"{self.get_movement_type_display()} | "
@@ -526,6 +550,46 @@ class StockEntry(models.Model):
             f"{self.entry_type} {self.quantity}"
         )
 
+
+class StockBalance(models.Model):
+    """
+    Saldo materializado por variante (real, reservado e disponível).
+
+    Atualizado na mesma transação de toda inserção/remoção de StockEntry
+    via services.order_stock.apply_stock_balance.
+    Reconstrução/conferência: manage.py rebuild_stock_balance
+    """
+    variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name='stock_balance')
+    real = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.variant_id} | real {self.real} | reservado {self.reserved}"
+
+
+class StockSnapshot(models.Model):
+    """
+    Saldo de fechamento por variante por dia (checkpoint do ledger).
+    Só existe linha nos dias em que a variante teve movimentação.
+
+    Estoque em D = último snapshot <= D + movimentações depois dele.
+    Gerado por: manage.py build_stock_snapshots
+    """
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='stock_snapshots')
+    date = models.DateField()
+    real = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('variant', 'date')
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.variant_id} | {self.date} | real {self.real}"
+
 from decimal import Decimal
 
 class Orders(models.Model):
@@ -571,6 +635,7 @@ class Orders(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_DIGITACAO)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # 🔥 CONFIG NOTA
     document_model = models.CharField(
@@ -629,6 +694,16 @@ class Orders(models.Model):
     nfe_number = models.PositiveIntegerField(blank=True, null=True)
     nfe_series = models.CharField(max_length=3, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Listagem de pedidos: filtros + cursor (created_at, id)
+            models.Index(fields=['business', 'created_at']),
+            models.Index(fields=['business', 'status', 'created_at']),
+            models.Index(fields=['business', 'client', 'created_at']),
+            # API: ?updated_since= e ETag da listagem
+            models.Index(fields=['business', 'updated_at']),
+        ]
+
     def can_change_status_to(self, new_status):
         return new_status in self.STATUS_TRANSITIONS.get(self.status, [])
 
@@ -652,69 +727,171 @@ class Orders(models.Model):
         Usa as datas de OrderPaymentParcel (editadas pelo usuário no pedido).
         Idempotente: não duplica se já existir.
         """
-        if self.financial_movements.exists():
+        from core.services.order_financial import generate_financial_bulk
+        generate_financial_bulk([self])
+
+    # 🔹 ESTADO CARREGADO DO BANCO (para detectar mudanças sem novo SELECT)
+    TRACKED_FIELDS = ('status', 'total_amount')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = {
+            name: value
+            for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def _get_loaded_state(self):
+        return getattr(self, '_loaded_state', {})
+
+    def _remember_state(self, fields):
+        state = self._get_loaded_state().copy()
+        for name in fields:
+            state[name] = getattr(self, name)
+        self._loaded_state = state
+
+    def _get_old_state(self):
+        """Status/total antes deste save (None se é inclusão)."""
+        if self._state.adding:
+            return None
+
+        loaded = self._get_loaded_state()
+        if all(name in loaded for name in self.TRACKED_FIELDS):
+            return loaded
+
+        # Instância montada à mão / campo adiado: único caso que ainda lê o banco
+        return (
+            Orders.objects.filter(pk=self.pk)
+            .values(*self.TRACKED_FIELDS)
+            .first()
+        )
+
+    # 🔥 HOOK AUTOMÁTICO AO FATURAR
+    def save(self, *args, **kwargs):
+        from core.services.order_stats import track_order_change
+        from core.services.faturamento import enqueue_faturamento
+
+        # update_fields=[] é no-op no Django: nada a gravar nem a registrar
+        if kwargs.get('update_fields') is not None and not kwargs['update_fields']:
             return
 
-        for payment in self.payments.prefetch_related('parcels_records').all():
-
-            movement = FinancialMovement.objects.create(
-                business=self.business,
-                client=self.client,
-                order=self,
-                bank=payment.bank,
-                payment_method=payment.payment_method,
-                type='in',
-                total_value=payment.total_value,
-                description=f'Pedido #{self.id}',
+        old_state  = self._get_old_state()
+        old_status = old_state['status'] if old_state else None
+
+        # auto_now só entra no UPDATE se estiver em update_fields
+        if kwargs.get('update_fields'):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            update_fields = kwargs.get('update_fields')
+            self._remember_state(
+                [f for f in self.TRACKED_FIELDS if update_fields is None or f in update_fields]
             )
 
-            parcels = payment.parcels_records.all()
-
-            if parcels.exists():
-                # Usa as parcelas reais (com datas que o usuário definiu)
-                for p in parcels:
-                    FinancialMovementParcel.objects.create(
-                        movement=movement,
-                        parcel=p.parcel_number,
-                        value=p.value,
-                        deadline=p.due_date,
-                    )
-            else:
-                # Fallback: gera parcelas na hora se por algum motivo não existirem
-                from decimal import Decimal
-                from datetime import timedelta
-                from django.utils import timezone
-
-                total    = Decimal(payment.total_value)
-                n        = payment.parcels or 1
-                base     = (total / n).quantize(Decimal('0.01'))
-                acum     = Decimal('0.00')
-                today    = timezone.now().date()
-
-                for i in range(n):
-                    is_last = (i == n - 1)
-                    value   = (total - acum) if is_last else base
-                    if not is_last:
-                        acum += base
-                    due = today + timedelta(days=(i + 1) * (payment.interval_days or 30))
-                    FinancialMovementParcel.objects.create(
-                        movement=movement,
-                        parcel=i + 1,
-                        value=value,
-                        deadline=due,
-                    )
+            # 🔹 Estatísticas por dia/status na mesma transação
+            new_state = {
+                name: (
+                    getattr(self, name)
+                    if update_fields is None or name in update_fields or old_state is None
+                    else old_state[name]
+                )
+                for name in self.TRACKED_FIELDS
+            }
+            track_order_change(self, old_state, new_state)
 
-    # 🔥 HOOK AUTOMÁTICO AO FATURAR
-    def save(self, *args, **kwargs):
-        old_status = None
+            # 🔹 Estoque → financeiro → NF em segundo plano (fila, após o commit)
+            if old_status != self.STATUS_FATURADO and new_state['status'] == self.STATUS_FATURADO:
+                enqueue_faturamento(self)
+
+
+class OrderStats(models.Model):
+    """
+    Resumo de pedidos por empresa, dia (created_at) e status:
+    quantidade e soma de total_amount.
+
+    Mantido incrementalmente por services.order_stats (Orders.save e
+    exclusão); order_list e home leem daqui em vez de agregar o histórico.
+    """
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='order_stats')
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Orders.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('business', 'date', 'status')
+
+    def __str__(self):
+        return f"{self.business_id} | {self.date} | {self.status} | {self.count}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Resposta já dada a uma requisição da API com o header Idempotency-Key.
+    Reenvio com a mesma chave (e o mesmo corpo) devolve a resposta gravada
+    em vez de processar de novo.
+    """
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('business', 'key')
+
+    def __str__(self):
+        return f"{self.business_id} | {self.key}"
 
-        if self.pk:
-            old_status = Orders.objects.get(pk=self.pk).status
 
-        super().save(*args, **kwargs)
+class Job(models.Model):
+    """
+    Tarefa em segundo plano (fila no próprio banco, sem broker).
+
+    Gravada na mesma transação de quem enfileira: só fica visível aos
+    workers (manage.py run_workers) depois do commit, e some no rollback.
+    `chain` guarda os próximos passos: ao concluir, o worker enfileira o
+    seguinte com o mesmo payload (ex.: faturamento → financeiro → NF).
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Na fila'
+        RUNNING = 'RUNNING', 'Executando'
+        DONE    = 'DONE',    'Concluído'
+        FAILED  = 'FAILED',  'Falhou'
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    order = models.ForeignKey(Orders, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    chain = models.JSONField(default=list, blank=True)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.TextField(blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Fila: próximos pendentes por horário
+            models.Index(fields=['status', 'run_at']),
+        ]
 
-        if old_status != self.STATUS_FATURADO and self.status == self.STATUS_FATURADO:
-            self.generate_financial()
+    def __str__(self):
+        return f"#{self.pk} {self.task} ({self.status})"
 
 
 class OrderItem(models.Model):
@@ -846,6 +1023,17 @@ class FinancialMovementParcel(models.Model):
         return self.value - self.discount + self.addition
 
 
+def split_installments(total, parcels):
+    """
+    Divide `total` em `parcels` valores de 2 casas: todas com o valor base
+    (total / n arredondado) e a última absorve a diferença.
+    """
+    total = Decimal(total)
+    n     = parcels or 1
+    base  = (total / n).quantize(Decimal('0.01'))
+    return [base] * (n - 1) + [total - base * (n - 1)]
+
+
 class OrderPayment(models.Model):
     order = models.ForeignKey(
         Orders,
@@ -860,32 +1048,25 @@ class OrderPayment(models.Model):
     parcels = models.PositiveIntegerField(default=1)
     interval_days = models.PositiveIntegerField(default=30)
 
-    def generate_parcels(self):
-        if self.parcels_records.exists():
-            return
-
-        total = Decimal(self.total_value)
-        parcels = self.parcels
-
-        base_value = (total / parcels).quantize(Decimal('0.01'))
-        accumulated = Decimal('0.00')
-
-        for i in range(parcels):
-
-            if i == parcels - 1:
-                value = total - accumulated
-            else:
-                value = base_value
-                accumulated += base_value
-
-            due_date = timezone.now().date() + timedelta(days=i * self.interval_days)
-
-            OrderPaymentParcel.objects.create(
+    def build_parcels(self, today=None):
+        """Parcelas automáticas em memória (1ª vence hoje), sem gravar."""
+        today = today or timezone.now().date()
+        return [
+            OrderPaymentParcel(
                 payment=self,
                 parcel_number=i + 1,
                 value=value,
-                due_date=due_date
+                due_date=today + timedelta(days=i * self.interval_days),
             )
+            for i, value in enumerate(split_installments(self.total_value, self.parcels))
+        ]
+
+    def generate_parcels(self):
+        """Parcelas automáticas, num único INSERT."""
+        if self.parcels_records.exists():
+            return
+
+        OrderPaymentParcel.objects.bulk_create(self.build_parcels())
 
     # def save(self, *args, **kwargs):
     #     creating = self.pk is None
@@ -923,10 +1104,11 @@ def calcular_digito_ean13(ean_base):
 
 
 def generate_sku(variant):
-    business_id = variant.product.business.id
-    product_id = variant.product.id
-    size_id = variant.size.id if variant.size else 0
-    color_id = variant.color.id if variant.color else 0
+    # Só ids (sem buscar business/size/color no banco)
+    business_id = variant.product.business_id
+    product_id = variant.product_id
+    size_id = variant.size_id or 0
+    color_id = variant.color_id or 0
 
     return f"B{business_id}P{product_id}S{size_id}C{color_id}"
 
@@ -943,6 +1125,43 @@ def generate_ean13(variant):
     digito = calcular_digito_ean13(base)
     return base + str(digito)
 
+
+class EANSequence(models.Model):
+    """
+    Contador de EAN13 por empresa: prefixo GS1 + sequência.
+    Os códigos saem em blocos via services.ean.allocate_ean13.
+
+    Sem prefixo GS1 próprio, usa '2' + id da empresa (faixa 2xxxxx,
+    de circulação restrita/uso interno). Só vale para id até 99999: acima
+    disso o prefixo passaria a conter o de outra empresa, então esse
+    caso exige prefixo cadastrado.
+    """
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, related_name='ean_sequence')
+    prefix = models.CharField(max_length=11, help_text='Prefixo GS1 (empresa)')
+    next_value = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    DEFAULT_PREFIX_DIGITS = 5
+
+    @classmethod
+    def default_prefix(cls, business_id):
+        # '2' + 123456 começaria com '212345' (empresa 12345) → EAN repetido
+        if business_id >= 10 ** cls.DEFAULT_PREFIX_DIGITS:
+            raise ValidationError(
+                f'Empresa {business_id} sem prefixo EAN padrão: cadastre o '
+                f'prefixo GS1 da empresa (EANSequence) antes de gerar códigos.'
+            )
+        return '2' + str(business_id).zfill(cls.DEFAULT_PREFIX_DIGITS)
+
+    @property
+    def width(self):
+        """Dígitos disponíveis para a sequência (12 − prefixo)."""
+        return 12 - len(self.prefix)
+
+    def __str__(self):
+        return f"{self.business_id} | {self.prefix} | próximo {self.next_value}"
+
+
 class NCM(models.Model):
     category = models.TextField()
     code = models.CharField(max_length=8, unique=True)
@@ -1026,6 +1245,23 @@ class ICMSOriginDestination(models.Model):
         tipo = "Importado" if self.imported else "Nacional"
         return f"{self.origin_state} → {self.destination_state} ({tipo})"
 
+
+class FiscalIndexVersion(models.Model):
+    """
+    Versão do índice fiscal em memória (services/fiscal_index.py), no
+    banco para todos os processos enxergarem a mesma troca.
+
+    scope: 'global' (NCM / matriz ICMS) ou 'business:<id>'.
+    Sem linha = versão 0.
+    """
+    scope = models.CharField(max_length=40, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.scope} v{self.version}'
+
+
 class FiscalOperation(models.Model):
 
     business = models.ForeignKey(
@@ -1090,6 +1326,8 @@ Novos models:
   InvoiceTransport → dados de frete / transportadora
   InvoiceEvent     → cancelamento, carta de correção
   InvoiceLog       → log imutável de todas as transmissões
+  FiscalNumberSequence / FiscalNumberBlock / FiscalNumberVoid
+                   → numeração da NF, blocos por worker e inutilização
 """
 
 import uuid
@@ -1592,4 +1830,95 @@ class InvoiceLog(models.Model):
 
     def __str__(self):
         ts = self.created_at.strftime('%d/%m/%Y %H:%M') if self.created_at else '—'
-        return f'[{self.result}] {self.get_action_display()} – NF {self.invoice_id} – {ts}'
\ No newline at end of file
+        return f'[{self.result}] {self.get_action_display()} – NF {self.invoice_id} – {ts}'
+
+# ─────────────────────────────────────────────────────────────────────────────
+# NUMERAÇÃO DE NF — sequência, blocos por worker e inutilização
+# ─────────────────────────────────────────────────────────────────────────────
+
+class FiscalNumberSequence(models.Model):
+    """
+    Último número de NF entregue por empresa / modelo / série.
+
+    Incrementado por services.fiscal_numbers numa transação curta e
+    própria: a linha de Business não é mais travada ao gerar NF.
+    Business.nfe_last_number / nfce_last_number valem como ponto de
+    partida (ou salto manual para frente) da sequência.
+    """
+    business = models.ForeignKey('core.Business', on_delete=models.CASCADE, related_name='fiscal_sequences')
+    model = models.CharField(max_length=2, choices=InvoiceModel.choices)
+    serie = models.CharField(max_length=3)
+    last_number = models.PositiveIntegerField(default=0)
+
+    # Varredura de números sem NF (inutilização): já conferidos até
+    # checked_through; scan_through é o topo visto em scanned_at — só é
+    # conferido depois que essa marca passa de JOB_STALE_AFTER
+    checked_through = models.PositiveIntegerField(default=0)
+    scan_through = models.PositiveIntegerField(default=0)
+    scanned_at = models.DateTimeField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('business', 'model', 'serie')
+
+    def __str__(self):
+        return f'{self.business_id} | {self.model}/{self.serie} | último {self.last_number}'
+
+
+class FiscalNumberBlock(models.Model):
+    """
+    Faixa de números reservada de uma vez para um worker (NFC-e em volume).
+    O worker numera em memória; ao fechar o bloco, o que ficou sem NF vai
+    para inutilização.
+    """
+
+    class Status(models.TextChoices):
+        OPEN    = 'OPEN',    'Em uso'
+        CLOSED  = 'CLOSED',  'Fechado'
+        CHECKED = 'CHECKED', 'Conferido'
+
+    business = models.ForeignKey('core.Business', on_delete=models.CASCADE, related_name='fiscal_number_blocks')
+    model = models.CharField(max_length=2, choices=InvoiceModel.choices)
+    serie = models.CharField(max_length=3)
+    start = models.PositiveIntegerField()
+    end = models.PositiveIntegerField()
+    worker = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.model}/{self.serie} {self.start}–{self.end} ({self.status})'
+
+
+class FiscalNumberVoid(models.Model):
+    """Inutilização de uma faixa de números que ficou sem NF."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pendente'
+        DONE    = 'DONE',    'Homologada'
+        ERROR   = 'ERROR',   'Erro'
+
+    business = models.ForeignKey('core.Business', on_delete=models.CASCADE, related_name='fiscal_number_voids')
+    model = models.CharField(max_length=2, choices=InvoiceModel.choices)
+    serie = models.CharField(max_length=3)
+    start = models.PositiveIntegerField()
+    end = models.PositiveIntegerField()
+    justification = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    protocol = models.CharField(max_length=60, blank=True)
+    return_code = models.CharField(max_length=10, blank=True)
+    return_message = models.TextField(blank=True)
+    xml_return = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.model}/{self.serie} {self.start}–{self.end} ({self.status})'
@@ -1,5 +1,13 @@
+from decimal import Decimal
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import Client
+from .models import (
+    Client, Orders, OrderItem, OrderPayment, OrderPaymentParcel,
+    ProductVariant, PaymentMethod, BankAccount,
+)
+from .services.bulk import bulk_create_with_pks
+from .services.fiscal_rules import apply_fiscal_rules_bulk
 
 class ClientSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,3 +22,215 @@ class ClientSerializer(serializers.ModelSerializer):
             'created_at',
         ]
         read_only_fields = ('id', 'uid', 'created_at')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INGESTÃO DE PEDIDOS EM LOTE
+# ─────────────────────────────────────────────────────────────────────────────
+
+class IngestItemSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    ean13 = serializers.CharField(max_length=13, required=False, allow_blank=True)
+    quantity = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    discount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    addition = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+
+    def validate(self, attrs):
+        if not attrs.get('sku') and not attrs.get('ean13'):
+            raise serializers.ValidationError('Informe sku ou ean13.')
+        return attrs
+
+
+class IngestPaymentSerializer(serializers.Serializer):
+    payment_method = serializers.IntegerField(required=False, allow_null=True)
+    bank = serializers.IntegerField(required=False, allow_null=True)
+    total_value = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    parcels = serializers.IntegerField(min_value=1, default=1)
+    interval_days = serializers.IntegerField(min_value=0, default=30)
+
+
+class IngestOrderSerializer(serializers.Serializer):
+    external_id = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    client = serializers.IntegerField(required=False, allow_null=True)
+    client_document = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    status = serializers.ChoiceField(
+        choices=[Orders.STATUS_DIGITACAO, Orders.STATUS_ORCAMENTO],
+        default=Orders.STATUS_DIGITACAO,
+    )
+    document_model = serializers.ChoiceField(choices=['55', '65'], required=False, allow_null=True)
+    items = IngestItemSerializer(many=True, allow_empty=False)
+    payments = IngestPaymentSerializer(many=True, required=False, default=list)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PEDIDOS (API REST)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def requested_fields(request):
+    """?fields=id,status,items → {'id', 'status', 'items'} (None = todos)."""
+    raw = request.query_params.get('fields') if request else None
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class OrderPaymentParcelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderPaymentParcel
+        fields = ['id', 'parcel_number', 'value', 'due_date']
+        read_only_fields = fields
+
+
+class OrderPaymentSerializer(serializers.ModelSerializer):
+    # ids validados em lote por OrderSerializer (sem um SELECT por pagamento)
+    payment_method = serializers.IntegerField(source='payment_method_id', required=False, allow_null=True)
+    bank = serializers.IntegerField(source='bank_id', required=False, allow_null=True)
+    parcels_records = OrderPaymentParcelSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = OrderPayment
+        fields = ['id', 'payment_method', 'bank', 'total_value', 'parcels', 'interval_days', 'parcels_records']
+        read_only_fields = ('id',)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    variant = serializers.IntegerField(source='variant_id')
+    sku = serializers.CharField(source='variant.sku', read_only=True, default=None)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = [
+            'id', 'variant', 'sku', 'quantity', 'price', 'discount', 'addition', 'subtotal',
+            'cfop', 'ncm',
+            'icms_cst', 'icms_csosn', 'icms_rate', 'icms_base', 'icms_value',
+            'pis_cst', 'pis_rate', 'pis_value',
+            'cofins_cst', 'cofins_rate', 'cofins_value',
+        ]
+        read_only_fields = (
+            'id', 'cfop', 'ncm',
+            'icms_cst', 'icms_csosn', 'icms_rate', 'icms_base', 'icms_value',
+            'pis_cst', 'pis_rate', 'pis_value',
+            'cofins_cst', 'cofins_rate', 'cofins_value',
+        )
+        extra_kwargs = {'quantity': {'min_value': 1}}
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    """
+    Pedido com itens, pagamentos e parcelas aninhados.
+
+    Gravação: cabeçalho + listas completas de itens/pagamentos (substituem
+    as atuais), só enquanto o pedido é editável. Status muda pela ação
+    /status/ do OrderViewSet. Regras fiscais aplicadas em lote.
+    """
+    items = OrderItemSerializer(many=True, required=False)
+    payments = OrderPaymentSerializer(many=True, required=False)
+
+    class Meta:
+        model = Orders
+        fields = [
+            'id', 'uid', 'client', 'status', 'total_amount',
+            'document_model', 'nature_operation', 'cfop',
+            'freight_mode', 'finality', 'presence_indicator',
+            'access_key', 'protocol', 'nfe_number', 'nfe_series',
+            'created_at', 'updated_at',
+            'items', 'payments',
+        ]
+        read_only_fields = (
+            'id', 'uid', 'status', 'total_amount', 'nature_operation', 'cfop',
+            'access_key', 'protocol', 'nfe_number', 'nfe_series',
+            'created_at', 'updated_at',
+        )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+
+        # 🔹 Sparse fieldsets
+        fields = requested_fields(request)
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+        if request and 'client' in self.fields:
+            self.fields['client'].queryset = Client.objects.filter(business=request.user.business)
+
+    @property
+    def business(self):
+        return self.context['request'].user.business
+
+    def validate_items(self, items):
+        variants = ProductVariant.objects.filter(product__business=self.business).select_related('product').in_bulk(
+            {item['variant_id'] for item in items}
+        )
+        for item in items:
+            variant = variants.get(item.pop('variant_id'))
+            if variant is None:
+                raise serializers.ValidationError('Variante não encontrada.')
+            item['variant'] = variant
+        return items
+
+    def validate_payments(self, payments):
+        method_ids = {p['payment_method_id'] for p in payments if p.get('payment_method_id')}
+        bank_ids   = {p['bank_id'] for p in payments if p.get('bank_id')}
+
+        if method_ids and PaymentMethod.objects.filter(business=self.business, id__in=method_ids).count() != len(method_ids):
+            raise serializers.ValidationError('Forma de pagamento inválida.')
+        if bank_ids and BankAccount.objects.filter(business=self.business, id__in=bank_ids).count() != len(bank_ids):
+            raise serializers.ValidationError('Conta bancária inválida.')
+        return payments
+
+    def validate(self, attrs):
+        if self.instance is not None and not self.instance.can_edit():
+            raise serializers.ValidationError(
+                f'Pedido {self.instance.get_status_display()} não pode ser alterado.'
+            )
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        items    = validated_data.pop('items', [])
+        payments = validated_data.pop('payments', [])
+
+        order = Orders.objects.create(business=self.business, **validated_data)
+        self._write_children(order, items, payments)
+        return order
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        items    = validated_data.pop('items', None)
+        payments = validated_data.pop('payments', None)
+
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save()
+
+        # Pedido editável não tem reserva nem financeiro → pode recriar
+        if items is not None:
+            instance.items.all().delete()
+        if payments is not None:
+            instance.payments.all().delete()
+        self._write_children(instance, items, payments)
+        return instance
+
+    def _write_children(self, order, items, payments):
+        """Itens (com fiscal) e pagamentos (com parcelas) em bulk_create."""
+        if items is not None:
+            objs = [OrderItem(order=order, **item) for item in items]
+            apply_fiscal_rules_bulk(order, objs)
+            OrderItem.objects.bulk_create(objs, batch_size=1000)
+
+            order.total_amount = sum((i.subtotal for i in objs), Decimal('0.00'))
+            order.save(update_fields=['total_amount'])
+
+        if payments:
+            objs = bulk_create_with_pks(
+                [OrderPayment(order=order, **payment) for payment in payments],
+                refetch=OrderPayment.objects.filter(order=order),
+            )
+            OrderPaymentParcel.objects.bulk_create(
+                [parcel for payment in objs for parcel in payment.build_parcels()],
+                batch_size=1000,
+            )
@@ -0,0 +1,39 @@
+from django.db import connection
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BULK_CREATE COM PK (também no MySQL)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def bulk_create_with_pks(objs, key=None, refetch=None, batch_size=1000):
+    """
+    bulk_create que devolve os objetos com pk preenchido.
+
+    PostgreSQL/SQLite devolvem os ids no próprio INSERT. No MySQL eles são
+    relidos numa consulta:
+      - key='uid'  → pelo campo único informado;
+      - refetch=qs → queryset que contém exatamente os objetos recém-criados,
+                     casados em ordem de id (= ordem de inserção).
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+
+    model = type(objs[0])
+    model.objects.bulk_create(objs, batch_size=batch_size)
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        return objs
+
+    if key:
+        ids = dict(
+            model.objects.filter(**{f'{key}__in': [getattr(obj, key) for obj in objs]})
+            .values_list(key, 'pk')
+        )
+        for obj in objs:
+            obj.pk = ids[getattr(obj, key)]
+    else:
+        for obj, pk in zip(objs, refetch.order_by('id').values_list('id', flat=True)):
+            obj.pk = pk
+
+    return objs
@@ -0,0 +1,71 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.db.models import Max
+
+from core.models import EANSequence, ProductVariant, calcular_digito_ean13
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ALOCAÇÃO DE EAN13 (sequência por empresa)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _initial_value(prefix):
+    """Primeiro número livre: depois do maior EAN já usado com o prefixo."""
+    last = (
+        ProductVariant.objects
+        .filter(ean13__startswith=prefix)
+        .aggregate(last=Max('ean13'))['last']
+    )
+    if not last or len(last) != 13 or not last.isdigit():
+        return 1
+    return int(last[len(prefix):12]) + 1
+
+
+def _format(prefix, width, number):
+    base = prefix + str(number).zfill(width)
+    return base + str(calcular_digito_ean13(base))
+
+
+def allocate_ean13(business_id, count):
+    """
+    Reserva `count` EAN13 consecutivos da empresa numa única ida
+    travada (SELECT ... FOR UPDATE) ao contador. Nunca repete código,
+    então quem chama não precisa conferir nem tentar de novo.
+    """
+    if count <= 0:
+        return []
+
+    with transaction.atomic():
+        sequence = (
+            EANSequence.objects.select_for_update()
+            .filter(business_id=business_id)
+            .first()
+        )
+
+        if sequence is None:
+            prefix = EANSequence.default_prefix(business_id)
+            try:
+                with transaction.atomic():
+                    EANSequence.objects.create(
+                        business_id=business_id,
+                        prefix=prefix,
+                        next_value=_initial_value(prefix),
+                    )
+            except IntegrityError:
+                pass  # criado em paralelo por outra transação
+
+            sequence = EANSequence.objects.select_for_update().get(business_id=business_id)
+
+        start = sequence.next_value
+        if start + count - 1 >= 10 ** sequence.width:
+            raise ValidationError(
+                f'Faixa de EAN13 esgotada para o prefixo {sequence.prefix}.'
+            )
+
+        sequence.next_value = start + count
+        sequence.save(update_fields=['next_value', 'updated_at'])
+
+    return [
+        _format(sequence.prefix, sequence.width, number)
+        for number in range(start, start + count)
+    ]
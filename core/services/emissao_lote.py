@@ -0,0 +1,218 @@
+"""
+services/emissao_lote.py
+
+Emissão de NF em lote para pedidos FATURADO (fechamento do dia):
+
+  gerar NF → montar XML → assinar → transmitir
+
+  - gerar: uma tarefa por empresa, pedidos em ordem de id → os números
+    da série saem na mesma ordem dos pedidos de cada empresa;
+  - montar / assinar / transmitir: uma tarefa por NF, assim que a
+    empresa termina de gerar.
+
+Tudo num pool de até `processes` processos (NF_BATCH_PROCESSES): a
+assinatura usa CPU e a SEFAZ responde devagar, então várias notas
+andam ao mesmo tempo. Usado por `manage.py emitir_lote`; a ação
+"Emitir NF em lote" do admin de pedidos só enfileira a cadeia de NF
+(services/faturamento.py) para os mesmos pedidos de pending_orders.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+
+from core.models import Orders, Invoice, InvoiceStatus, Job
+from core.services.faturamento import FATURAMENTO_CHAIN
+
+
+def _result(order_id, business_id, **extra):
+    return {
+        'order': order_id, 'business': business_id, 'ok': False,
+        'invoice_id': None, 'invoice': None, 'status': None,
+        'message': '', 'seconds': 0.0, **extra,
+    }
+
+
+def _init_process():
+    django.setup()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TAREFAS (rodam nos processos do pool)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _gerar_empresa(business_id, order_ids):
+    """Gera as NFs de uma empresa, uma transação por pedido, em ordem de id."""
+    from core.services.faturamento import invoice_for_order
+
+    results = []
+    for order_id in sorted(order_ids):
+        result = _result(order_id, business_id)
+        inicio = time.monotonic()
+
+        try:
+            with transaction.atomic():
+                order = (
+                    Orders.objects.select_for_update()
+                    .select_related('business').get(pk=order_id)
+                )
+                if order.status != Orders.STATUS_FATURADO:
+                    raise ValueError(f'Pedido não está faturado ({order.get_status_display()}).')
+
+                invoice = invoice_for_order(order)
+
+            result.update(
+                invoice_id=invoice.pk, invoice=f'{invoice.serie}/{invoice.number}',
+                status=invoice.status,
+            )
+        except Exception as e:
+            result['message'] = str(e)
+
+        result['seconds'] = time.monotonic() - inicio
+        results.append(result)
+
+    return results
+
+
+def _emitir_nf(invoice_id):
+    """Monta o XML, assina e transmite uma NF. Devolve (ok, status, mensagem, segundos)."""
+    from core.services.fiscal.xml_builder import build_signed_xml
+    from core.services.fiscal.sefaz_client import transmitir
+
+    inicio = time.monotonic()
+    try:
+        invoice = Invoice.objects.select_related('order__business').get(pk=invoice_id)
+        if invoice.status not in [InvoiceStatus.RASCUNHO, InvoiceStatus.REJEITADA]:
+            return False, invoice.status, f'NF já está {invoice.get_status_display()}.', 0.0
+
+        xml_assinado     = build_signed_xml(invoice)
+        invoice.xml_sent = xml_assinado
+        invoice.save(update_fields=['xml_sent'])
+
+        ret = transmitir(invoice, xml_assinado)
+        if ret['sucesso']:
+            mensagem = f'Autorizada. Protocolo: {ret["protocolo"]}'
+        else:
+            mensagem = f'SEFAZ ({ret["codigo"]}): {ret["mensagem"]}'
+        return ret['sucesso'], invoice.status, mensagem, time.monotonic() - inicio
+
+    except Exception as e:
+        return False, None, f'Erro ao emitir: {e}', time.monotonic() - inicio
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOTE
+# ─────────────────────────────────────────────────────────────────────────────
+
+def pending_orders(queryset=None):
+    """
+    Pedidos FATURADO com modelo de documento e sem NF autorizada/pendente.
+    Ficam de fora os que têm passo do faturamento na fila (run_workers):
+    a cadeia ainda vai gerar/transmitir a NF, e as duas vias não podem
+    transmitir a mesma nota.
+    """
+    queryset = Orders.objects.all() if queryset is None else queryset
+    queued   = Job.objects.filter(
+        order=OuterRef('pk'), task__in=FATURAMENTO_CHAIN,
+        status__in=[Job.Status.PENDING, Job.Status.RUNNING],
+    )
+    issued   = Invoice.objects.filter(
+        order=OuterRef('pk'), status__in=[InvoiceStatus.PENDENTE, InvoiceStatus.AUTORIZADA],
+    )
+    return (
+        queryset
+        .filter(status=Orders.STATUS_FATURADO, document_model__isnull=False)
+        .exclude(document_model='')
+        .exclude(Exists(issued))
+        .exclude(Exists(queued))
+    )
+
+
+def _emitido(result, emitted):
+    """Junta o retorno de _emitir_nf ao resultado do pedido."""
+    ok, status, message, seconds = emitted
+    result.update(ok=ok, status=status or result['status'], message=message)
+    result['seconds'] += seconds
+    return result
+
+
+def emitir_lote(orders, processes=None, on_result=None):
+    """
+    Emite as NFs dos pedidos (queryset ou lista de ids) num pool de processos.
+    Com processes=1 roda tudo no próprio processo, sem pool (depuração,
+    testes e lotes pequenos).
+
+    `on_result(result)` é chamado a cada pedido concluído (progresso).
+    Retorna {'results': [...], 'seconds', 'authorized', 'per_minute'}, com
+    um resultado {'order', 'business', 'ok', 'invoice', 'status',
+    'message', 'seconds'} por pedido, em ordem de empresa / pedido.
+    """
+    processes = max(processes or getattr(settings, 'NF_BATCH_PROCESSES', 4), 1)
+    if processes > 1 and transaction.get_connection().in_atomic_block:
+        raise RuntimeError('emitir_lote com pool não pode rodar dentro de uma transação.')
+
+    ids = orders if isinstance(orders, (list, tuple, set)) else orders.values_list('id', flat=True)
+
+    by_business = {}
+    for business_id, order_id in (
+        Orders.objects.filter(id__in=list(ids))
+        .order_by('business_id', 'id')
+        .values_list('business_id', 'id')
+    ):
+        by_business.setdefault(business_id, []).append(order_id)
+
+    results = {}
+    inicio  = time.monotonic()
+
+    def done(result):
+        results[result['order']] = result
+        if on_result:
+            on_result(result)
+
+    if by_business and processes == 1:
+        for business_id, order_ids in by_business.items():
+            for generated in _gerar_empresa(business_id, order_ids):
+                if generated['invoice_id']:
+                    _emitido(generated, _emitir_nf(generated['invoice_id']))
+                done(generated)
+
+    elif by_business:
+        # Conexões não podem ser herdadas pelos filhos (mesmo cuidado do run_workers)
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_process) as pool:
+            pending = {
+                pool.submit(_gerar_empresa, business_id, order_ids): None
+                for business_id, order_ids in by_business.items()
+            }
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    result = pending.pop(future)
+
+                    if result is None:
+                        # Empresa gerada: cada NF segue sozinha para o pool
+                        for generated in future.result():
+                            if generated['invoice_id']:
+                                pending[pool.submit(_emitir_nf, generated['invoice_id'])] = generated
+                            else:
+                                done(generated)
+                        continue
+
+                    done(_emitido(result, future.result()))
+
+    seconds    = time.monotonic() - inicio
+    authorized = sum(1 for r in results.values() if r['ok'])
+
+    return {
+        'results':    [results[oid] for order_ids in by_business.values() for oid in order_ids],
+        'seconds':    seconds,
+        'authorized': authorized,
+        'per_minute': authorized * 60 / seconds if seconds else 0.0,
+    }
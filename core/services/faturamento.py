@@ -0,0 +1,140 @@
+"""
+services/faturamento.py
+
+Pipeline pós-faturamento em segundo plano (fila de services/jobs.py):
+
+  baixa de estoque → financeiro → gerar NF → assinar → transmitir
+
+Ao ir para FATURADO, Orders.save só enfileira a cadeia; cada passo roda
+no worker (manage.py run_workers) e, ao concluir, enfileira o seguinte.
+"""
+
+from core.models import Orders, Invoice, InvoiceStatus, StockEntry
+from core.services.jobs import task, enqueue, build_job, enqueue_many, StopChain, RetryJob, PermanentJobError
+
+
+FATURAMENTO_CHAIN = [
+    'order.finalize_stock',
+    'order.generate_financial',
+    'invoice.generate',
+    'invoice.sign',
+    'invoice.transmit',
+]
+
+# Só a parte fiscal (estoque/financeiro já feitos em lote)
+INVOICE_CHAIN = FATURAMENTO_CHAIN[2:]
+
+
+def enqueue_faturamento(order, steps=FATURAMENTO_CHAIN):
+    """Enfileira a cadeia do faturamento (vale a partir do commit)."""
+    return enqueue(steps[0], order=order, chain=steps[1:])
+
+
+def enqueue_invoice_chain(orders):
+    """NF de vários pedidos já baixados/financeiro gerado, num INSERT só."""
+    return enqueue_many([
+        build_job(INVOICE_CHAIN[0], order=order, chain=INVOICE_CHAIN[1:])
+        for order in orders
+    ])
+
+
+def _faturado_order(job):
+    """Pedido travado; se saiu de FATURADO (ex.: cancelado) a cadeia para."""
+    order = Orders.objects.select_for_update().select_related('business').get(pk=job.order_id)
+    if order.status != Orders.STATUS_FATURADO:
+        raise StopChain(f'Pedido #{order.pk} não está mais faturado ({order.get_status_display()}).')
+    return order
+
+
+def _invoice(job):
+    invoice = Invoice.objects.select_related('order__business').get(pk=job.payload['invoice_id'])
+    if invoice.status not in [InvoiceStatus.RASCUNHO, InvoiceStatus.REJEITADA]:
+        raise StopChain(f'NF {invoice.serie}/{invoice.number} já está {invoice.get_status_display()}.')
+    return invoice
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PASSOS
+# ─────────────────────────────────────────────────────────────────────────────
+
+@task('order.finalize_stock')
+def finalize_order_stock(job):
+    from core.services.order_stock import finalize_stock
+
+    order = _faturado_order(job)
+
+    already = StockEntry.objects.filter(
+        order_item__order=order, movement_type=StockEntry.MovementType.SALE
+    ).exists()
+    if already:
+        return 'Estoque já baixado.'
+
+    finalize_stock(order)
+    return 'Estoque baixado.'
+
+
+@task('order.generate_financial')
+def generate_order_financial(job):
+    order = _faturado_order(job)
+    order.generate_financial()
+    return 'Financeiro gerado.'
+
+
+def invoice_for_order(order):
+    """
+    NF em aberto (rascunho / rejeitada) do pedido ou uma nova. Reexecução
+    reaproveita a mesma nota em vez de consumir outro número.
+
+    ValueError do gerador (pedido sem itens, NF já autorizada...) sobe.
+    """
+    from core.services.nf_generator import gerar_nota_fiscal
+
+    invoice = Invoice.objects.filter(
+        order=order,
+        model=order.document_model,
+        status__in=[InvoiceStatus.RASCUNHO, InvoiceStatus.REJEITADA],
+    ).order_by('-id').first()
+
+    return invoice or gerar_nota_fiscal(order=order)
+
+
+@task('invoice.generate')
+def generate_invoice(job):
+    order = _faturado_order(job)
+    if not order.document_model:
+        raise StopChain('Pedido sem modelo de documento: NF não gerada.')
+
+    try:
+        invoice = invoice_for_order(order)
+    except ValueError as e:
+        raise PermanentJobError(str(e)) from e
+
+    job.payload['invoice_id'] = invoice.pk
+    return f'{invoice.get_model_display()} {invoice.serie}/{invoice.number} gerada.'
+
+
+@task('invoice.sign')
+def sign_invoice(job):
+    from core.services.fiscal.xml_builder import build_signed_xml
+
+    invoice = _invoice(job)
+    invoice.xml_sent = build_signed_xml(invoice)
+    invoice.save(update_fields=['xml_sent'])
+    return f'NF {invoice.serie}/{invoice.number} assinada.'
+
+
+@task('invoice.transmit')
+def transmit_invoice(job):
+    from core.services.fiscal.sefaz_client import transmitir
+
+    invoice   = _invoice(job)
+    resultado = transmitir(invoice, invoice.xml_sent)
+
+    if resultado['sucesso']:
+        return f'NF autorizada. Protocolo: {resultado["protocolo"]}'
+    if resultado['codigo'] == '999':
+        # Comunicação / WS fora do ar → tenta de novo
+        raise RetryJob(resultado['mensagem'])
+    if invoice.status == InvoiceStatus.PENDENTE:
+        return f'Lote recebido pela SEFAZ ({resultado["codigo"]}): {resultado["mensagem"]}'
+    raise PermanentJobError(f'Rejeição SEFAZ ({resultado["codigo"]}): {resultado["mensagem"]}')
@@ -68,6 +68,13 @@ _URLS = {
 
 
 def _base_url(uf: str, modelo: str, ambiente: str) -> str:
+    from django.conf import settings
+
+    # Servidor local no lugar da SEFAZ (manage.py sefaz_local), para testes
+    override = getattr(settings, 'SEFAZ_URL_OVERRIDE', '')
+    if override:
+        return override.rstrip('/')
+
     env_key = 'producao' if ambiente == '1' else 'homologacao'
     urls = _URLS.get(modelo, _URLS['55']).get(env_key, {})
     return urls.get(uf) or urls.get('SVRS', '')
@@ -402,6 +409,81 @@ def cancelar(invoice, justificativa: str) -> dict:
         _limpar_tmp(cert_path, key_path)
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# INUTILIZAÇÃO DE NUMERAÇÃO
+# ─────────────────────────────────────────────────────────────────────────────
+
+def inutilizar(business, modelo: str, serie: str, inicio: int, fim: int,
+               justificativa: str) -> dict:
+    """Inutiliza a faixa inicio..fim da série (números que não viraram NF)."""
+    from lxml import etree
+    from zeep import Client
+    from zeep.transports import Transport
+    from requests import Session
+    from core.services.fiscal.signer import assinar_xml_evento
+    from core.services.fiscal.certificate_utils import ler_pfx
+
+    if len(justificativa) < 15:
+        return _resultado(False, '999', 'Justificativa deve ter no mínimo 15 caracteres.')
+
+    uf       = business.state
+    ambiente = str(business.nfe_environment)
+    base_url = _base_url(uf, modelo, ambiente)
+
+    if not base_url:
+        return _resultado(False, '999', f'URL do WS não encontrada para UF {uf}')
+
+    wsdl_url  = f"{base_url}/NFeInutilizacao4?wsdl"
+    cert_path = key_path = None
+
+    try:
+        cert_path, key_path = _ssl_context(business)
+
+        cuf     = _cUF_from_state(uf)
+        ano     = datetime.now().strftime('%y')
+        cnpj    = ''.join(filter(str.isdigit, business.document))
+        id_inut = f'ID{cuf}{ano}{cnpj}{modelo}{int(serie):03d}{inicio:09d}{fim:09d}'
+
+        inut_xml = (
+            f'<inutNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+            f'<infInut Id="{id_inut}">'
+            f'<tpAmb>{ambiente}</tpAmb>'
+            f'<xServ>INUTILIZAR</xServ>'
+            f'<cUF>{cuf}</cUF>'
+            f'<ano>{ano}</ano>'
+            f'<CNPJ>{cnpj}</CNPJ>'
+            f'<mod>{modelo}</mod>'
+            f'<serie>{int(serie)}</serie>'
+            f'<nNFIni>{inicio}</nNFIni>'
+            f'<nNFFin>{fim}</nNFFin>'
+            f'<xJust>{justificativa[:255]}</xJust>'
+            f'</infInut>'
+            f'</inutNFe>'
+        )
+
+        pfx_bytes, senha = ler_pfx(business)
+        inut_assinado    = assinar_xml_evento(pfx_bytes, senha, inut_xml, id_inut)
+
+        session = Session()
+        session.cert   = (cert_path, key_path)
+        session.verify = True
+
+        client   = Client(wsdl=wsdl_url, transport=Transport(session=session, timeout=30))
+        resposta = client.service.nfeInutilizacaoNF(
+            nfeDadosMsg=etree.fromstring(inut_assinado.encode())
+        )
+
+        xml_ret = etree.tostring(resposta, encoding='unicode')
+        ret     = _parsear_retorno_inutilizacao(xml_ret)
+        return _resultado(ret['sucesso'], ret['cStat'], ret['xMotivo'], ret['protocolo'], xml_ret)
+
+    except Exception as e:
+        return _resultado(False, '999', f'Erro ao inutilizar: {str(e)}')
+
+    finally:
+        _limpar_tmp(cert_path, key_path)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # PARSERS DE RETORNO XML
 # ─────────────────────────────────────────────────────────────────────────────
@@ -411,9 +493,12 @@ def _parsear_retorno_autorizacao(xml_ret: str) -> dict:
     ns = 'http://www.portalfiscal.inf.br/nfe'
     try:
         root      = etree.fromstring(xml_ret.encode())
-        c_stat    = root.findtext(f'.//{{{ns}}}cStat', '000')
-        x_motivo  = root.findtext(f'.//{{{ns}}}xMotivo', 'Sem descrição')
-        protocolo = root.findtext(f'.//{{{ns}}}nProt', '')
+        # Retorno síncrono: o cStat do lote (104) vem antes do da nota (infProt)
+        prot      = root.find(f'.//{{{ns}}}infProt')
+        node      = prot if prot is not None else root
+        c_stat    = node.findtext(f'.//{{{ns}}}cStat', '000')
+        x_motivo  = node.findtext(f'.//{{{ns}}}xMotivo', 'Sem descrição')
+        protocolo = node.findtext(f'.//{{{ns}}}nProt', '')
         return {
             'cStat': c_stat, 'xMotivo': x_motivo, 'protocolo': protocolo,
             'autorizado': c_stat in ('100', '150'),
@@ -449,4 +534,18 @@ def _parsear_retorno_evento(xml_ret: str) -> dict:
         return {'cStat': c_stat, 'xMotivo': x_motivo, 'protocolo': protocolo,
                 'sucesso': c_stat == '135'}
     except Exception as e:
-        return {'cStat': '999', 'xMotivo': str(e), 'protocolo': '', 'sucesso': False}
\ No newline at end of file
+        return {'cStat': '999', 'xMotivo': str(e), 'protocolo': '', 'sucesso': False}
+
+
+def _parsear_retorno_inutilizacao(xml_ret: str) -> dict:
+    from lxml import etree
+    ns = 'http://www.portalfiscal.inf.br/nfe'
+    try:
+        root      = etree.fromstring(xml_ret.encode())
+        c_stat    = root.findtext(f'.//{{{ns}}}cStat', '000')
+        x_motivo  = root.findtext(f'.//{{{ns}}}xMotivo', '')
+        protocolo = root.findtext(f'.//{{{ns}}}nProt', '')
+        return {'cStat': c_stat, 'xMotivo': x_motivo, 'protocolo': protocolo,
+                'sucesso': c_stat == '102'}
+    except Exception as e:
+        return {'cStat': '999', 'xMotivo': str(e), 'protocolo': '', 'sucesso': False}
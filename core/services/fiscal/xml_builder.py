@@ -11,6 +11,7 @@ Tipos auxiliares corretos:
 """
 
 from __future__ import annotations
+import hashlib
 import random
 import string
 from decimal import Decimal
@@ -21,6 +22,34 @@ from nfelib.nfe.bindings.v4_0.leiaute_nfe_v4_00 import TenderEmi, Tendereco
 from xsdata.formats.dataclass.serializers import XmlSerializer
 from xsdata.formats.dataclass.context import XmlContext
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+
+
+# ─── serializador ────────────────────────────────────────────────────────────
+# XmlContext guarda os metadados (reflexão) de cada classe do nfelib; montar
+# isso para a árvore do Tnfe é o grosso do custo da 1ª serialização. Um por
+# processo, aquecido no ready() (CoreConfig) e reaproveitado em toda NF.
+
+_SERIALIZER = {}
+
+
+def get_serializer() -> XmlSerializer:
+    serializer = _SERIALIZER.get('nfe')
+    if serializer is None:
+        serializer = _SERIALIZER['nfe'] = XmlSerializer(context=XmlContext())
+    return serializer
+
+
+def warm_up() -> None:
+    """Monta de uma vez os metadados de toda a árvore Tnfe."""
+    get_serializer().context.build_recursive(Tnfe)
+
+
+def render_xml(nfe_obj: Tnfe) -> str:
+    return get_serializer().render(nfe_obj)
+
 
 # ─── helpers ─────────────────────────────────────────────────────────────────
 
@@ -159,16 +188,136 @@ def _build_cofins(item):
     return Cofins(COFINSNT=Cofins.Cofinsnt(CST=cst))
 
 
-# ─── XML principal ────────────────────────────────────────────────────────────
+# ─── chave + cache ───────────────────────────────────────────────────────────
+# Montar o XML não grava nada: a única escrita é freeze_key (cNF, chave, DV),
+# chamada antes de assinar. XML e XML assinado ficam no cache do Django pelo
+# hash do conteúdo (NF + itens + pagamentos + transporte) — visualizar,
+# depurar ou repetir uma transmissão não serializa tudo de novo.
 
-def build_xml(invoice) -> str:
+# Subir quando o XML gerado mudar para o mesmo conteúdo (descarta o cache)
+XML_CACHE_VERSION = 1
+
+# Campos que não entram no XML (retorno da SEFAZ, arquivos, auditoria)
+_NOT_IN_XML = {
+    'status', 'protocol', 'authorized_at', 'return_code', 'return_message',
+    'xml_sent', 'xml_return', 'xml_cancel', 'pdf_danfe', 'access_key', 'dv',
+    'created_by_id', 'created_at', 'updated_at',
+}
+
+
+def freeze_key(invoice) -> str:
+    """
+    Fixa cNF, chave de acesso e DV na NF (gera o cNF se faltar).
+    Grava só o que mudou — chamar de novo não escreve nada.
+    """
+    changed = []
     if not invoice.code_nf:
         invoice.code_nf = ''.join(random.choices(string.digits, k=8))
+        changed.append('code_nf')
+
+    chave, dv = _calcular_chave(invoice)
+    if (invoice.access_key, invoice.dv) != (chave, dv):
+        invoice.access_key, invoice.dv = chave, dv
+        changed += ['access_key', 'dv']
+
+    if changed:
+        invoice.save(update_fields=changed)
+    return chave
+
+
+def _conteudo(invoice):
+    """Itens, pagamentos e transporte, lidos uma vez para o hash e o XML."""
+    try:
+        transport = invoice.transport
+    except ObjectDoesNotExist:
+        transport = None
+    return (
+        list(invoice.items.all().order_by('item_number')),
+        list(invoice.payments.all()),
+        transport,
+    )
+
+
+def _values(obj, skip=('id', 'created_at', 'updated_at')):
+    return [
+        (field.attname, field.value_from_object(obj))
+        for field in obj._meta.concrete_fields if field.attname not in skip
+    ]
+
+
+def content_hash(invoice, items, payments, transport) -> str:
+    """SHA-256 de tudo o que entra no XML da NF."""
+    business = invoice.order.business
+    data = [
+        XML_CACHE_VERSION,
+        _values(invoice, _NOT_IN_XML),
+        [_values(item) for item in items],
+        [_values(payment) for payment in payments],
+        _values(transport) if transport else None,
+        # QR Code da NFC-e usa o CSC da empresa
+        (business.nfce_csc_id, business.nfce_csc) if invoice.model == '65' else None,
+    ]
+    return hashlib.sha256(repr(data).encode()).hexdigest()
+
+
+def _cache_ttl():
+    return getattr(settings, 'NFE_XML_CACHE_TTL', 86400)
+
+
+def _cached_xml(invoice) -> tuple[str, str]:
+    items, payments, transport = _conteudo(invoice)
+    digest = content_hash(invoice, items, payments, transport)
+    key    = f'nfe-xml:{digest}'
+
+    xml = cache.get(key)
+    if xml is None:
+        xml = render_xml(build_nfe(invoice, items, payments, transport))
+        cache.set(key, xml, _cache_ttl())
+    return digest, xml
+
+
+def build_xml(invoice) -> str:
+    """XML (sem assinatura) da NF, do cache quando o conteúdo não mudou. Não grava nada."""
+    return _cached_xml(invoice)[1]
+
+
+def build_signed_xml(invoice) -> str:
+    """
+    Congela a chave (freeze_key) e devolve o XML assinado, também em cache
+    pelo hash do conteúdo + certificado da empresa (arquivo e validade —
+    a senha não entra na chave).
+    """
+    from core.services.fiscal.signer import assinar_xml
+
+    freeze_key(invoice)
+    digest, xml = _cached_xml(invoice)
+
+    business = invoice.order.business
+    cert     = hashlib.sha256(
+        f'{business.certificate_file.name}|{business.certificate_expiration}'.encode()
+    ).hexdigest()[:16]
+    key      = f'nfe-xml-signed:{digest}:{cert}'
+
+    signed = cache.get(key)
+    if signed is None:
+        signed = assinar_xml(invoice, xml)
+        cache.set(key, signed, _cache_ttl())
+    return signed
+
+
+# ─── XML principal ────────────────────────────────────────────────────────────
+
+def build_nfe(invoice, items=None, payments=None, transport=None) -> Tnfe:
+    """
+    Árvore Tnfe da NF, sem serializar e sem gravar nada. A chave é
+    calculada dos campos da NF (mesma que freeze_key grava).
+    """
+    if not invoice.code_nf:
+        raise ValueError('NF sem código numérico (cNF): chame freeze_key antes de montar o XML.')
 
     chave, dv = _calcular_chave(invoice)
-    invoice.access_key = chave
-    invoice.dv         = dv
-    invoice.save(update_fields=['access_key', 'dv', 'code_nf'])
+    items     = invoice.items.all().order_by('item_number') if items is None else items
+    payments  = invoice.payments.all() if payments is None else payments
 
     # ── Emitente ──────────────────────────────────────────────────────────
     emit = Tnfe.InfNfe.Emit(
@@ -223,7 +372,7 @@ def build_xml(invoice) -> str:
 
     # ── Itens ─────────────────────────────────────────────────────────────
     det_list = []
-    for item in invoice.items.all().order_by('item_number'):
+    for item in items:
         prod = Tnfe.InfNfe.Det.Prod(
             cProd    = item.product_code[:60],
             cEAN     = item.ean or 'SEM GTIN',
@@ -306,7 +455,7 @@ def build_xml(invoice) -> str:
 
     # ── Transporte ────────────────────────────────────────────────────────
     try:
-        t      = invoice.transport
+        t      = transport or invoice.transport
         transp = Tnfe.InfNfe.Transp(modFrete=t.freight_mode or '9')
         if t.carrier_name:
             transp.transporta = Tnfe.InfNfe.Transp.Transporta(
@@ -332,7 +481,7 @@ def build_xml(invoice) -> str:
 
     # ── Pagamentos ────────────────────────────────────────────────────────
     det_pag_list = []
-    for pag in invoice.payments.all():
+    for pag in payments:
         det_pag_list.append(Tnfe.InfNfe.Pag.DetPag(
             tPag = pag.payment_code,
             vPag = _fmt(pag.value),
@@ -392,5 +541,4 @@ def build_xml(invoice) -> str:
             urlChave = f'{url_base}?chNFe={chave}&tpAmb={ambiente}',
         )
 
-    # ── Serializa ─────────────────────────────────────────────────────────
-    return XmlSerializer(context=XmlContext()).render(nfe_obj)
\ No newline at end of file
+    return nfe_obj
\ No newline at end of file
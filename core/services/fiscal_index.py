@@ -0,0 +1,212 @@
+"""
+services/fiscal_index.py
+
+Índice fiscal compilado em memória, por empresa.
+
+Tudo que apply_fiscal_rules precisa consultar fica em dicionários:
+  - NCM id → operações fiscais ativas (ordem de pk, como o .first() antigo)
+  - NCM id → código do NCM
+  - matriz ICMS origem × destino × importado (global, 27 × 27 × 2)
+
+Carregado uma vez por processo e reaproveitado enquanto a versão não
+mudar. A versão fica no banco (FiscalIndexVersion) e é trocada pelos
+signals (core/signals.py) ao salvar/excluir FiscalOperation,
+NCMGroupItem, NCMGroup, NCM e ICMSOriginDestination. Cada processo
+confere a versão numa consulta no máximo a cada
+FISCAL_INDEX_VERSION_CHECK segundos — no meio-tempo a resolução não vai
+ao banco; a troca feita no próprio processo vale na hora. FISCAL_INDEX_TTL
+só cobre alteração feita por fora dos signals (update() em massa, SQL
+direto). Índices por empresa: no máximo FISCAL_INDEX_MAX_BUSINESSES por
+processo, descartando o usado há mais tempo.
+"""
+
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from core.models import FiscalOperation, NCMGroupItem, ICMSOriginDestination, FiscalIndexVersion
+
+
+GLOBAL_SCOPE   = 'global'
+BUSINESS_SCOPE = 'business:{}'
+
+# business_id → FiscalIndex, do usado há mais tempo ao mais recente  (por processo)
+_INDEXES = OrderedDict()
+_ICMS_MATRIX = {}
+
+# business_id → (checked_at, (versão global, versão da empresa))  (por processo)
+_VERSIONS = {}
+
+
+def _ttl():
+    return getattr(settings, 'FISCAL_INDEX_TTL', 300)
+
+
+def _check_interval():
+    return getattr(settings, 'FISCAL_INDEX_VERSION_CHECK', 5)
+
+
+def _max_businesses():
+    return getattr(settings, 'FISCAL_INDEX_MAX_BUSINESSES', 256)
+
+
+def _current_versions(business_id):
+    """
+    Versões (global, empresa); sem linha = 0. Vai ao banco (uma consulta)
+    só se a última conferência desta empresa tem mais que o intervalo.
+    """
+    checked = _VERSIONS.get(business_id)
+    if checked and time.monotonic() - checked[0] < _check_interval():
+        return checked[1]
+
+    business_scope = BUSINESS_SCOPE.format(business_id)
+    versions = dict(
+        FiscalIndexVersion.objects
+        .filter(scope__in=[GLOBAL_SCOPE, business_scope])
+        .values_list('scope', 'version')
+    )
+    current = versions.get(GLOBAL_SCOPE, 0), versions.get(business_scope, 0)
+
+    _VERSIONS[business_id] = (time.monotonic(), current)
+    if len(_VERSIONS) > _max_businesses():
+        _VERSIONS.pop(next(iter(_VERSIONS)))
+    return current
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ÍNDICE
+# ─────────────────────────────────────────────────────────────────────────────
+
+class FiscalIndex:
+    """Regras fiscais de uma empresa já resolvidas em memória."""
+
+    def __init__(self, business_id, version):
+        self.business_id = business_id
+        self.version     = version
+        self.loaded_at   = time.monotonic()
+
+        self.ncm_codes  = {}   # ncm_id → código
+        self.ops_by_ncm = {}   # ncm_id → [FiscalOperation, ...] por pk
+
+        # Memo de regras já resolvidas (services/fiscal_rules._resolve_rule):
+        # (ncm_id, modelo, UF origem, UF destino, origem do produto) → (operação, alíquota ICMS)
+        self.rules = {}
+
+        self._load()
+
+    def _load(self):
+        groups_by_ncm = {}
+        for ncm_id, group_id, code in NCMGroupItem.objects.filter(
+            group__business_id=self.business_id
+        ).values_list('ncm_id', 'group_id', 'ncm__code'):
+            groups_by_ncm.setdefault(ncm_id, set()).add(group_id)
+            self.ncm_codes[ncm_id] = code
+
+        ops_by_group = {}
+        for op in FiscalOperation.objects.filter(
+            business_id=self.business_id, active=True
+        ).order_by('pk'):
+            ops_by_group.setdefault(op.ncm_group_id, []).append(op)
+
+        for ncm_id, group_ids in groups_by_ncm.items():
+            ops = [op for gid in group_ids for op in ops_by_group.get(gid, [])]
+            if ops:
+                self.ops_by_ncm[ncm_id] = sorted(ops, key=lambda op: op.pk)
+
+    def is_fresh(self, version):
+        return self.version == version and time.monotonic() - self.loaded_at < _ttl()
+
+    def find_operation(self, ncm_id, doc_model):
+        """
+        Mesma prioridade de antes:
+          1. Operação com model == doc_model (ex: '55' ou '65')
+          2. Qualquer operação ativa (fallback)
+        """
+        ops = self.ops_by_ncm.get(ncm_id)
+        if not ops:
+            return None
+
+        if doc_model:
+            for op in ops:
+                if op.model == doc_model:
+                    return op
+
+        return ops[0]
+
+
+class ICMSMatrix:
+    """Tabela ICMSOriginDestination inteira: (origem, destino, importado) → alíquotas."""
+
+    def __init__(self, version):
+        self.version   = version
+        self.loaded_at = time.monotonic()
+        self.rates = {
+            (row.origin_state, row.destination_state, row.imported): (row.internal_rate, row.interstate_rate)
+            for row in ICMSOriginDestination.objects.all()
+        }
+
+    def is_fresh(self, version):
+        return self.version == version and time.monotonic() - self.loaded_at < _ttl()
+
+    def get(self, origin_state, destination_state, imported):
+        """Retorna (interna, interestadual) ou None."""
+        return self.rates.get((origin_state, destination_state, imported))
+
+
+def get_fiscal_index(business_id):
+    """
+    Índice fiscal da empresa + matriz ICMS, recompilados só quando a
+    versão mudou ou o TTL venceu. Retorna (FiscalIndex, ICMSMatrix).
+    """
+    global_version, business_version = _current_versions(business_id)
+
+    # Código do NCM vem da tabela global → índice depende das duas versões
+    index_version = (global_version, business_version)
+
+    index = _INDEXES.get(business_id)
+    if index is None or not index.is_fresh(index_version):
+        index = FiscalIndex(business_id, index_version)
+        _INDEXES[business_id] = index
+
+    # LRU: mais recente no fim; passou do limite, sai o usado há mais tempo
+    _INDEXES.move_to_end(business_id)
+    while len(_INDEXES) > _max_businesses():
+        _INDEXES.popitem(last=False)
+
+    matrix = _ICMS_MATRIX.get('matrix')
+    if matrix is None or not matrix.is_fresh(global_version):
+        matrix = ICMSMatrix(global_version)
+        _ICMS_MATRIX['matrix'] = matrix
+
+    return index, matrix
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INVALIDAÇÃO
+# ─────────────────────────────────────────────────────────────────────────────
+
+def invalidate_fiscal_index(business_id=None):
+    """
+    Troca a versão (da empresa, ou global se business_id=None) depois do
+    commit, para nenhum processo recompilar com dado ainda não gravado.
+    """
+    scope = GLOBAL_SCOPE if business_id is None else BUSINESS_SCOPE.format(business_id)
+
+    def bump():
+        updated = FiscalIndexVersion.objects.filter(scope=scope).update(version=F('version') + 1)
+        if not updated:
+            # Primeira troca do escopo: 0 (sem linha) → 1
+            FiscalIndexVersion.objects.get_or_create(scope=scope, defaults={'version': 1})
+
+        if business_id is None:
+            _ICMS_MATRIX.clear()
+            _INDEXES.clear()
+            _VERSIONS.clear()
+        else:
+            _INDEXES.pop(business_id, None)
+            _VERSIONS.pop(business_id, None)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,345 @@
+"""
+services/fiscal_numbers.py
+
+Numeração de NF-e / NFC-e por empresa, modelo e série (FiscalNumberSequence).
+
+  - next_number(...)          próximo número, um por chamada
+  - take_number(...)          idem, mas do bloco do worker quando ativo (NFC-e)
+  - reserve_block(...)        faixa inteira para um worker
+  - find_unused_numbers()     números entregues que ficaram sem NF → FiscalNumberVoid
+  - inutilizar_pendentes()    envia as inutilizações à SEFAZ
+
+O incremento roda numa transação curta na conexão FISCAL_NUMBERS_DB
+(settings.DATABASES): faz commit na hora, mesmo chamado de dentro da
+transação que gera a NF, e o lock na linha da sequência dura só o UPDATE.
+Sem essa conexão configurada, usa a 'default' — o lock então vai até o
+commit de quem chamou, mas só na linha da sequência, não em Business.
+
+Número entregue cuja NF não foi gravada (rollback, worker morto, sobra
+de bloco) é inutilizado pelo comando `manage.py inutilizar_numeros`,
+só depois de JOB_STALE_AFTER e se não houver Invoice com ele.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.utils import timezone
+
+from core.models import (
+    FiscalNumberBlock, FiscalNumberSequence, FiscalNumberVoid, Invoice,
+)
+
+
+FISCAL_NUMBERS_DB = 'fiscal_numbers'
+
+JUSTIFICATIVA = 'Numeracao reservada e nao utilizada por falha na emissao'
+
+# (business_id, modelo, serie) → {'block': FiscalNumberBlock, 'next': int}  (por processo)
+_BLOCKS = {}
+_WORKER = {'id': None}
+
+
+def _using():
+    return FISCAL_NUMBERS_DB if FISCAL_NUMBERS_DB in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def _block_size(modelo):
+    return getattr(settings, 'NFCE_NUMBER_BLOCK_SIZE', 0) if modelo == '65' else 0
+
+
+def _block_ttl():
+    return timedelta(seconds=getattr(settings, 'FISCAL_NUMBER_BLOCK_TTL', 3600))
+
+
+def _business_last(business, modelo):
+    return business.nfe_last_number if modelo == '55' else business.nfce_last_number
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SEQUÊNCIA
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _locked_sequence(business, modelo, serie, using):
+    """Linha da sequência travada (criada a partir de Business na 1ª vez)."""
+    lookup   = dict(business_id=business.pk, model=modelo, serie=serie)
+    start    = _business_last(business, modelo)
+    sequence = (
+        FiscalNumberSequence.objects.using(using)
+        .select_for_update().filter(**lookup).first()
+    )
+
+    if sequence is None:
+        try:
+            with transaction.atomic(using=using):
+                # Histórico anterior à sequência não entra na varredura
+                FiscalNumberSequence.objects.using(using).create(
+                    last_number=start, checked_through=start, scan_through=start, **lookup,
+                )
+        except IntegrityError:
+            pass  # criada em paralelo por outra transação
+
+        sequence = FiscalNumberSequence.objects.using(using).select_for_update().get(**lookup)
+
+    elif start > sequence.last_number:
+        # Salto manual em Business (ex.: números já usados em outro emissor):
+        # a faixa pulada fica registrada como bloco conferido → não é inutilizada
+        FiscalNumberBlock.objects.using(using).create(
+            start=sequence.last_number + 1, end=start, worker='Business',
+            status=FiscalNumberBlock.Status.CHECKED, closed_at=timezone.now(), **lookup,
+        )
+        sequence.last_number = start
+
+    return sequence
+
+
+def _advance(business, modelo, serie, count):
+    """Avança a sequência em `count` e retorna o primeiro número da faixa."""
+    using = _using()
+    with transaction.atomic(using=using):
+        sequence = _locked_sequence(business, modelo, serie, using)
+        first    = sequence.last_number + 1
+
+        sequence.last_number += count
+        sequence.save(update_fields=['last_number', 'updated_at'])
+
+    return first
+
+
+def next_number(business, modelo, serie):
+    """Próximo número da série, já gravado na sequência."""
+    return _advance(business, modelo, serie, 1)
+
+
+def peek_next_number(business, modelo, serie):
+    """Número que a próxima NF deve receber (só leitura, para exibir)."""
+    last = (
+        FiscalNumberSequence.objects
+        .filter(business_id=business.pk, model=modelo, serie=serie)
+        .values_list('last_number', flat=True).first()
+    ) or 0
+    return max(last, _business_last(business, modelo)) + 1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BLOCOS POR WORKER
+# ─────────────────────────────────────────────────────────────────────────────
+
+def use_blocks(worker_id):
+    """Ativa a numeração por blocos neste processo (run_workers)."""
+    _WORKER['id'] = worker_id
+
+
+def reserve_block(business, modelo, serie, size, worker=''):
+    """Reserva `size` números consecutivos numa única ida à sequência."""
+    using = _using()
+    with transaction.atomic(using=using):
+        sequence = _locked_sequence(business, modelo, serie, using)
+        start    = sequence.last_number + 1
+
+        sequence.last_number += size
+        sequence.save(update_fields=['last_number', 'updated_at'])
+
+        return FiscalNumberBlock.objects.using(using).create(
+            business_id=business.pk, model=modelo, serie=serie,
+            start=start, end=start + size - 1, worker=worker,
+        )
+
+
+def close_block(block):
+    FiscalNumberBlock.objects.using(_using()).filter(
+        pk=block.pk, status=FiscalNumberBlock.Status.OPEN,
+    ).update(status=FiscalNumberBlock.Status.CLOSED, closed_at=timezone.now())
+
+
+def release_blocks():
+    """Fecha os blocos deste processo (saída do worker): sobras vão para inutilização."""
+    for current in _BLOCKS.values():
+        close_block(current['block'])
+    _BLOCKS.clear()
+
+
+def take_number(business, modelo, serie):
+    """
+    Número para uma NF nova. Em worker com blocos ativos (NFC-e e
+    NFCE_NUMBER_BLOCK_SIZE > 0), sai do bloco em memória: uma ida à
+    sequência a cada bloco, não a cada nota.
+    """
+    size = _block_size(modelo)
+    if not size or not _WORKER['id']:
+        return next_number(business, modelo, serie)
+
+    key     = (business.pk, modelo, serie)
+    current = _BLOCKS.get(key)
+
+    if (
+        current is None
+        or current['next'] > current['block'].end
+        or timezone.now() - current['block'].created_at > _block_ttl()
+    ):
+        if current:
+            close_block(current['block'])
+        block   = reserve_block(business, modelo, serie, size, _WORKER['id'])
+        current = _BLOCKS[key] = {'block': block, 'next': block.start}
+
+    number = current['next']
+    current['next'] += 1
+    return number
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INUTILIZAÇÃO
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _ranges(numbers):
+    """[3, 4, 5, 9] → [(3, 5), (9, 9)]"""
+    ranges = []
+    for number in sorted(numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return [tuple(r) for r in ranges]
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'JOB_STALE_AFTER', 600))
+
+
+def _unused(business_id, modelo, serie, start, end, skip=()):
+    """
+    Números de start..end sem Invoice (nem dentro das faixas `skip`).
+    Qualquer Invoice conta como uso, seja qual for o status (rascunho,
+    rejeitada, cancelada...).
+    """
+    used = set(
+        Invoice.objects.filter(
+            order__business_id=business_id, model=modelo, serie=serie,
+            number__range=(start, end),
+        ).values_list('number', flat=True)
+    )
+    return [
+        n for n in range(start, end + 1)
+        if n not in used and not any(s <= n <= e for s, e in skip)
+    ]
+
+
+def _record_voids(business_id, modelo, serie, numbers):
+    return FiscalNumberVoid.objects.bulk_create([
+        FiscalNumberVoid(
+            business_id=business_id, model=modelo, serie=serie,
+            start=start, end=end, justification=JUSTIFICATIVA,
+        )
+        for start, end in _ranges(numbers)
+    ])
+
+
+def find_unused_numbers(now=None):
+    """
+    Registra para inutilização os números entregues que ficaram sem NF.
+    Inutilizar não tem volta, então só entra número entregue há mais de
+    JOB_STALE_AFTER (a NF que o usa grava depois, na 'default'):
+      - sobras dos blocos fechados há mais de JOB_STALE_AFTER (abertos
+        há mais que o TTL + JOB_STALE_AFTER são fechados antes);
+      - buracos da sequência fora de blocos: a varredura marca o topo
+        (scan_through) com a hora (scanned_at) e só confere até essa
+        marca quando ela já tem mais de JOB_STALE_AFTER.
+
+    Retorna a lista de FiscalNumberVoid criados.
+    """
+    now    = now or timezone.now()
+    margin = now - _stale_after()
+
+    FiscalNumberBlock.objects.filter(
+        status=FiscalNumberBlock.Status.OPEN, created_at__lt=margin - _block_ttl(),
+    ).update(status=FiscalNumberBlock.Status.CLOSED, closed_at=now)
+
+    created = []
+
+    for block in FiscalNumberBlock.objects.filter(
+        status=FiscalNumberBlock.Status.CLOSED, closed_at__lte=margin,
+    ):
+        with transaction.atomic():
+            unused = _unused(block.business_id, block.model, block.serie, block.start, block.end)
+            created += _record_voids(block.business_id, block.model, block.serie, unused)
+
+            block.status = FiscalNumberBlock.Status.CHECKED
+            block.save(update_fields=['status'])
+
+    for sequence in FiscalNumberSequence.objects.all():
+        if sequence.scanned_at and sequence.scanned_at > margin:
+            continue  # marca ainda recente: NF desses números pode estar gravando
+
+        start, end = sequence.checked_through + 1, sequence.scan_through
+
+        with transaction.atomic():
+            if sequence.scanned_at and end >= start:
+                blocks = FiscalNumberBlock.objects.filter(
+                    business_id=sequence.business_id, model=sequence.model, serie=sequence.serie,
+                    start__lte=end, end__gte=start,
+                ).values_list('start', 'end')
+
+                unused = _unused(
+                    sequence.business_id, sequence.model, sequence.serie, start, end, skip=list(blocks),
+                )
+                created += _record_voids(sequence.business_id, sequence.model, sequence.serie, unused)
+                sequence.checked_through = end
+
+            # Nova marca: o que foi entregue até agora, conferido na próxima
+            # execução depois de JOB_STALE_AFTER
+            sequence.scan_through = sequence.last_number
+            sequence.scanned_at   = now
+            sequence.save(update_fields=['checked_through', 'scan_through', 'scanned_at'])
+
+    return created
+
+
+def inutilizar_pendentes(limit=50, max_attempts=5):
+    """Envia à SEFAZ as inutilizações pendentes (ou com erro). Retorna (ok, erro)."""
+    from core.services.fiscal.sefaz_client import inutilizar
+
+    ok = erro = 0
+    pending = (
+        FiscalNumberVoid.objects
+        .filter(
+            status__in=[FiscalNumberVoid.Status.PENDING, FiscalNumberVoid.Status.ERROR],
+            attempts__lt=max_attempts,
+        )
+        .select_related('business')
+        .order_by('id')[:limit]
+    )
+
+    for void in pending:
+        # Última conferência antes do envio (irreversível): NF gravada na
+        # faixa depois do registro tira esses números da inutilização
+        unused = _unused(void.business_id, void.model, void.serie, void.start, void.end)
+        if len(unused) != void.end - void.start + 1:
+            void.status         = FiscalNumberVoid.Status.ERROR
+            void.attempts       = max_attempts
+            void.return_message = 'Faixa com NF emitida após o registro; refeita só com os números sem NF.'
+            void.processed_at   = timezone.now()
+            void.save(update_fields=['status', 'attempts', 'return_message', 'processed_at'])
+            _record_voids(void.business_id, void.model, void.serie, unused)
+            erro += 1
+            continue
+
+        ret = inutilizar(void.business, void.model, void.serie, void.start, void.end, void.justification)
+
+        void.attempts      += 1
+        void.status         = FiscalNumberVoid.Status.DONE if ret['sucesso'] else FiscalNumberVoid.Status.ERROR
+        void.protocol       = ret['protocolo']
+        void.return_code    = ret['codigo']
+        void.return_message = ret['mensagem']
+        void.xml_return     = ret['xml_ret']
+        void.processed_at   = timezone.now()
+        void.save(update_fields=[
+            'attempts', 'status', 'protocol', 'return_code',
+            'return_message', 'xml_return', 'processed_at',
+        ])
+
+        if ret['sucesso']:
+            ok += 1
+        else:
+            erro += 1
+
+    return ok, erro
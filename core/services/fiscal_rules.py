@@ -11,16 +11,19 @@ Fluxo:
   5. Calcula bases e valores de ICMS, PIS e COFINS
   6. Grava tudo no OrderItem
   7. Atualiza nature_operation e cfop no cabeçalho Orders
+
+Passos 3 e 4 consultam o índice compilado em memória
+(services/fiscal_index.py), sem ler as regras do banco, e o resultado
+fica memorizado no índice por NCM / modelo / UFs / origem do produto.
 """
 
 from decimal import Decimal, ROUND_HALF_UP
 from core.models import (
     FiscalOperation,
-    NCMGroupItem,
-    ICMSOriginDestination,
     OrderItem,
     Orders,
 )
+from core.services.fiscal_index import get_fiscal_index
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -57,42 +60,90 @@ def apply_fiscal_rules(order_item: OrderItem, raise_on_missing: bool = False) ->
     False → regra não encontrada (campos fiscais zerados/limpos)
     """
 
+    order: Orders = order_item.order
+    index, icms_matrix = get_fiscal_index(order.business_id)
+
+    operation = _resolve_item(order_item, index, icms_matrix, raise_on_missing)
+    if not operation:
+        return False
+
+    # ── 9. Atualiza cabeçalho do pedido ──────────────────────────────────────
+    _update_order_header(order, operation)
+
+    return True
+
+
+def apply_fiscal_rules_bulk(order: Orders, items, raise_on_missing: bool = False,
+                            save: bool = True) -> list:
+    """
+    Mesma regra de apply_fiscal_rules para vários itens do mesmo pedido:
+    índice carregado uma vez e cabeçalho do pedido gravado no máximo uma vez.
+    Nada é salvo nos itens — quem chama persiste em lote. save=False também
+    deixa o cabeçalho só em memória (pedido ainda não gravado, ex.: ingestão).
+
+    Retorna a lista de itens sem regra fiscal (campos limpos).
+    """
+    index, icms_matrix = get_fiscal_index(order.business_id)
+
+    missing        = []
+    header_changed = []
+
+    for order_item in items:
+        order_item.order = order
+        operation = _resolve_item(order_item, index, icms_matrix, raise_on_missing)
+
+        if not operation:
+            missing.append(order_item)
+        elif not header_changed:
+            # Só em memória: os próximos itens já enxergam o document_model
+            header_changed = _update_order_header(order, operation, save=False)
+
+    if header_changed and save:
+        order.save(update_fields=header_changed)
+
+    return missing
+
+
+def _resolve_item(order_item: OrderItem, index, icms_matrix, raise_on_missing: bool):
+    """
+    Passos 1–8: acha a operação e grava os campos fiscais no item (em memória).
+    Retorna a FiscalOperation, ou None se não há regra.
+    """
     order: Orders = order_item.order
     business = order.business
     product = order_item.variant.product
 
     # ── 1. NCM do produto ────────────────────────────────────────────────────
-    ncm = product.ncm
-    if not ncm:
+    ncm_id = product.ncm_id
+    if not ncm_id:
         _clear_fiscal_fields(order_item)
         if raise_on_missing:
             raise FiscalRuleNotFound(
                 f'Produto "{product.name}" não possui NCM cadastrado.'
             )
-        return False
-
-    # ── 2. Modelo do documento (55 = NF-e, 65 = NFC-e) ──────────────────────
-    doc_model = order.document_model  # '55' ou '65' (pode ser None)
+        return None
 
-    # ── 3. Localiza FiscalOperation ──────────────────────────────────────────
-    operation = _find_operation(business, ncm, doc_model)
+    # ── 2–3. FiscalOperation + alíquota ICMS (memorizadas no índice) ────────
+    operation, icms_rate = _resolve_rule(index, icms_matrix, business, order, product)
 
     if not operation:
         _clear_fiscal_fields(order_item)
         if raise_on_missing:
             raise FiscalRuleNotFound(
-                f'Nenhuma operação fiscal encontrada para NCM {ncm.code} '
-                f'no modelo {doc_model or "qualquer"}.'
+                f'Nenhuma operação fiscal encontrada para NCM {product.ncm.code} '
+                f'no modelo {order.document_model or "qualquer"}.'
             )
-        return False
+        return None
 
     # ── 4. Base de cálculo = subtotal do item ────────────────────────────────
     base_value = _calc_base(order_item)
 
     # ── 5. ICMS ──────────────────────────────────────────────────────────────
-    icms_rate, icms_base, icms_value = _calc_icms(
-        operation, business, order, product, base_value
-    )
+    if icms_rate is None:
+        icms_rate = icms_base = icms_value = Decimal('0.00')
+    else:
+        icms_base  = base_value
+        icms_value = _calc_tax(icms_base, icms_rate)
 
     # ── 6. PIS ───────────────────────────────────────────────────────────────
     pis_value = _calc_tax(base_value, operation.pis_rate)
@@ -102,7 +153,7 @@ def apply_fiscal_rules(order_item: OrderItem, raise_on_missing: bool = False) ->
 
     # ── 8. Grava no OrderItem ────────────────────────────────────────────────
     order_item.cfop       = operation.cfop
-    order_item.ncm        = ncm.code
+    order_item.ncm        = index.ncm_codes[ncm_id]
 
     # ICMS
     order_item.icms_cst   = operation.icms_cst
@@ -121,51 +172,13 @@ def apply_fiscal_rules(order_item: OrderItem, raise_on_missing: bool = False) ->
     order_item.cofins_rate  = operation.cofins_rate
     order_item.cofins_value = cofins_value
 
-    # ── 9. Atualiza cabeçalho do pedido ──────────────────────────────────────
-    _update_order_header(order, operation)
-
-    return True
+    return operation
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # HELPERS INTERNOS
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _find_operation(business, ncm, doc_model):
-    """
-    Retorna a primeira FiscalOperation ativa do business cujo NCMGroup
-    contém o NCM do produto.
-
-    Prioridade:
-      1. Operação com model == doc_model (ex: '55' ou '65')
-      2. Qualquer operação ativa (fallback)
-    """
-
-    # NCMs dos grupos que contêm este NCM para este business
-    group_ids = NCMGroupItem.objects.filter(
-        ncm=ncm,
-        group__business=business
-    ).values_list('group_id', flat=True)
-
-    if not group_ids:
-        return None
-
-    qs = FiscalOperation.objects.filter(
-        business=business,
-        ncm_group_id__in=group_ids,
-        active=True
-    )
-
-    # Tenta encontrar com o modelo exato primeiro
-    if doc_model:
-        exact = qs.filter(model=doc_model).first()
-        if exact:
-            return exact
-
-    # Fallback: qualquer operação ativa para o NCM
-    return qs.first()
-
-
 def _calc_base(order_item: OrderItem) -> Decimal:
     """Retorna a base de cálculo (subtotal do item)."""
     qty   = Decimal(str(order_item.quantity))
@@ -175,48 +188,59 @@ def _calc_base(order_item: OrderItem) -> Decimal:
     return (qty * price) - disc + add
 
 
-def _calc_icms(operation, business, order, product, base_value):
+def _resolve_rule(index, icms_matrix, business, order, product):
     """
-    Calcula alíquota, base e valor do ICMS.
+    Operação fiscal + alíquota ICMS de um item, memorizadas no índice da
+    empresa por (NCM, modelo, UF origem, UF destino, origem do produto).
+    Itens e prévias repetidos não resolvem a regra de novo; o memo é
+    descartado junto com o índice quando as regras mudam.
 
-    - Se operation.calculate_icms == False → retorna zeros
-    - Se operation.use_origin_destination_table == True → busca em ICMSOriginDestination
-    - Caso contrário → usa 0% (operação não tributada ou regime Simples)
+    Retorna (operação, alíquota) — alíquota None = ICMS não calculado.
     """
+    doc_model         = order.document_model  # '55' ou '65' (pode ser None)
+    destination_state = _get_destination_state(order)
+    key = (product.ncm_id, doc_model, business.state, destination_state, product.origin)
 
-    zero = (Decimal('0.00'), Decimal('0.00'), Decimal('0.00'))
+    rule = index.rules.get(key)
+    if rule is None:
+        operation = index.find_operation(product.ncm_id, doc_model)
+        rate      = (
+            _icms_rate(operation, business.state, destination_state, product, icms_matrix)
+            if operation else None
+        )
+        rule = index.rules[key] = (operation, rate)
 
+    return rule
+
+
+def _icms_rate(operation, origin_state, destination_state, product, icms_matrix):
+    """
+    Alíquota do ICMS para a operação.
+
+    - Se operation.calculate_icms == False → None (ICMS zerado)
+    - Se operation.use_origin_destination_table == True → busca na matriz
+      ICMSOriginDestination (em memória)
+    - Caso contrário → usa 0% (operação não tributada ou regime Simples)
+    """
     if not operation.calculate_icms:
-        return zero
+        return None
 
     rate = Decimal('0.00')
 
     if operation.use_origin_destination_table:
-        origin_state      = business.state
-        destination_state = _get_destination_state(order)
-        is_imported       = product.origin not in ('0', '3', '4', '5')
-
-        try:
-            icms_rule = ICMSOriginDestination.objects.get(
-                origin_state=origin_state,
-                destination_state=destination_state,
-                imported=is_imported
-            )
+        is_imported = product.origin not in ('0', '3', '4', '5')
+        icms_rule   = icms_matrix.get(origin_state, destination_state, is_imported)
+
+        if icms_rule:
+            internal_rate, interstate_rate = icms_rule
             # Para operações internas usa alíquota interna;
             # para interestaduais usa a interestadual
             if origin_state == destination_state:
-                rate = icms_rule.internal_rate
+                rate = internal_rate
             else:
-                rate = icms_rule.interstate_rate
-
-        except ICMSOriginDestination.DoesNotExist:
-            # Se não encontrou na tabela, retorna zero sem quebrar
-            rate = Decimal('0.00')
-
-    icms_base  = base_value
-    icms_value = _calc_tax(icms_base, rate)
+                rate = interstate_rate
 
-    return rate, icms_base, icms_value
+    return rate
 
 
 def _get_destination_state(order: Orders) -> str:
@@ -241,6 +265,15 @@ def _calc_tax(base: Decimal, rate: Decimal) -> Decimal:
     return value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
 
+# Campos fiscais gravados por _resolve_item (para bulk_update)
+FISCAL_FIELDS = [
+    'cfop', 'ncm',
+    'icms_cst', 'icms_csosn', 'icms_rate', 'icms_base', 'icms_value',
+    'pis_cst', 'pis_rate', 'pis_value',
+    'cofins_cst', 'cofins_rate', 'cofins_value',
+]
+
+
 def _clear_fiscal_fields(order_item: OrderItem):
     """Zera todos os campos fiscais quando não há regra aplicável."""
     order_item.cfop         = None
@@ -261,27 +294,27 @@ def _clear_fiscal_fields(order_item: OrderItem):
     order_item.cofins_value = Decimal('0.00')
 
 
-def _update_order_header(order: Orders, operation: FiscalOperation):
+def _update_order_header(order: Orders, operation: FiscalOperation, save: bool = True) -> list:
     """
     Atualiza nature_operation e cfop no cabeçalho do pedido
     apenas se ainda não estiverem preenchidos.
+    Retorna os campos alterados (save=False deixa a gravação para quem chama).
     """
-    changed = False
+    changed = []
 
     if not order.nature_operation:
         order.nature_operation = operation.name
-        changed = True
+        changed.append('nature_operation')
 
     if not order.cfop:
         order.cfop = operation.cfop
-        changed = True
+        changed.append('cfop')
 
     if not order.document_model:
         order.document_model = operation.model
-        changed = True
+        changed.append('document_model')
+
+    if changed and save:
+        order.save(update_fields=changed)
 
-    if changed:
-        order.save(update_fields=[
-            f for f in ['nature_operation', 'cfop', 'document_model']
-            if changed
-        ])
\ No newline at end of file
+    return changed
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+services/jobs.py
+
+Fila de tarefas em segundo plano sobre a tabela Job.
+
+  - @task('nome')      registra a função que executa o passo
+  - enqueue(...)       grava o Job na transação de quem chama
+  - claim_jobs(...)    worker reserva um lote (FOR UPDATE SKIP LOCKED)
+  - run_job(job_id)    executa, conclui ou reagenda com espera crescente
+
+Cada passo roda numa transação junto com a própria conclusão do Job e o
+enfileiramento do próximo passo da cadeia: ou tudo grava, ou nada.
+"""
+
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.models import Job
+
+
+# nome → função(job) que devolve um texto de resultado (ou None)
+_TASKS = {}
+
+
+class PermanentJobError(Exception):
+    """Falha que não adianta repetir (ex.: rejeição da SEFAZ)."""
+
+
+class RetryJob(Exception):
+    """Falha temporária: grava o que o passo fez e tenta de novo mais tarde."""
+
+
+class StopChain(Exception):
+    """Passo concluído, mas a cadeia termina aqui (ex.: pedido sem NF)."""
+
+
+def task(name):
+    def register(func):
+        _TASKS[name] = func
+        return func
+    return register
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, 'JOB_RETRY_DELAY', 30)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'JOB_STALE_AFTER', 600))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ENFILEIRAR
+# ─────────────────────────────────────────────────────────────────────────────
+
+def build_job(task_name, order=None, business=None, payload=None, chain=None, max_attempts=3):
+    if business is None and hasattr(order, 'business_id'):
+        business = order.business_id
+    return Job(
+        task=task_name,
+        order_id=getattr(order, 'pk', order),
+        business_id=getattr(business, 'pk', business),
+        payload=payload or {},
+        chain=list(chain or []),
+        max_attempts=max_attempts,
+    )
+
+
+def enqueue(task_name, order=None, business=None, payload=None, chain=None, max_attempts=3):
+    """
+    Enfileira `task_name` (seguido dos passos de `chain`). O Job entra na
+    transação corrente: o worker só o enxerga depois do commit.
+    """
+    job = build_job(task_name, order, business, payload, chain, max_attempts)
+    job.save()
+    return job
+
+
+def enqueue_many(jobs):
+    """Vários Jobs (de build_job) num único INSERT."""
+    return Job.objects.bulk_create(jobs, batch_size=500)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# WORKER
+# ─────────────────────────────────────────────────────────────────────────────
+
+def claim_jobs(worker_id, limit=10):
+    """
+    Reserva até `limit` jobs prontos para este worker. Linhas já travadas
+    por outro worker são puladas (SKIP LOCKED); RUNNING antigo demais
+    (worker morto) volta para a fila.
+    """
+    now   = timezone.now()
+    ready = (
+        Q(status=Job.Status.PENDING, run_at__lte=now) |
+        Q(status=Job.Status.RUNNING, locked_at__lt=now - _stale_after())
+    )
+
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(ready)
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            Job.objects.filter(id__in=ids).update(
+                status=Job.Status.RUNNING,
+                locked_at=now,
+                locked_by=worker_id,
+                attempts=F('attempts') + 1,
+            )
+    return ids
+
+
+def _done(job, result):
+    job.status      = Job.Status.DONE
+    job.result      = result or ''
+    job.last_error  = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'last_error', 'payload', 'finished_at'])
+
+
+def _fail(job, error, retry=True):
+    """Reagenda com espera crescente ou marca como falha definitiva."""
+    job.last_error = ''.join(traceback.format_exception_only(type(error), error)).strip()
+
+    if retry and job.attempts < job.max_attempts:
+        job.status = Job.Status.PENDING
+        job.run_at = timezone.now() + _retry_delay(job.attempts)
+    else:
+        job.status      = Job.Status.FAILED
+        job.finished_at = timezone.now()
+
+    job.locked_at = None
+    job.save(update_fields=['status', 'run_at', 'last_error', 'locked_at', 'finished_at'])
+
+
+def run_job(job_id):
+    """
+    Executa um job já reservado. Retorna o status final.
+
+    RetryJob / PermanentJobError mantêm o que o passo gravou (ex.: log de
+    rejeição da SEFAZ); qualquer outra exceção desfaz o passo e reagenda.
+    """
+    job  = Job.objects.select_related('order').get(pk=job_id)
+    func = _TASKS.get(job.task)
+
+    try:
+        with transaction.atomic():
+            try:
+                if func is None:
+                    raise PermanentJobError(f'Tarefa desconhecida: {job.task}')
+                result = func(job)
+
+            except StopChain as e:
+                _done(job, str(e))
+            except RetryJob as e:
+                _fail(job, e, retry=True)
+            except PermanentJobError as e:
+                _fail(job, e, retry=False)
+
+            else:
+                _done(job, result)
+
+                # 🔹 Próximo passo da cadeia, na mesma transação
+                if job.chain:
+                    enqueue(
+                        job.chain[0], order=job.order_id, business=job.business_id,
+                        payload=job.payload, chain=job.chain[1:], max_attempts=job.max_attempts,
+                    )
+
+    except Exception as e:
+        _fail(job, e, retry=True)
+
+    return job.status
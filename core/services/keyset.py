@@ -0,0 +1,68 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CURSOR (KEYSET) PARA PAGINAÇÃO
+# ─────────────────────────────────────────────────────────────────────────────
+
+def encode_cursor(*values):
+    """Empacota a chave da última linha da página num token opaco para a URL."""
+    raw = '|'.join(str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size, parsers=None):
+    """
+    Desempacota o token de encode_cursor. Retorna a lista de valores
+    (strings, ou convertidos por `parsers`, um por posição) ou None se o
+    token for inválido/adulterado — inclusive valor que o parser rejeita
+    (ex.: data impossível), tratado como cursor ausente.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if len(values) != size:
+        return None
+
+    if parsers:
+        try:
+            values = [parse(value) for parse, value in zip(parsers, values)]
+        except (ValueError, TypeError):
+            return None
+        if any(value is None for value in values):
+            return None
+
+    return values
+
+
+def keyset_page(qs, cursor, page_size, field='created_at'):
+    """
+    Página de `qs` em ordem decrescente de (field, id), começando depois
+    da chave do cursor. Sem COUNT nem OFFSET: cada página é uma faixa do
+    índice que termina em (field, id).
+
+    Retorna (linhas, próximo_cursor).
+    """
+    key = decode_cursor(cursor, 2, parsers=(parse_datetime, int))
+    if key:
+        last_value, last_id = key
+        qs = qs.filter(
+            Q(**{f'{field}__lt': last_value}) |
+            Q(**{field: last_value, 'id__lt': last_id})
+        )
+
+    rows = list(qs.order_by(f'-{field}', '-id')[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(getattr(rows[-1], field).isoformat(), rows[-1].id)
+
+    return rows, next_cursor
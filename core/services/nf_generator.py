@@ -21,6 +21,7 @@ from core.models import (
     Invoice, InvoiceItem, InvoicePayment, InvoiceTransport,
     InvoiceLog, InvoiceStatus,
 )
+from core.services.fiscal_numbers import take_number
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -32,26 +33,14 @@ def _gerar_codigo_nf() -> str:
     return ''.join(random.choices(string.digits, k=8))
 
 
-def _proximo_numero(business, modelo) -> int:
+def _proximo_numero(business, modelo, serie) -> int:
     """
-    Incrementa atomicamente o último número emitido em Business.
-    nfe_last_number / nfce_last_number — já existem no model Business.
-    O número da NF é last_number + 1.
+    Número da NF pela FiscalNumberSequence (empresa / modelo / série),
+    incrementada numa transação curta própria — sem travar Business até o
+    fim da geração. Em worker com blocos ativos (NFC-e) sai do bloco.
+    Número que não virar NF (rollback) é inutilizado depois.
     """
-    from core.models import Business
-    # select_for_update garante sem duplicidade em ambiente concorrente
-    biz = Business.objects.select_for_update().get(pk=business.pk)
-
-    if modelo == '55':
-        numero = biz.nfe_last_number + 1
-        biz.nfe_last_number = numero
-        biz.save(update_fields=['nfe_last_number'])
-    else:
-        numero = biz.nfce_last_number + 1
-        biz.nfce_last_number = numero
-        biz.save(update_fields=['nfce_last_number'])
-
-    return numero
+    return take_number(business, modelo, serie)
 
 
 def _serie(business, modelo: str) -> str:
@@ -141,15 +130,15 @@ def _snapshot_destinatario(order) -> dict:
 # GERAÇÃO DOS ITENS (OrderItem → InvoiceItem)
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _gerar_itens(invoice: Invoice, order):
+def _gerar_itens(order_items) -> list:
     """
-    Converte cada OrderItem em InvoiceItem.
+    Converte cada OrderItem em InvoiceItem, só em memória (sem invoice):
+    quem chama soma os totais e grava tudo num bulk_create.
     Os campos fiscais (icms_cst, icms_csosn, icms_rate, etc.) já estão
     preenchidos pelo apply_fiscal_rules quando o pedido foi salvo.
     """
-    for idx, item in enumerate(order.items.select_related(
-        'variant', 'variant__product', 'variant__product__ncm'
-    ).order_by('id'), start=1):
+    itens = []
+    for idx, item in enumerate(order_items, start=1):
 
         variant = item.variant
         product = variant.product if variant else None
@@ -161,8 +150,7 @@ def _gerar_itens(invoice: Invoice, order):
         acrescimo  = Decimal(str(item.addition or 0))
         total_bruto = (qtd * preco).quantize(Decimal('0.01'))
 
-        InvoiceItem.objects.create(
-            invoice      = invoice,
+        itens.append(InvoiceItem(
             order_item   = item,
             item_number  = idx,
 
@@ -201,7 +189,9 @@ def _gerar_itens(invoice: Invoice, order):
             cofins_bc    = Decimal(str(item.subtotal)),
             cofins_rate  = Decimal(str(item.cofins_rate or 0)),
             cofins_value = Decimal(str(item.cofins_value or 0)),
-        )
+        ))
+
+    return itens
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -221,9 +211,9 @@ def _gerar_pagamentos(invoice: Invoice, order):
         15: '15', 16: '16', 17: '17', 90: '90', 99: '99',
     }
 
-    pagamentos = order.payments.select_related('payment_method').all()
+    pagamentos = list(order.payments.select_related('payment_method').order_by('id'))
 
-    if not pagamentos.exists():
+    if not pagamentos:
         # Fallback: pagamento "Outros" com valor total
         InvoicePayment.objects.create(
             invoice      = invoice,
@@ -232,16 +222,19 @@ def _gerar_pagamentos(invoice: Invoice, order):
         )
         return
 
+    registros = []
     for pag in pagamentos:
         payment_type = pag.payment_method.payment_type if pag.payment_method else 99
         codigo = type_map.get(payment_type, '99')
 
-        InvoicePayment.objects.create(
+        registros.append(InvoicePayment(
             invoice       = invoice,
             order_payment = pag,
             payment_code  = codigo,
             value         = Decimal(str(pag.total_value)),
-        )
+        ))
+
+    InvoicePayment.objects.bulk_create(registros)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -262,14 +255,29 @@ def _gerar_transporte(invoice: Invoice, order):
 # CÁLCULO DOS TOTAIS
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _calcular_totais(invoice: Invoice):
-    """Soma os itens e atualiza os totais do cabeçalho da Invoice."""
-    from django.db.models import Sum
+TOTAL_FIELDS = [
+    'total_products', 'total_discount', 'total_freight', 'total_insurance',
+    'total_other', 'total_bc_icms', 'total_icms', 'total_bc_st',
+    'total_icms_st', 'total_pis', 'total_cofins', 'total_nf',
+]
+
 
-    itens = invoice.items.all()
+def _calcular_totais(invoice: Invoice, itens=None):
+    """
+    Soma os itens em Python e preenche os totais do cabeçalho da Invoice
+    (sem gravar — ver TOTAL_FIELDS). Cada valor é arredondado nas casas
+    do campo, como ficaria gravado, antes de somar.
+    Sem `itens`, lê os itens já gravados numa única consulta.
+    """
+    if itens is None:
+        itens = list(invoice.items.all())
 
     def soma(campo):
-        return itens.aggregate(t=Sum(campo))['t'] or Decimal('0')
+        casas = Decimal(1).scaleb(-InvoiceItem._meta.get_field(campo).decimal_places)
+        return sum(
+            (Decimal(str(getattr(i, campo) or 0)).quantize(casas) for i in itens),
+            Decimal('0'),
+        )
 
     total_produtos = soma('gross_total') - soma('discount') + soma('addition')
     total_icms     = soma('icms_value')
@@ -298,12 +306,6 @@ def _calcular_totais(invoice: Invoice):
     invoice.total_cofins   = total_cofins
     invoice.total_nf       = total_nf
 
-    invoice.save(update_fields=[
-        'total_products', 'total_discount', 'total_freight', 'total_insurance',
-        'total_other', 'total_bc_icms', 'total_icms', 'total_bc_st',
-        'total_icms_st', 'total_pis', 'total_cofins', 'total_nf',
-    ])
-
 
 # ─────────────────────────────────────────────────────────────────────────────
 # FUNÇÃO PRINCIPAL
@@ -347,7 +349,11 @@ def gerar_nota_fiscal(order, usuario=None) -> Invoice:
             f'NF {nf_existente.serie}/{nf_existente.number}'
         )
 
-    if not order.items.exists():
+    order_items = list(order.items.select_related(
+        'variant', 'variant__product', 'variant__product__ncm'
+    ).order_by('id'))
+
+    if not order_items:
         raise ValueError('O pedido não possui itens.')
 
     business = order.business
@@ -357,14 +363,16 @@ def gerar_nota_fiscal(order, usuario=None) -> Invoice:
     # business._nfe_model = modelo
 
     serie  = _serie(business, modelo)
-    numero = _proximo_numero(business, modelo)
+    numero = _proximo_numero(business, modelo, serie)
 
     # ── Snapshot emitente + destinatário ──────────────────────────────────
     emit = _snapshot_emitente(business)
     dest = _snapshot_destinatario(order)
 
-    # ── Cria o cabeçalho da Invoice ───────────────────────────────────────
-    invoice = Invoice.objects.create(
+    # ── Itens em memória → totais já no INSERT do cabeçalho ──────────────
+    itens = _gerar_itens(order_items)
+
+    invoice = Invoice(
         order              = order,
         model              = modelo,
         serie              = serie,
@@ -381,10 +389,14 @@ def gerar_nota_fiscal(order, usuario=None) -> Invoice:
         **emit,
         **dest,
     )
+    _calcular_totais(invoice, itens)
+    invoice.save()
 
     # ── Gera os filhos ────────────────────────────────────────────────────
-    _gerar_itens(invoice, order)
-    _calcular_totais(invoice)
+    for item in itens:
+        item.invoice = invoice
+    InvoiceItem.objects.bulk_create(itens, batch_size=500)
+
     _gerar_transporte(invoice, order)
     _gerar_pagamentos(invoice, order)
 
@@ -409,4 +421,5 @@ def gerar_nota_fiscal(order, usuario=None) -> Invoice:
 
 def recalcular_totais(invoice: Invoice):
     """Permite recalcular totais após edição manual dos itens da NF."""
-    _calcular_totais(invoice)
\ No newline at end of file
+    _calcular_totais(invoice)
+    invoice.save(update_fields=TOTAL_FIELDS)
\ No newline at end of file
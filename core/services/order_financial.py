@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import FinancialMovement, FinancialMovementParcel, OrderPayment, split_installments
+from core.services.bulk import bulk_create_with_pks
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FINANCEIRO DO FATURAMENTO (em lote)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _fallback_parcels(payment, today):
+    """Parcelas geradas na hora quando o pagamento não tem OrderPaymentParcel."""
+    for i, value in enumerate(split_installments(payment.total_value, payment.parcels)):
+        due = today + timedelta(days=(i + 1) * (payment.interval_days or 30))
+        yield i + 1, value, due
+
+
+@transaction.atomic
+def generate_financial_bulk(orders):
+    """
+    Cria FinancialMovement + FinancialMovementParcel de cada OrderPayment
+    dos pedidos, com as datas de OrderPaymentParcel (fallback: parcelas
+    calculadas na hora).
+
+    Idempotente por pedido: quem já tem movimento financeiro é ignorado.
+    Número de consultas fixo, independente da quantidade de pedidos.
+    """
+    orders = {order.id: order for order in orders}
+    if not orders:
+        return
+
+    done = set(
+        FinancialMovement.objects.filter(order_id__in=orders)
+        .values_list('order_id', flat=True)
+    )
+    pending = [oid for oid in orders if oid not in done]
+    if not pending:
+        return
+
+    payments = list(
+        OrderPayment.objects.filter(order_id__in=pending)
+        .prefetch_related('parcels_records')
+        .order_by('order_id', 'id')
+    )
+    if not payments:
+        return
+
+    movements = []
+    for payment in payments:
+        order = orders[payment.order_id]
+        movements.append(FinancialMovement(
+            business_id=order.business_id,
+            client_id=order.client_id,
+            order_id=order.id,
+            bank_id=payment.bank_id,
+            payment_method_id=payment.payment_method_id,
+            type='in',
+            expense_type=1,  # Variável (mesmo padrão da migração 0025)
+            total_value=payment.total_value,
+            description=f'Pedido #{order.id}',
+        ))
+
+    # Só há movimentos destes pedidos criados agora (os demais foram pulados)
+    bulk_create_with_pks(movements, refetch=FinancialMovement.objects.filter(order_id__in=pending))
+
+    today   = timezone.now().date()
+    parcels = []
+    for payment, movement in zip(payments, movements):
+        records = payment.parcels_records.all()
+        if records:
+            # Usa as parcelas reais (com datas que o usuário definiu)
+            rows = ((p.parcel_number, p.value, p.due_date) for p in records)
+        else:
+            rows = _fallback_parcels(payment, today)
+
+        for number, value, deadline in rows:
+            parcels.append(FinancialMovementParcel(
+                movement_id=movement.pk,
+                parcel=number,
+                value=value,
+                deadline=deadline,
+            ))
+
+    FinancialMovementParcel.objects.bulk_create(parcels, batch_size=1000)
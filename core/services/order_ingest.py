@@ -0,0 +1,210 @@
+"""
+services/order_ingest.py
+
+Ingestão de pedidos em lote (API de integração / marketplace).
+
+Todas as consultas são por lote, não por pedido:
+  - variantes por SKU ou EAN13            → 1 consulta
+  - clientes por id ou documento          → 1 consulta
+  - formas de pagamento / contas          → 1 consulta cada
+  - regras fiscais                        → índice em memória
+  - pedidos, itens, pagamentos, parcelas  → bulk_create
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+from core.models import (
+    Orders, OrderItem, OrderPayment, OrderPaymentParcel, ProductVariant,
+    Client, PaymentMethod, BankAccount,
+)
+from core.services.bulk import bulk_create_with_pks
+from core.services.fiscal_rules import apply_fiscal_rules_bulk
+from core.services.order_stats import track_orders_created
+
+
+def _lookup(business, orders):
+    """Carrega de uma vez tudo o que os pedidos referenciam."""
+    skus, eans, client_ids, documents, method_ids, bank_ids = set(), set(), set(), set(), set(), set()
+
+    for data in orders:
+        if data.get('client'):
+            client_ids.add(data['client'])
+        if data.get('client_document'):
+            documents.add(data['client_document'])
+        for item in data['items']:
+            if item.get('sku'):
+                skus.add(item['sku'])
+            if item.get('ean13'):
+                eans.add(item['ean13'])
+        for payment in data.get('payments', []):
+            if payment.get('payment_method'):
+                method_ids.add(payment['payment_method'])
+            if payment.get('bank'):
+                bank_ids.add(payment['bank'])
+
+    by_sku, by_ean = {}, {}
+    if skus or eans:
+        for variant in (
+            ProductVariant.objects
+            .filter(product__business=business)
+            .filter(Q(sku__in=skus) | Q(ean13__in=eans))
+            .select_related('product')
+        ):
+            if variant.sku:
+                by_sku[variant.sku] = variant
+            if variant.ean13:
+                by_ean[variant.ean13] = variant
+
+    clients_by_id, clients_by_doc = {}, {}
+    if client_ids or documents:
+        for client in Client.objects.filter(business=business).filter(
+            Q(id__in=client_ids) | Q(document__in=documents)
+        ):
+            clients_by_id[client.id] = client
+            if client.document:
+                clients_by_doc[client.document] = client
+
+    methods = set(
+        PaymentMethod.objects.filter(business=business, id__in=method_ids)
+        .values_list('id', flat=True)
+    ) if method_ids else set()
+
+    banks = set(
+        BankAccount.objects.filter(business=business, id__in=bank_ids)
+        .values_list('id', flat=True)
+    ) if bank_ids else set()
+
+    return by_sku, by_ean, clients_by_id, clients_by_doc, methods, banks
+
+
+def _build_order(business, data, refs):
+    """Monta (pedido, itens, pagamentos) em memória ou devolve a lista de erros."""
+    by_sku, by_ean, clients_by_id, clients_by_doc, methods, banks = refs
+    errors = []
+
+    client = None
+    if data.get('client'):
+        client = clients_by_id.get(data['client'])
+        if client is None:
+            errors.append(f'Cliente {data["client"]} não encontrado.')
+    elif data.get('client_document'):
+        client = clients_by_doc.get(data['client_document'])
+        if client is None:
+            errors.append(f'Cliente com documento {data["client_document"]} não encontrado.')
+
+    order = Orders(
+        business=business,
+        client=client,
+        status=data.get('status') or Orders.STATUS_DIGITACAO,
+        document_model=data.get('document_model') or None,
+    )
+
+    items = []
+    for index, item in enumerate(data['items']):
+        variant = by_sku.get(item.get('sku')) or by_ean.get(item.get('ean13'))
+        if variant is None:
+            errors.append(
+                f'Item {index + 1}: variante não encontrada '
+                f'(SKU {item.get("sku") or "-"} / EAN {item.get("ean13") or "-"}).'
+            )
+            continue
+        items.append(OrderItem(
+            order=order,
+            variant=variant,
+            quantity=item['quantity'],
+            price=item['price'],
+            discount=item.get('discount') or 0,
+            addition=item.get('addition') or 0,
+        ))
+
+    payments = []
+    for index, payment in enumerate(data.get('payments', [])):
+        if payment.get('payment_method') and payment['payment_method'] not in methods:
+            errors.append(f'Pagamento {index + 1}: forma de pagamento inválida.')
+        if payment.get('bank') and payment['bank'] not in banks:
+            errors.append(f'Pagamento {index + 1}: conta bancária inválida.')
+        payments.append(OrderPayment(
+            order=order,
+            payment_method_id=payment.get('payment_method'),
+            bank_id=payment.get('bank'),
+            total_value=payment['total_value'],
+            parcels=payment.get('parcels') or 1,
+            interval_days=payment.get('interval_days', 30),
+        ))
+
+    if errors:
+        return None, errors
+
+    order.total_amount = sum(
+        (Decimal(i.quantity) * i.price - i.discount + i.addition for i in items),
+        Decimal('0.00'),
+    )
+    return (order, items, payments), []
+
+
+@transaction.atomic
+def ingest_orders(business, orders):
+    """
+    Cria vários pedidos (já validados pelo serializer) de uma vez.
+
+    Pedido com referência inválida (variante, cliente, pagamento) não é
+    gravado e volta com `errors`; os demais seguem. Regras fiscais
+    aplicadas em memória antes do INSERT.
+
+    Retorna [{'index', 'external_id', 'ok', 'id', 'uid', 'errors'}].
+    """
+    refs    = _lookup(business, orders)
+    results = []
+    built   = []
+
+    for index, data in enumerate(orders):
+        result = {
+            'index': index, 'external_id': data.get('external_id') or None,
+            'ok': False, 'id': None, 'uid': None, 'errors': [],
+        }
+        results.append(result)
+
+        parts, errors = _build_order(business, data, refs)
+        if errors:
+            result['errors'] = errors
+            continue
+
+        order, items, payments = parts
+        missing = apply_fiscal_rules_bulk(order, items, raise_on_missing=False, save=False)
+        result['warnings'] = [
+            f'Item "{item.variant.product.name}": nenhuma operação fiscal encontrada.'
+            for item in missing
+        ]
+        built.append((result, order, items, payments))
+
+    if not built:
+        return results
+
+    # 🔹 Pedidos → itens/pagamentos → parcelas, um bulk_create por tabela
+    new_orders = bulk_create_with_pks([order for _, order, _, _ in built], key='uid')
+    track_orders_created(new_orders)
+
+    all_items, all_payments = [], []
+    for result, order, items, payments in built:
+        for child in items + payments:
+            child.order = order  # reatribui para copiar o pk gravado
+        all_items    += items
+        all_payments += payments
+        result.update(ok=True, id=order.pk, uid=str(order.uid))
+
+    OrderItem.objects.bulk_create(all_items, batch_size=1000)
+
+    if all_payments:
+        bulk_create_with_pks(
+            all_payments,
+            refetch=OrderPayment.objects.filter(order_id__in=[o.pk for o in new_orders]),
+        )
+        OrderPaymentParcel.objects.bulk_create(
+            [parcel for payment in all_payments for parcel in payment.build_parcels()],
+            batch_size=1000,
+        )
+
+    return results
@@ -0,0 +1,142 @@
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Orders, OrderStats
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ESTATÍSTICAS DE PEDIDOS (OrderStats)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _apply(business_id, day, status, count, total):
+    """Soma (count, total) na linha (empresa, dia, status), criando se preciso."""
+    updated = OrderStats.objects.filter(
+        business_id=business_id, date=day, status=status,
+    ).update(
+        count=F('count') + count,
+        total_amount=F('total_amount') + total,
+    )
+    if updated or count < 0:
+        # Baixa sem linha (ex.: empresa em exclusão, cascata) → nada a fazer
+        return
+
+    try:
+        with transaction.atomic():
+            OrderStats.objects.create(
+                business_id=business_id, date=day, status=status,
+                count=count, total_amount=total,
+            )
+    except IntegrityError:
+        # Criada em paralelo → agora o UPDATE acha a linha
+        _apply(business_id, day, status, count, total)
+
+
+def _add(deltas, order, state, sign):
+    key = (order.business_id, timezone.localdate(order.created_at), state['status'])
+    acc = deltas.setdefault(key, [0, Decimal('0.00')])
+    acc[0] += sign
+    acc[1] += sign * Decimal(state['total_amount'] or 0)
+
+
+def _apply_deltas(deltas):
+    for (business_id, day, status), (count, total) in sorted(deltas.items()):
+        if count or total:
+            _apply(business_id, day, status, count, total)
+
+
+def track_order_change(order, old_state, new_state):
+    """
+    Aplica no resumo a diferença entre o estado antigo e o novo do pedido.
+    old_state/new_state: {'status', 'total_amount'} ou None (inclusão/exclusão).
+    """
+    deltas = {}
+    if old_state:
+        _add(deltas, order, old_state, -1)
+    if new_state:
+        _add(deltas, order, new_state, 1)
+    _apply_deltas(deltas)
+
+
+def track_bulk_status_change(orders, new_status):
+    """
+    Resumo de uma troca de status feita com queryset.update() (sem save):
+    um UPDATE por (empresa, dia, status) envolvido, não por pedido.
+    `orders` ainda com o status antigo.
+    """
+    deltas = {}
+    for order in orders:
+        _add(deltas, order, {'status': order.status, 'total_amount': order.total_amount}, -1)
+        _add(deltas, order, {'status': new_status, 'total_amount': order.total_amount}, 1)
+    _apply_deltas(deltas)
+
+
+def track_orders_created(orders):
+    """Resumo de pedidos incluídos com bulk_create (sem Orders.save)."""
+    deltas = {}
+    for order in orders:
+        _add(deltas, order, {'status': order.status, 'total_amount': order.total_amount}, 1)
+    _apply_deltas(deltas)
+
+
+def track_order_delete(order):
+    """Remove do resumo um pedido excluído (estado lido do banco, se houver)."""
+    loaded = order._get_loaded_state()
+    old_state = {
+        name: loaded.get(name, getattr(order, name))
+        for name in Orders.TRACKED_FIELDS
+    }
+    track_order_change(order, old_state, None)
+
+
+def rebuild_order_stats(business_id=None):
+    """Recalcula o resumo a partir de Orders (usado na migração/conferência)."""
+    orders = Orders.objects.all()
+    stats  = OrderStats.objects.all()
+    if business_id:
+        orders = orders.filter(business_id=business_id)
+        stats  = stats.filter(business_id=business_id)
+
+    rows = (
+        orders
+        .annotate(day=TruncDate('created_at'))
+        .values('business_id', 'day', 'status')
+        .annotate(count=Count('id'), total=Sum('total_amount'))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        stats.delete()
+        OrderStats.objects.bulk_create([
+            OrderStats(
+                business_id=r['business_id'], date=r['day'], status=r['status'],
+                count=r['count'], total_amount=r['total'] or 0,
+            )
+            for r in rows
+        ], batch_size=1000)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LEITURA
+# ─────────────────────────────────────────────────────────────────────────────
+
+def stats_for(business, **filters):
+    """Queryset do resumo da empresa (filtros extras em date/status)."""
+    return OrderStats.objects.filter(business=business, **filters)
+
+
+def totals_by_status(business, **filters):
+    """{status: {'count', 'total'}} somando os dias do filtro."""
+    rows = (
+        stats_for(business, **filters)
+        .values('status')
+        .annotate(count=Sum('count'), total=Sum('total_amount'))
+        .order_by()
+    )
+    return {
+        r['status']: {'count': r['count'] or 0, 'total': r['total'] or Decimal('0.00')}
+        for r in rows
+    }
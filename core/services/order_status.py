@@ -0,0 +1,162 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Orders, OrderItem, StockEntry
+from core.services.faturamento import enqueue_invoice_chain
+from core.services.order_financial import generate_financial_bulk
+from core.services.order_stats import track_bulk_status_change
+from core.services.order_stock import (
+    _lock_variants, _build_entries, get_stock_levels, apply_stock_balance,
+)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TROCA DE STATUS EM LOTE
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _result(order_id, status=None, ok=False, error=None):
+    return {'id': order_id, 'ok': ok, 'status': status, 'error': error}
+
+
+def _reserve(orders, items_by_order, results):
+    """
+    Reserva do lote contra o disponível lido uma vez (com lock). Pedidos
+    em ordem de id; o que não couber falha sozinho e não consome saldo.
+    """
+    variant_ids = {i.variant_id for items in items_by_order.values() for i in items}
+    available   = {
+        vid: level['available']
+        for vid, level in get_stock_levels(variant_ids, lock=True).items()
+    }
+
+    entries, changed, ok_orders = [], [], []
+    for order in orders:
+        items     = [i for i in items_by_order.get(order.id, []) if not i.reserved]
+        requested = Counter()
+        for item in items:
+            requested[item.variant_id] += item.quantity
+
+        short = next((i for i in items if available[i.variant_id] < requested[i.variant_id]), None)
+        if short:
+            results[order.id]['error'] = (
+                f'Estoque insuficiente para {short.variant}. '
+                f'Disponível: {available[short.variant_id]}'
+            )
+            continue
+
+        for variant_id, quantity in requested.items():
+            available[variant_id] -= quantity
+        for item in items:
+            item.reserved = True
+
+        entries += _build_entries(items, None, StockEntry.MovementType.RESERVE)
+        changed += items
+        ok_orders.append(order)
+
+    return ok_orders, entries, changed
+
+
+def _release(orders, items_by_order, sale=False):
+    """Libera o reservado; com sale=True também dá a saída física (faturamento)."""
+    entries, changed = [], []
+    for order in orders:
+        items    = items_by_order.get(order.id, [])
+        reserved = [i for i in items if i.reserved]
+
+        entries += _build_entries(reserved, None, StockEntry.MovementType.RELEASE)
+        if sale:
+            entries += _build_entries(items, 'out', StockEntry.MovementType.SALE)
+
+        for item in reserved:
+            item.reserved = False
+        changed += reserved
+
+    return list(orders), entries, changed
+
+
+@transaction.atomic
+def bulk_change_status(business, order_ids, new_status):
+    """
+    Leva vários pedidos da empresa para `new_status` de uma vez.
+
+    Cada transição é validada em Orders.STATUS_TRANSITIONS; estoque
+    (reserva / liberação / baixa) e financeiro saem em lote, com as
+    variantes de todos os pedidos travadas uma única vez. O número de
+    consultas não cresce com a quantidade de pedidos.
+
+    Retorna uma lista {'id', 'ok', 'status', 'error'} na ordem recebida.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    results   = {oid: _result(oid, error='Pedido não encontrado.') for oid in order_ids}
+
+    if new_status not in dict(Orders.STATUS_CHOICES):
+        for result in results.values():
+            result['error'] = 'Status inválido.'
+        return list(results.values())
+
+    orders = list(
+        Orders.objects.select_for_update()
+        .filter(business=business, id__in=order_ids)
+        .order_by('id')
+    )
+
+    valid = []
+    for order in orders:
+        results[order.id] = _result(order.id, status=order.status)
+        if order.can_change_status_to(new_status):
+            valid.append(order)
+        else:
+            results[order.id]['error'] = (
+                f'Não é permitido mudar de {order.get_status_display()} '
+                f'para {dict(Orders.STATUS_CHOICES).get(new_status)}'
+            )
+
+    if not valid:
+        return list(results.values())
+
+    # 🔹 Itens de todos os pedidos numa consulta + um lock único nas variantes
+    items_by_order = {}
+    items = list(
+        OrderItem.objects.filter(order_id__in=[o.id for o in valid], variant__isnull=False)
+        .select_related('variant', 'variant__product', 'variant__size', 'variant__color')
+        .order_by('id')
+    )
+    for item in items:
+        items_by_order.setdefault(item.order_id, []).append(item)
+
+    if items:
+        _lock_variants(items)
+
+    if new_status == Orders.STATUS_EM_SEPARACAO:
+        valid, entries, changed = _reserve(valid, items_by_order, results)
+    elif new_status == Orders.STATUS_CANCELADO:
+        valid, entries, changed = _release(valid, items_by_order)
+    elif new_status == Orders.STATUS_FATURADO:
+        valid, entries, changed = _release(valid, items_by_order, sale=True)
+    else:
+        entries, changed = [], []
+
+    if entries:
+        StockEntry.objects.bulk_create(entries, batch_size=1000)
+        apply_stock_balance(entries)
+    if changed:
+        OrderItem.objects.bulk_update(changed, ['reserved'], batch_size=1000)
+
+    if new_status == Orders.STATUS_FATURADO:
+        generate_financial_bulk(valid)
+        # 🔹 NF (gerar → assinar → transmitir) segue na fila
+        enqueue_invoice_chain(valid)
+
+    if valid:
+        # update() não passa por Orders.save → resumo atualizado aqui
+        track_bulk_status_change(valid, new_status)
+        Orders.objects.filter(id__in=[o.id for o in valid]).update(
+            status=new_status, updated_at=timezone.now(),
+        )
+
+    for order in valid:
+        results[order.id].update(ok=True, status=new_status, error=None)
+
+    return list(results.values())
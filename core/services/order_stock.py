@@ -5,104 +5,337 @@ from django.core.exceptions import ValidationError
 from django.db import transaction
 from core.models import StockEntry, ProductVariant, colorchart
 from django.db.models import Sum
-from core.models import generate_sku, generate_ean13 
+from core.models import generate_sku
+from core.services.ean import allocate_ean13
 from django.core.exceptions import ValidationError
-from core.models import StockEntry, ProductVariant
-from django.db.models import Sum
+from core.models import StockEntry, ProductVariant, StockBalance
+from django.db.models import Sum, F, Q, Case, When, Value, IntegerField
+from django.utils import timezone
+from core.services.stock_snapshot import adjust_stock_snapshots
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SALDO MATERIALIZADO (StockBalance)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _entry_delta(entry):
+    """Efeito de uma StockEntry no saldo: (real, reservado)."""
+    real = reserved = 0
+
+    if entry.entry_type == 'in':
+        real = entry.quantity
+    elif entry.entry_type == 'out':
+        real = -entry.quantity
+
+    if entry.movement_type == StockEntry.MovementType.RESERVE:
+        reserved = entry.quantity
+    elif entry.movement_type == StockEntry.MovementType.RELEASE:
+        reserved = -entry.quantity
+
+    return real, reserved
+
+
+BALANCE_UPDATE_CHUNK = 500
+
+
+def _delta_case(deltas, variant_ids, pick):
+    """CASE variant_id WHEN ... THEN delta: soma por variante num só UPDATE."""
+    return Case(
+        *[When(variant_id=vid, then=Value(pick(deltas[vid]))) for vid in variant_ids],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def apply_stock_balance(entries, reverse=False):
+    """
+    Aplica no StockBalance o efeito das StockEntry informadas.
+    reverse=True desfaz o efeito (usado ao excluir entradas).
+
+    Deve ser chamada na mesma transação que grava/remove as entradas.
+    Soma com F() (não perde atualizações concorrentes) num UPDATE por
+    bloco de variantes, travando as linhas em ordem de variant_id.
+    """
+    entries = list(entries)
+    deltas = {}
+    sign = -1 if reverse else 1
+
+    for entry in entries:
+        real, reserved = _entry_delta(entry)
+        acc = deltas.setdefault(entry.variant_id, [0, 0])
+        acc[0] += sign * real
+        acc[1] += sign * reserved
+
+    deltas = {vid: d for vid, d in deltas.items() if vid and d != [0, 0]}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        existing = set(
+            StockBalance.objects.filter(variant_id__in=deltas)
+            .values_list('variant_id', flat=True)
+        )
+        missing = [StockBalance(variant_id=vid) for vid in deltas if vid not in existing]
+        if missing:
+            StockBalance.objects.bulk_create(missing, ignore_conflicts=True)
+
+        # 🔹 Um UPDATE ... CASE por bloco de variantes (não um por variante)
+        now = timezone.now()
+        variant_ids = sorted(deltas)
+        for start in range(0, len(variant_ids), BALANCE_UPDATE_CHUNK):
+            chunk = variant_ids[start:start + BALANCE_UPDATE_CHUNK]
+            StockBalance.objects.filter(variant_id__in=chunk).update(
+                real=F('real') + _delta_case(deltas, chunk, lambda d: d[0]),
+                reserved=F('reserved') + _delta_case(deltas, chunk, lambda d: d[1]),
+                available=F('available') + _delta_case(deltas, chunk, lambda d: d[0] - d[1]),
+                updated_at=now,
+            )
+
+        # 🔹 Movimentação com data passada (exclusão) corrige os dias já fechados
+        adjust_stock_snapshots(entries, sign)
+
+
+def get_stock_levels(variant_ids, lock=False):
+    """
+    Estoque de várias variantes numa única consulta (StockBalance).
+    Retorna {variant_id: {'real', 'reserved', 'available'}}; variantes
+    sem movimentação voltam zeradas.
+
+    lock=True faz leitura com FOR UPDATE: enxerga o último saldo
+    confirmado (não o snapshot da transação) e segura as linhas até o commit.
+    """
+    variant_ids = list(variant_ids)
+    levels = {
+        vid: {'real': 0, 'reserved': 0, 'available': 0}
+        for vid in variant_ids
+    }
+    if not variant_ids:
+        return levels
+
+    qs = StockBalance.objects.filter(variant_id__in=variant_ids)
+    if lock:
+        qs = qs.select_for_update().order_by('variant_id')
+
+    rows = qs.values_list('variant_id', 'real', 'reserved', 'available')
+    for variant_id, real, reserved, available in rows:
+        levels[variant_id] = {'real': real, 'reserved': reserved, 'available': available}
+
+    return levels
+
+
+def sum_stock_levels(variants):
+    """
+    Soma de real/reservado/disponível de um queryset de variantes,
+    numa única consulta agregada.
+    """
+    return StockBalance.objects.filter(variant__in=variants).aggregate(
+        real=Sum('real', default=0),
+        reserved=Sum('reserved', default=0),
+        available=Sum('available', default=0),
+    )
+
+
+def ledger_stock_totals(variant_ids=None):
+    """
+    Recalcula real/reservado direto do ledger (StockEntry), numa única
+    consulta agrupada. Usado para reconstruir/conferir o StockBalance.
+    Retorna {variant_id: (real, reservado)}.
+    """
+    qs = StockEntry.objects.all()
+    if variant_ids is not None:
+        qs = qs.filter(variant_id__in=variant_ids)
+
+    rows = qs.values('variant_id').annotate(
+        total_in=Sum('quantity', filter=Q(entry_type='in'), default=0),
+        total_out=Sum('quantity', filter=Q(entry_type='out'), default=0),
+        total_reserve=Sum('quantity', filter=Q(movement_type=StockEntry.MovementType.RESERVE), default=0),
+        total_release=Sum('quantity', filter=Q(movement_type=StockEntry.MovementType.RELEASE), default=0),
+    ).order_by()
+
+    return {
+        r['variant_id']: (
+            r['total_in'] - r['total_out'],
+            r['total_reserve'] - r['total_release'],
+        )
+        for r in rows
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RESERVA / LIBERAÇÃO / BAIXA
+# ─────────────────────────────────────────────────────────────────────────────
 
+def _lock_variants(items):
+    """
+    Trava (SELECT ... FOR UPDATE) as variantes dos itens, sempre em ordem
+    de id → pedidos concorrentes disputando as mesmas variantes não
+    entram em deadlock, só esperam na fila.
+    """
+    variant_ids = sorted({item.variant_id for item in items})
+    list(
+        ProductVariant.objects.select_for_update()
+        .filter(id__in=variant_ids)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    return variant_ids
 
+
+def _fresh_reserved(items):
+    """
+    Relê com lock o `reserved` dos itens, já com as variantes travadas: o
+    valor lido antes da trava pode ter sido mudado por uma reserva/baixa
+    concorrente que terminou enquanto esperávamos. Item apagado nesse
+    meio-tempo sai da lista.
+    """
+    reserved = dict(
+        OrderItem.objects.select_for_update()
+        .filter(id__in=[item.id for item in items])
+        .order_by('id')
+        .values_list('id', 'reserved')
+    )
+    fresh = []
+    for item in items:
+        if item.id in reserved:
+            item.reserved = reserved[item.id]
+            fresh.append(item)
+    return fresh
+
+
+def _build_entries(items, entry_type, movement_type):
+    return [
+        StockEntry(
+            variant_id=item.variant_id,
+            order_item=item,
+            entry_type=entry_type,
+            movement_type=movement_type,
+            quantity=item.quantity,
+        )
+        for item in items
+    ]
+
+
+@transaction.atomic
 def reserve_stock(order):
-    for item in order.items.select_related('variant', 'variant__product'):
-        if item.reserved:
-            continue
+    items = [
+        item for item in order.items.select_related('variant', 'variant__product', 'variant__size', 'variant__color')
+        if not item.reserved and item.variant_id
+    ]
+    if not items:
+        return
+
+    _lock_variants(items)
 
-        available = item.variant.stock_available
+    items = [item for item in _fresh_reserved(items) if not item.reserved]
+    if not items:
+        return
+    variant_ids = sorted({item.variant_id for item in items})
+
+    # 🔹 Disponibilidade de todas as variantes numa consulta (leitura com lock)
+    levels = get_stock_levels(variant_ids, lock=True)
+
+    requested = {}
+    for item in items:
+        requested[item.variant_id] = requested.get(item.variant_id, 0) + item.quantity
 
-        if available < item.quantity:
+    for item in items:
+        available = levels[item.variant_id]['available']
+        if available < requested[item.variant_id]:
             raise ValidationError(
                 f'Estoque insuficiente para {item.variant}. '
                 f'Disponível: {available}'
             )
 
-        StockEntry.objects.create(
-            variant=item.variant,  # ✅ agora é variant
-            order_item=item,
-            entry_type=None,
-            movement_type=StockEntry.MovementType.RESERVE,
-            quantity=item.quantity
-        )
+    entries = _build_entries(items, None, StockEntry.MovementType.RESERVE)
+    StockEntry.objects.bulk_create(entries)
 
+    for item in items:
         item.reserved = True
-        item.save(update_fields=['reserved'])
+    OrderItem.objects.bulk_update(items, ['reserved'])
 
+    apply_stock_balance(entries)
 
+
+@transaction.atomic
 def release_stock(order):
-    for item in order.items.select_related('variant', 'variant__product'):
-        if not item.reserved:
-            continue
+    items = [item for item in order.items.all() if item.reserved and item.variant_id]
+    if not items:
+        return
 
-        StockEntry.objects.create(
-            variant=item.variant,
-            order_item=item,
-            entry_type=None,
-            movement_type=StockEntry.MovementType.RELEASE,
-            quantity=item.quantity
-        )
+    _lock_variants(items)
 
+    items = [item for item in _fresh_reserved(items) if item.reserved]
+    if not items:
+        return
+
+    entries = _build_entries(items, None, StockEntry.MovementType.RELEASE)
+    StockEntry.objects.bulk_create(entries)
+
+    for item in items:
         item.reserved = False
-        item.save(update_fields=['reserved'])
+    OrderItem.objects.bulk_update(items, ['reserved'])
 
+    apply_stock_balance(entries)
 
+
+@transaction.atomic
 def finalize_stock(order):
-    for item in order.items.select_related('variant', 'variant__product'):
-
-        # 🔹 Se estava reservado, libera logicamente
-        if item.reserved:
-            StockEntry.objects.create(
-                variant=item.variant,
-                order_item=item,
-                entry_type=None,
-                movement_type=StockEntry.MovementType.RELEASE,
-                quantity=item.quantity
-            )
+    items = [item for item in order.items.all() if item.variant_id]
+    if not items:
+        return
+
+    _lock_variants(items)
+
+    items = _fresh_reserved(items)
+    if not items:
+        return
 
+    # 🔹 Se estava reservado, libera logicamente
+    reserved_items = [item for item in items if item.reserved]
+    entries = _build_entries(reserved_items, None, StockEntry.MovementType.RELEASE)
+
+    # 🔥 Saída física real
+    entries += _build_entries(items, 'out', StockEntry.MovementType.SALE)
+
+    StockEntry.objects.bulk_create(entries)
+
+    if reserved_items:
+        for item in reserved_items:
             item.reserved = False
-            item.save(update_fields=['reserved'])
+        OrderItem.objects.bulk_update(reserved_items, ['reserved'])
 
-        # 🔥 Saída física real
-        StockEntry.objects.create(
-            variant=item.variant,
-            order_item=item,
-            entry_type='out',
-            movement_type=StockEntry.MovementType.SALE,
-            quantity=item.quantity
-        )
+    apply_stock_balance(entries)
 
 def create_variants(product):
-
+    """
+    Cria as variantes (tamanho × cor) que ainda faltam para o produto.
+    Pares já existentes são lidos numa consulta; SKU sai em memória, os
+    EAN13 num bloco do contador da empresa, e as novas variantes vão num
+    único bulk_create. Produto sem
+    nada faltando não escreve nada.
+    """
     if not product.color:
         return
 
-    sizes = product.size.sizes.all() if product.size else [None]
-
-    for size in sizes:
+    sizes = list(product.size.sizes.all()) if product.size else [None]
 
-        variant, created = ProductVariant.objects.get_or_create(
-            product=product,
-            size=size,
-            color=product.color
-        )
+    pairs = set(
+        ProductVariant.objects.filter(product=product)
+        .values_list('size_id', 'color_id')
+    )
 
-        # 🔹 Se acabou de criar, gera SKU e EAN
-        if created:
+    new_variants = [
+        ProductVariant(product=product, size=size, color=product.color)
+        for size in sizes
+        if ((size.id if size else None), product.color_id) not in pairs
+    ]
+    if not new_variants:
+        return
 
-            # Primeiro salva para garantir ID
-            variant.save()
+    eans = allocate_ean13(product.business_id, len(new_variants))
 
-            # Gera SKU
-            variant.sku = generate_sku(variant)
-            variant.save()
+    for variant, ean in zip(new_variants, eans):
+        variant.sku   = generate_sku(variant)
+        variant.ean13 = ean
 
-            # Gera EAN13 (precisa do ID da variante)
-            variant.ean13 = generate_ean13(variant)
-            variant.save()
+    ProductVariant.objects.bulk_create(new_variants)
@@ -0,0 +1,92 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Sum, Q
+from django.utils import timezone
+
+from core.models import StockEntry
+from core.services.keyset import keyset_page
+from core.services.order_stock import get_stock_levels, _entry_delta
+from core.services.stock_snapshot import stock_as_of
+
+
+PAGE_SIZE = 50
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# HISTÓRICO DE MOVIMENTAÇÕES (paginação por cursor)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _day_start(day):
+    """Início do dia no fuso local — filtra por faixa e mantém o índice."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _newer_than(entry):
+    return Q(timestamp__gt=entry.timestamp) | Q(timestamp=entry.timestamp, id__gt=entry.id)
+
+
+def _sum_deltas(entries):
+    """Efeito somado (real, reservado) de um conjunto de movimentações."""
+    totals = entries.aggregate(
+        total_in=Sum('quantity', filter=Q(entry_type='in'), default=0),
+        total_out=Sum('quantity', filter=Q(entry_type='out'), default=0),
+        total_reserve=Sum('quantity', filter=Q(movement_type=StockEntry.MovementType.RESERVE), default=0),
+        total_release=Sum('quantity', filter=Q(movement_type=StockEntry.MovementType.RELEASE), default=0),
+    )
+    return (
+        totals['total_in'] - totals['total_out'],
+        totals['total_reserve'] - totals['total_release'],
+    )
+
+
+def _balance_after(variant, entry):
+    """
+    Saldo (real, reservado) logo depois de `entry`.
+    Parte do saldo materializado mais próximo: StockBalance se a linha é
+    de hoje, senão o fechamento do dia (snapshot) — e desconta só as
+    movimentações do mesmo dia posteriores à linha.
+    """
+    day = timezone.localdate(entry.timestamp)
+    newer = variant.stock_entries.filter(_newer_than(entry))
+
+    if day >= timezone.localdate():
+        level = get_stock_levels([variant.id])[variant.id]
+    else:
+        level = stock_as_of(variant.product.business, [variant.id], day)[variant.id]
+        newer = newer.filter(timestamp__lt=_day_start(day + timedelta(days=1)))
+
+    real, reserved = _sum_deltas(newer)
+    return level['real'] - real, level['reserved'] - reserved
+
+
+def stock_history_page(variant, cursor=None, movement_type=None,
+                       date_from=None, date_to=None, page_size=PAGE_SIZE):
+    """
+    Uma página do histórico da variante, da mais recente para a mais antiga,
+    paginada por (timestamp, id) sobre o índice (variant, timestamp, id).
+
+    Retorna (linhas, próximo_cursor). Sem filtro de tipo, cada linha
+    recebe balance_real / balance_available: o saldo depois dela.
+    """
+    qs = variant.stock_entries.select_related('order_item')
+
+    if movement_type:
+        qs = qs.filter(movement_type=movement_type)
+    if date_from:
+        qs = qs.filter(timestamp__gte=_day_start(date_from))
+    if date_to:
+        qs = qs.filter(timestamp__lt=_day_start(date_to + timedelta(days=1)))
+
+    rows, next_cursor = keyset_page(qs, cursor, page_size, field='timestamp')
+
+    # 🔹 Saldo corrido: só faz sentido com todas as naturezas na página
+    if rows and not movement_type:
+        real, reserved = _balance_after(variant, rows[0])
+        for row in rows:
+            row.balance_real      = real
+            row.balance_available = real - reserved
+            delta_real, delta_reserved = _entry_delta(row)
+            real     -= delta_real
+            reserved -= delta_reserved
+
+    return rows, next_cursor
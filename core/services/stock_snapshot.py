@@ -0,0 +1,189 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum, Q, Max, F, OuterRef, Subquery
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import StockEntry, StockBalance, StockSnapshot
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SNAPSHOTS DIÁRIOS DE ESTOQUE
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _daily_deltas(entries):
+    """
+    Variação de real/reservado por (variante, dia), numa consulta agrupada.
+    Retorna {variant_id: {dia: (real, reservado)}}.
+    """
+    rows = (
+        entries
+        .annotate(day=TruncDate('timestamp'))
+        .values('variant_id', 'day')
+        .annotate(
+            total_in=Sum('quantity', filter=Q(entry_type='in'), default=0),
+            total_out=Sum('quantity', filter=Q(entry_type='out'), default=0),
+            total_reserve=Sum('quantity', filter=Q(movement_type=StockEntry.MovementType.RESERVE), default=0),
+            total_release=Sum('quantity', filter=Q(movement_type=StockEntry.MovementType.RELEASE), default=0),
+        )
+        .order_by()
+    )
+
+    deltas = {}
+    for r in rows:
+        deltas.setdefault(r['variant_id'], {})[r['day']] = (
+            r['total_in'] - r['total_out'],
+            r['total_reserve'] - r['total_release'],
+        )
+    return deltas
+
+
+def snapshot_watermark(business=None):
+    """Último dia fechado (maior data de snapshot) da empresa, ou None."""
+    qs = StockSnapshot.objects.all()
+    if business is not None:
+        qs = qs.filter(variant__product__business=business)
+    return qs.aggregate(last=Max('date'))['last']
+
+
+def build_stock_snapshots(business=None, until=None):
+    """
+    Fecha os dias ainda sem snapshot até `until` (padrão: ontem).
+
+    Incremental: só lê as movimentações depois do último dia fechado.
+    O fechamento de cada dia sai do saldo atual (StockBalance) menos
+    as movimentações posteriores, então não depende do histórico antigo.
+    Retorna a quantidade de snapshots gravados.
+    """
+    until = until or timezone.localdate() - timedelta(days=1)
+
+    watermark = snapshot_watermark(business)
+    start = watermark + timedelta(days=1) if watermark else None
+
+    if start and start > until:
+        return 0
+
+    entries = StockEntry.objects.all()
+    if business is not None:
+        entries = entries.filter(variant__product__business=business)
+    if start:
+        entries = entries.filter(timestamp__date__gte=start)
+
+    with transaction.atomic():
+        # 🔹 Deltas e saldo atual lidos na mesma transação
+        deltas   = _daily_deltas(entries)
+        balances = {
+            b['variant_id']: (b['real'], b['reserved'])
+            for b in StockBalance.objects.filter(variant_id__in=deltas)
+            .values('variant_id', 'real', 'reserved')
+        }
+
+        snapshots = []
+        for variant_id, days in deltas.items():
+            real, reserved = balances.get(variant_id, (0, 0))
+
+            # Anda do dia mais recente para trás desfazendo cada dia
+            for day in sorted(days, reverse=True):
+                if day <= until:
+                    snapshots.append(StockSnapshot(
+                        variant_id=variant_id,
+                        date=day,
+                        real=real,
+                        reserved=reserved,
+                        available=real - reserved,
+                    ))
+                day_real, day_reserved = days[day]
+                real     -= day_real
+                reserved -= day_reserved
+
+        # Reexecução do mesmo período sobrescreve em vez de duplicar
+        existing = StockSnapshot.objects.filter(date__lte=until)
+        if business is not None:
+            existing = existing.filter(variant__product__business=business)
+        if start:
+            existing = existing.filter(date__gte=start)
+        existing.delete()
+
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+    return len(snapshots)
+
+
+def adjust_stock_snapshots(entries, sign=1):
+    """
+    Propaga para os snapshots já fechados o efeito de movimentações com
+    data passada (ex.: exclusão de uma entrada antiga). Movimentações de
+    hoje não têm snapshot para ajustar.
+    """
+    from core.services.order_stock import _entry_delta
+
+    today  = timezone.localdate()
+    deltas = {}
+
+    for entry in entries:
+        if not entry.variant_id or not entry.timestamp:
+            continue
+        day = timezone.localdate(entry.timestamp)
+        if day >= today:
+            continue
+
+        real, reserved = _entry_delta(entry)
+        acc = deltas.setdefault((entry.variant_id, day), [0, 0])
+        acc[0] += sign * real
+        acc[1] += sign * reserved
+
+    for (variant_id, day), (real, reserved) in sorted(deltas.items()):
+        if real == 0 and reserved == 0:
+            continue
+        StockSnapshot.objects.filter(variant_id=variant_id, date__gte=day).update(
+            real=F('real') + real,
+            reserved=F('reserved') + reserved,
+            available=F('available') + (real - reserved),
+        )
+
+
+def stock_as_of(business, variant_ids, day):
+    """
+    Estoque de fechamento de `day` para várias variantes:
+    último snapshot <= day + movimentações depois do último dia fechado.
+    Retorna {variant_id: {'real', 'reserved', 'available'}}.
+    """
+    variant_ids = list(variant_ids)
+    levels = {
+        vid: {'real': 0, 'reserved': 0, 'available': 0}
+        for vid in variant_ids
+    }
+    if not variant_ids:
+        return levels
+
+    last_date = (
+        StockSnapshot.objects
+        .filter(variant=OuterRef('variant'), date__lte=day)
+        .order_by('-date')
+        .values('date')[:1]
+    )
+    snapshots = StockSnapshot.objects.filter(
+        variant_id__in=variant_ids, date=Subquery(last_date),
+    ).values_list('variant_id', 'real', 'reserved')
+
+    for variant_id, real, reserved in snapshots:
+        levels[variant_id] = {'real': real, 'reserved': reserved, 'available': real - reserved}
+
+    # 🔹 Dias ainda não fechados: soma o ledger a partir do watermark
+    watermark = snapshot_watermark(business)
+    if watermark and day <= watermark:
+        return levels
+
+    entries = StockEntry.objects.filter(variant_id__in=variant_ids, timestamp__date__lte=day)
+    if watermark:
+        entries = entries.filter(timestamp__date__gt=watermark)
+
+    for variant_id, days in _daily_deltas(entries).items():
+        current = levels[variant_id]
+        for real, reserved in days.values():
+            current['real']     += real
+            current['reserved'] += reserved
+        current['available'] = current['real'] - current['reserved']
+
+    return levels
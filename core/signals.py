@@ -0,0 +1,51 @@
+"""
+Signals do core.
+
+Invalidação do índice fiscal em memória (services/fiscal_index.py)
+sempre que uma regra fiscal muda, e baixa do resumo de pedidos
+(services/order_stats.py) quando um pedido é excluído.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import FiscalOperation, NCMGroup, NCMGroupItem, NCM, ICMSOriginDestination, Orders
+from core.services.fiscal_index import invalidate_fiscal_index
+from core.services.order_stats import track_order_delete
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ÍNDICE FISCAL
+# ─────────────────────────────────────────────────────────────────────────────
+
+@receiver([post_save, post_delete], sender=FiscalOperation)
+@receiver([post_save, post_delete], sender=NCMGroup)
+def fiscal_rule_changed(sender, instance, **kwargs):
+    invalidate_fiscal_index(instance.business_id)
+
+
+@receiver([post_save, post_delete], sender=NCMGroupItem)
+def ncm_group_item_changed(sender, instance, **kwargs):
+    business_id = (
+        NCMGroup.objects
+        .filter(pk=instance.group_id)
+        .values_list('business_id', flat=True)
+        .first()
+    )
+    # Grupo já removido (cascata) → invalida tudo
+    invalidate_fiscal_index(business_id)
+
+
+@receiver([post_save, post_delete], sender=NCM)
+@receiver([post_save, post_delete], sender=ICMSOriginDestination)
+def fiscal_table_changed(sender, instance, **kwargs):
+    invalidate_fiscal_index()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RESUMO DE PEDIDOS
+# ─────────────────────────────────────────────────────────────────────────────
+
+@receiver(post_delete, sender=Orders)
+def order_deleted(sender, instance, **kwargs):
+    track_order_delete(instance)
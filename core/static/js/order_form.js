@@ -50,9 +50,82 @@ function updateSubtotal(row) {
     row.querySelector('.subtotal').innerText = money(subtotal);
 
     recalcTotal();
+    scheduleFiscalRefresh();
+}
+
+/* ================================================================
+   TRIBUTOS DAS LINHAS (CFOP / ICMS%)
+   Todas as linhas numa única requisição (/ajax/fiscal/items/),
+   agrupando as edições feitas em sequência.
+================================================================ */
+let fiscalTimer = null;
+
+function scheduleFiscalRefresh() {
+    if (!window.fetchFiscalLines) return;
+    clearTimeout(fiscalTimer);
+    fiscalTimer = setTimeout(refreshItemsFiscal, 400);
+}
+
+function refreshItemsFiscal() {
+    const rows = [...document.querySelectorAll('#items-table tr.item-form')].filter(row => {
+        const del = row.querySelector('[name$="-DELETE"]');
+        return row.style.display !== 'none' && !(del && del.checked)
+            && row.querySelector('[name$="-variant"]').value;
+    });
+    if (!rows.length) return;
+
+    const field = (row, name) => row.querySelector(`[name$="-${name}"]`).value || 0;
+
+    window.fetchFiscalLines(rows.map(row => ({
+        variant_id: row.querySelector('[name$="-variant"]').value,
+        quantity:   field(row, 'quantity') || 1,
+        price:      field(row, 'price'),
+        discount:   field(row, 'discount'),
+        addition:   field(row, 'addition')
+    })))
+        .then(items => items.forEach((data, i) => {
+            rows[i].querySelector('.fiscal-cfop').textContent = data.found ? (data.cfop || '—') : '—';
+            rows[i].querySelector('.fiscal-icms').textContent =
+                data.found && parseFloat(data.icms_rate) ? `${data.icms_rate}%` : '—';
+        }))
+        .catch(() => {});
+}
+
+/* ================================================================
+   BUSCA DE VARIANTES (select2 + /ajax/variants/)
+   As linhas só trazem do servidor a variante selecionada;
+   as demais opções vêm da busca.
+================================================================ */
+const VARIANT_AJAX = {
+    url: '/ajax/variants/',
+    dataType: 'json',
+    delay: 300,
+    data: params => ({ q: params.term }),
+    processResults: data => ({
+        results: data.results.map(item => ({
+            id:     item.id,
+            text:   item.text,
+            price:  item.price,
+            price1: item.price1
+        }))
+    }),
+    cache: true
+};
+
+function initVariantSelect(select) {
+    if (!select || $(select).hasClass('select2-hidden-accessible')) return;
+
+    $(select).select2({
+        placeholder: 'Buscar produto ou tamanho...',
+        minimumInputLength: 1,
+        width: '100%',
+        ajax: VARIANT_AJAX
+    });
 }
 
 function bindRowEvents(row) {
+    initVariantSelect(row.querySelector('select.variant-select'));
+
     row.querySelectorAll('input, select').forEach(el => {
         el.addEventListener('input',  () => updateSubtotal(row));
         el.addEventListener('change', () => updateSubtotal(row));
@@ -75,7 +148,7 @@ function bindRowEvents(row) {
 /* ================================================================
    ADICIONAR ITEM
 ================================================================ */
-function addItemFromForm(variantId, price, qty, discount, addition) {
+function addItemFromForm(variantId, variantText, price, qty, discount, addition) {
 
     const rows = document.querySelectorAll('#items-table tr');
 
@@ -107,7 +180,10 @@ function addItemFromForm(variantId, price, qty, discount, addition) {
     document.getElementById('items-table').appendChild(row);
     totalFormsInput.value = index + 1;
 
-    row.querySelector('[name$="-variant"]').value  = variantId;
+    // Select vazio (lazy): cria a opção escolhida na busca
+    row.querySelector('[name$="-variant"]').appendChild(
+        new Option(variantText, variantId, true, true)
+    );
     row.querySelector('[name$="-quantity"]').value = qty;
     row.querySelector('[name$="-price"]').value    = price;
     row.querySelector('[name$="-discount"]').value = discount;
@@ -125,21 +201,7 @@ document.addEventListener('DOMContentLoaded', function () {
     $('#product').select2({
         placeholder: 'Buscar produto ou tamanho...',
         minimumInputLength: 1,
-        ajax: {
-            url: '/ajax/variants/',
-            dataType: 'json',
-            delay: 300,
-            data: params => ({ q: params.term }),
-            processResults: data => ({
-                results: data.results.map(item => ({
-                    id:     item.id,
-                    text:   item.text,
-                    price:  item.price,
-                    price1: item.price1
-                }))
-            }),
-            cache: true
-        }
+        ajax: VARIANT_AJAX
     });
 
     $('#product').on('select2:select', function (e) {
@@ -210,6 +272,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         addItemFromForm(
             selected[0].id,
+            selected[0].text,
             parseFloat(document.getElementById('price').value    || 0),
             parseFloat(document.getElementById('quantity').value || 1),
             parseFloat(document.getElementById('discount').value || 0),
@@ -228,4 +291,7 @@ document.addEventListener('DOMContentLoaded', function () {
         bindRowEvents(row);
     });
 
+    // Cliente define a UF de destino → recalcula os tributos das linhas
+    $('[name="client"]').on('change', scheduleFiscalRefresh);
+
 });
\ No newline at end of file
@@ -1,3 +1,1201 @@
-from django.test import TestCase
+import threading
+from io import StringIO
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
+from django.forms.models import model_to_dict
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from xsdata.formats.dataclass.context import XmlContext
+from xsdata.formats.dataclass.serializers import XmlSerializer
+
+from core.models import (
+    Business, Client, EANSequence, Product, ProductVariant, Orders, OrderItem,
+    StockEntry, StockBalance, OrderPayment, FinancialMovementParcel,
+    Invoice, InvoiceStatus, Job, FiscalNumberSequence, FiscalNumberBlock, FiscalNumberVoid,
+    FiscalIndexVersion, IdempotencyKey, OrderPaymentParcel, Plan, User,
+    split_installments,
+)
+from core.forms import BusinessForm
+from core.management.variant_batch import VariantBatchCommand
+from core.management.commands.sefaz_local import _RESPOSTA, _WS
+from core.services.ean import allocate_ean13
+from core.services.emissao_lote import emitir_lote, pending_orders
+from core.services.nf_generator import gerar_nota_fiscal
+from core.services import fiscal_index, fiscal_numbers
+from core.services.fiscal import xml_builder
+from core.services.fiscal.sefaz_client import _parsear_retorno_autorizacao, _resultado
+from core.services import order_stock
+from core.services.order_stock import (
+    apply_stock_balance, ledger_stock_totals, release_stock, reserve_stock,
+)
+
+
+def _business(name='Empresa', document='12345678000199', **extra):
+    return Business.objects.create(name=name, document=document, state='SP', **extra)
+
+
+def _variant(business, sku='SKU1', stock=0):
+    product = Product.objects.create(business=business, name='Produto', cost=1, price=10, cfop_default='5102')
+    variant = ProductVariant.objects.create(product=product, sku=sku, ean13=f'789{sku}')
+    if stock:
+        entry = StockEntry.objects.create(
+            variant=variant, entry_type='in',
+            movement_type=StockEntry.MovementType.INITIAL, quantity=stock,
+        )
+        apply_stock_balance([entry])
+    return variant
+
+
+class NumberingOnDefaultMixin:
+    """
+    A numeração de NF (services/fiscal_numbers) roda na conexão própria
+    'fiscal_numbers', que não enxerga nem trava o que o TestCase gravou na
+    transação da 'default': nos testes ela usa a 'default'.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('core.services.fiscal_numbers._using', return_value='default')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def _order(business, items=(), **extra):
+    """Pedido com itens [(variante, quantidade, preço)]."""
+    order = Orders.objects.create(business=business, **extra)
+    for variant, quantity, price in items:
+        OrderItem.objects.create(order=order, variant=variant, quantity=quantity, price=Decimal(price))
+    return order
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ESTOQUE — reserva concorrente
+# ─────────────────────────────────────────────────────────────────────────────
+
+@skipUnlessDBFeature('has_select_for_update')
+class ReserveStockConcurrencyTests(TransactionTestCase):
+    """Duas reservas em paralelo disputando as últimas unidades da mesma variante."""
+
+    def test_only_one_reservation_gets_the_last_units(self):
+        business = _business()
+        variant  = _variant(business, stock=3)
+        orders   = [_order(business, [(variant, 3, '10')]) for _ in range(2)]
+
+        barrier = threading.Barrier(len(orders))
+        results = []
+
+        def reserve(order_id):
+            try:
+                order = Orders.objects.get(pk=order_id)
+                barrier.wait()
+                reserve_stock(order)
+                results.append('ok')
+            except ValidationError:
+                results.append('insuficiente')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(o.pk,)) for o in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), ['insuficiente', 'ok'])
+
+        balance = StockBalance.objects.get(variant=variant)
+        self.assertEqual((balance.real, balance.reserved, balance.available), (3, 3, 0))
+        self.assertEqual(ledger_stock_totals([variant.pk]), {variant.pk: (3, 3)})
+        self.assertEqual(
+            StockEntry.objects.filter(variant=variant, movement_type=StockEntry.MovementType.RESERVE).count(), 1,
+        )
+        self.assertEqual(OrderItem.objects.filter(order__in=orders, reserved=True).count(), 1)
+
+
+class StaleReservedFlagTests(TestCase):
+    """`reserved` lido antes da trava e mudado por outra transação enquanto esperava."""
+
+    def setUp(self):
+        self.business = _business()
+        self.variant  = _variant(self.business, stock=10)
+        self.order    = _order(self.business, [(self.variant, 3, '10')])
+
+    def _while_waiting_for_lock(self, change):
+        """_lock_variants que aplica `change` (a outra transação) antes da 1ª trava."""
+        real    = order_stock._lock_variants
+        pending = [change]
+
+        def lock(items):
+            if pending:
+                pending.pop()()
+            return real(items)
+
+        return mock.patch('core.services.order_stock._lock_variants', side_effect=lock)
+
+    def _movements(self, movement_type):
+        return StockEntry.objects.filter(variant=self.variant, movement_type=movement_type).count()
+
+    def test_reserve_skips_items_reserved_meanwhile(self):
+        stale = Orders.objects.get(pk=self.order.pk)
+
+        with self._while_waiting_for_lock(lambda: reserve_stock(Orders.objects.get(pk=self.order.pk))):
+            reserve_stock(stale)
+
+        self.assertEqual(self._movements(StockEntry.MovementType.RESERVE), 1)
+        self.assertEqual(StockBalance.objects.get(variant=self.variant).reserved, 3)
+
+    def test_release_skips_items_released_meanwhile(self):
+        reserve_stock(self.order)
+        stale = Orders.objects.get(pk=self.order.pk)
+
+        with self._while_waiting_for_lock(lambda: release_stock(Orders.objects.get(pk=self.order.pk))):
+            release_stock(stale)
+
+        self.assertEqual(self._movements(StockEntry.MovementType.RELEASE), 1)
+        self.assertEqual(StockBalance.objects.get(variant=self.variant).reserved, 0)
+
+
+class EANSequenceTests(TestCase):
+
+    def test_default_prefix_is_two_plus_zero_padded_id(self):
+        self.assertEqual(EANSequence.default_prefix(7), '200007')
+        self.assertEqual(EANSequence.default_prefix(99999), '299999')
+
+    def test_ids_beyond_five_digits_need_a_registered_prefix(self):
+        # '2' + 123456 começaria com o prefixo da empresa 12345
+        with self.assertRaises(ValidationError):
+            EANSequence.default_prefix(123456)
+
+        business = _business(pk=100000)
+        with self.assertRaises(ValidationError):
+            allocate_ean13(business.pk, 2)
+        self.assertFalse(EANSequence.objects.filter(business=business).exists())
+
+        EANSequence.objects.create(business=business, prefix='7891234')
+        codes = allocate_ean13(business.pk, 2)
+        self.assertEqual([c[:7] for c in codes], ['7891234'] * 2)
+        self.assertEqual([int(c[7:12]) for c in codes], [1, 2])
+
+
+class VariantBatchCommandTests(TestCase):
+
+    def test_base_without_build_sku_cannot_be_instantiated(self):
+        with self.assertRaises(TypeError):
+            VariantBatchCommand()
+
+        class Incompleta(VariantBatchCommand):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incompleta()
+
+    def test_commands_run(self):
+        _variant(_business())
+        for name in ('generate_sku_ean', 'generate_identifiers'):
+            with self.subTest(command=name):
+                out = StringIO()
+                call_command(name, '--dry-run', stdout=out)
+                self.assertIn('[dry-run]', out.getvalue())
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PEDIDOS — índices da listagem (migração 0034)
+# ─────────────────────────────────────────────────────────────────────────────
+
+@skipUnless(connection.vendor == 'mysql', 'Plano de execução conferido só no MySQL')
+class OrderListIndexTests(TestCase):
+    """Cada filtro da listagem de pedidos (order_list + cursor) usa o índice próprio."""
+
+    BUSINESS_CREATED        = 'core_orders_busines_fdf2c0_idx'   # (business, created_at)
+    BUSINESS_STATUS_CREATED = 'core_orders_busines_e1f4b2_idx'   # (business, status, created_at)
+    BUSINESS_CLIENT_CREATED = 'core_orders_busines_d95f6b_idx'   # (business, client, created_at)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = _business()
+        other        = _business('Outra', document='98765432000198')
+        cls.client_a = Client.objects.create(business=cls.business, name='Cliente A')
+        client_b     = Client.objects.create(business=cls.business, name='Cliente B')
+
+        statuses = [Orders.STATUS_ORCAMENTO, Orders.STATUS_FATURADO, Orders.STATUS_CANCELADO]
+        for n in range(60):
+            _order(
+                cls.business if n % 4 else other,
+                client=cls.client_a if n % 2 else client_b,
+                status=statuses[n % len(statuses)],
+            )
+
+    def _page(self, **filters):
+        """Mesma consulta de order_list na página por cursor (keyset_page)."""
+        since = timezone.now() - timedelta(days=30)
+        qs = (
+            Orders.objects.filter(business=self.business).select_related('client')
+            .filter(created_at__gte=since, **filters)
+        )
+        return qs.order_by('-created_at', '-id')[:16]
+
+    def assertUsesIndex(self, qs, index_name):
+        plan = qs.explain()
+        self.assertIn(index_name, plan)
+
+    def test_business_created_at(self):
+        self.assertUsesIndex(self._page(), self.BUSINESS_CREATED)
+
+    def test_business_status_created_at(self):
+        self.assertUsesIndex(self._page(status=Orders.STATUS_FATURADO), self.BUSINESS_STATUS_CREATED)
+
+    def test_business_client_created_at(self):
+        self.assertUsesIndex(self._page(client=self.client_a), self.BUSINESS_CLIENT_CREATED)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FINANCEIRO — parcelas
+# ─────────────────────────────────────────────────────────────────────────────
+
+class SplitInstallmentsTests(TestCase):
+
+    def test_exact_division(self):
+        self.assertEqual(split_installments(Decimal('90.00'), 3), [Decimal('30.00')] * 3)
+
+    def test_last_installment_absorbs_remainder(self):
+        values = split_installments(Decimal('100.00'), 12)
+        self.assertEqual(values[:11], [Decimal('8.33')] * 11)
+        self.assertEqual(values[-1], Decimal('8.37'))
+        self.assertEqual(sum(values), Decimal('100.00'))
+
+    def test_rounding_up_leaves_smaller_last_installment(self):
+        self.assertEqual(
+            split_installments(Decimal('100.00'), 6),
+            [Decimal('16.67')] * 5 + [Decimal('16.65')],
+        )
+
+    def test_zero_or_one_parcel_is_single_installment(self):
+        self.assertEqual(split_installments('10.01', 0), [Decimal('10.01')])
+        self.assertEqual(split_installments('10.01', 1), [Decimal('10.01')])
+
+
+class InstallmentQueriesTests(TestCase):
+    """Consultas fixas, independentes da quantidade de parcelas."""
+
+    # generate_financial_bulk: SAVEPOINT, movimentos já existentes, pagamentos,
+    # parcelas (prefetch), INSERT movimentos, INSERT parcelas, RELEASE
+    # (+1 no MySQL: releitura dos ids em bulk_create_with_pks)
+    FINANCIAL_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = _business()
+
+    def _payment(self, parcels):
+        order = _order(self.business)
+        return OrderPayment.objects.create(order=order, total_value=Decimal('100.00'), parcels=parcels)
+
+    def _financial_queries(self):
+        return self.FINANCIAL_QUERIES + (0 if connection.features.can_return_rows_from_bulk_insert else 1)
+
+    def test_generate_parcels(self):
+        for parcels in (1, 12):
+            with self.subTest(parcels=parcels):
+                payment = self._payment(parcels)
+                with self.assertNumQueries(2):
+                    payment.generate_parcels()
+
+                values = list(payment.parcels_records.values_list('value', flat=True))
+                self.assertEqual(values, split_installments(Decimal('100.00'), parcels))
+
+                # Já gerado: só a verificação
+                with self.assertNumQueries(1):
+                    payment.generate_parcels()
+
+    def test_generate_financial(self):
+        for parcels in (1, 12):
+            with self.subTest(parcels=parcels):
+                payment = self._payment(parcels)
+                payment.generate_parcels()
+
+                with self.assertNumQueries(self._financial_queries()):
+                    payment.order.generate_financial()
+
+                values = list(
+                    FinancialMovementParcel.objects.filter(movement__order=payment.order)
+                    .order_by('parcel').values_list('value', flat=True)
+                )
+                self.assertEqual(values, split_installments(Decimal('100.00'), parcels))
+
+    def test_generate_financial_without_payment_parcels(self):
+        # Sem OrderPaymentParcel: parcelas calculadas na hora, mesmas consultas
+        for parcels in (1, 12):
+            with self.subTest(parcels=parcels):
+                payment = self._payment(parcels)
+
+                with self.assertNumQueries(self._financial_queries()):
+                    payment.order.generate_financial()
+
+                self.assertEqual(
+                    FinancialMovementParcel.objects.filter(movement__order=payment.order).count(), parcels,
+                )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# NF — emissão em lote
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _retorno_sefaz(cstat, chave='', protocolo='135000000000001'):
+    """Resposta síncrona da SEFAZ (mesmo XML do sefaz_local): lote 104 + infProt da nota."""
+    motivo = 'Autorizado o uso da NF-e' if cstat == '100' else 'Rejeicao: Duplicidade de NF-e'
+    return _RESPOSTA.format(
+        ws=_WS, chave=chave, protocolo=protocolo, cstat=cstat, motivo=motivo,
+        agora='2026-10-18T10:00:00-03:00',
+    )
+
+
+class ParseAutorizacaoTests(TestCase):
+
+    def test_authorized_reads_infprot_not_batch_status(self):
+        ret = _parsear_retorno_autorizacao(_retorno_sefaz('100', protocolo='135000000000042'))
+        self.assertEqual(ret['cStat'], '100')
+        self.assertEqual(ret['protocolo'], '135000000000042')
+        self.assertTrue(ret['autorizado'])
+        self.assertFalse(ret['rejeitada'])
+
+    def test_rejected_note_in_processed_batch(self):
+        # Lote 104 (processado) com a nota rejeitada: vale o cStat do infProt
+        ret = _parsear_retorno_autorizacao(_retorno_sefaz('204'))
+        self.assertEqual(ret['cStat'], '204')
+        self.assertEqual(ret['xMotivo'], 'Rejeicao: Duplicidade de NF-e')
+        self.assertFalse(ret['autorizado'])
+        self.assertTrue(ret['rejeitada'])
+
+    def test_without_infprot_uses_root_status(self):
+        xml = (
+            '<retEnviNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+            '<cStat>103</cStat><xMotivo>Lote recebido com sucesso</xMotivo></retEnviNFe>'
+        )
+        ret = _parsear_retorno_autorizacao(xml)
+        self.assertEqual(ret['cStat'], '103')
+        self.assertFalse(ret['autorizado'] or ret['rejeitada'])
+
+
+class EmitirLoteTests(NumberingOnDefaultMixin, TestCase):
+    """emitir_lote sem pool (processes=1), com a SEFAZ trocada pelo retorno do sefaz_local."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders = {}
+        cls.businesses = []
+        for n, document in enumerate(['11111111000191', '22222222000191'], start=1):
+            business = _business(
+                f'Empresa {n}', document=document, nfe_last_number=100 * n,
+                street='Rua A', number='1', district='Centro', city='São Paulo',
+                city_code='3550308', zip_code='01000-000',
+            )
+            cls.businesses.append(business)
+            cls.orders[business.pk] = []
+
+        clients  = {
+            b.pk: Client.objects.create(business=b, name='Cliente', state='RJ', document='12345678901')
+            for b in cls.businesses
+        }
+        variants = {b.pk: _variant(b, sku=f'S{b.pk}') for b in cls.businesses}
+
+        # Pedidos das duas empresas intercalados (ids fora de ordem por empresa)
+        for _ in range(3):
+            for business in cls.businesses:
+                order = _order(
+                    business, [(variants[business.pk], 1, '10')],
+                    client=clients[business.pk], document_model='55',
+                )
+                cls.orders[business.pk].append(order)
+
+        ids = [o.pk for orders in cls.orders.values() for o in orders]
+        Orders.objects.filter(id__in=ids).update(status=Orders.STATUS_FATURADO)
+
+    def _transmitir(self, rejected=()):
+        """transmitir falso: parseia o retorno do sefaz_local e grava como o real."""
+        protocols = iter(range(135000000000001, 135000000001000))
+
+        def transmitir(invoice, xml_assinado):
+            cstat = '204' if invoice.order_id in rejected else '100'
+            ret   = _parsear_retorno_autorizacao(
+                _retorno_sefaz(cstat, invoice.access_key, next(protocols))
+            )
+            invoice.status         = InvoiceStatus.AUTORIZADA if ret['autorizado'] else InvoiceStatus.REJEITADA
+            invoice.protocol       = ret['protocolo']
+            invoice.return_code    = ret['cStat']
+            invoice.return_message = ret['xMotivo']
+            invoice.save(update_fields=['status', 'protocol', 'return_code', 'return_message'])
+            return _resultado(ret['autorizado'], ret['cStat'], ret['xMotivo'], ret['protocolo'])
+
+        return mock.patch('core.services.fiscal.sefaz_client.transmitir', transmitir)
+
+    def _emitir(self, ids, rejected=()):
+        with self._transmitir(rejected), \
+                mock.patch('core.services.fiscal.signer.assinar_xml', lambda invoice, xml: xml):
+            return emitir_lote(ids, processes=1)
+
+    def _all_ids(self):
+        return [o.pk for orders in self.orders.values() for o in orders]
+
+    def test_numbers_are_sequential_per_business_in_order_id_order(self):
+        lote = self._emitir(self._all_ids())
+
+        self.assertEqual(lote['authorized'], 6)
+        for n, business in enumerate(self.businesses, start=1):
+            numbers = list(
+                Invoice.objects.filter(order__business=business)
+                .order_by('order_id').values_list('number', flat=True)
+            )
+            self.assertEqual(numbers, [100 * n + 1, 100 * n + 2, 100 * n + 3])
+
+        # Resultados agrupados por empresa, pedidos em ordem de id
+        self.assertEqual(
+            [r['order'] for r in lote['results']],
+            [o.pk for b in self.businesses for o in sorted(self.orders[b.pk], key=lambda o: o.pk)],
+        )
+
+    def test_per_order_outcome(self):
+        first, second = self.businesses
+        rejected      = self.orders[first.pk][1]
+        not_billed    = self.orders[second.pk][0]
+        Orders.objects.filter(pk=not_billed.pk).update(status=Orders.STATUS_SEPARADO)
+
+        lote    = self._emitir(self._all_ids(), rejected={rejected.pk})
+        results = {r['order']: r for r in lote['results']}
+
+        self.assertEqual(lote['authorized'], 4)
+
+        self.assertFalse(results[rejected.pk]['ok'])
+        self.assertEqual(results[rejected.pk]['status'], InvoiceStatus.REJEITADA)
+        self.assertIn('SEFAZ (204)', results[rejected.pk]['message'])
+
+        self.assertFalse(results[not_billed.pk]['ok'])
+        self.assertIsNone(results[not_billed.pk]['invoice'])
+        self.assertIn('não está faturado', results[not_billed.pk]['message'])
+
+        authorized = results[self.orders[first.pk][0].pk]
+        self.assertTrue(authorized['ok'])
+        self.assertEqual(authorized['status'], InvoiceStatus.AUTORIZADA)
+        self.assertEqual(authorized['invoice'], '1/101')
+        self.assertTrue(authorized['message'].startswith('Autorizada. Protocolo: 135'))
+
+        # A rejeitada volta para o próximo lote; as autorizadas não
+        pending = set(pending_orders(Orders.objects.filter(id__in=self._all_ids())).values_list('id', flat=True))
+        self.assertEqual(pending, {rejected.pk})
+
+    def test_orders_with_queued_invoice_jobs_are_skipped(self):
+        queued, running, done = self.orders[self.businesses[0].pk]
+        Job.objects.create(task='invoice.generate', order=queued, business=queued.business)
+        Job.objects.create(task='invoice.transmit', order=running, business=running.business, status=Job.Status.RUNNING)
+        Job.objects.create(task='invoice.generate', order=done, business=done.business, status=Job.Status.DONE)
+
+        ids = list(pending_orders(Orders.objects.filter(id__in=self._all_ids())).values_list('id', flat=True))
+        self.assertNotIn(queued.pk, ids)
+        self.assertNotIn(running.pk, ids)
+        self.assertIn(done.pk, ids)
+
+        lote = self._emitir(ids)
+        self.assertEqual(lote['authorized'], 4)
+        self.assertFalse(Invoice.objects.filter(order__in=[queued, running]).exists())
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# NF — numeração (sequência, blocos, inutilização)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _invoice(business, number, model='55', serie='1', **extra):
+    """NF mínima com o número dado (um pedido por NF: único por pedido/modelo)."""
+    return Invoice.objects.create(
+        order=_order(business, document_model=model), model=model, serie=serie, number=number,
+        nature_operation='VENDA', issue_date=timezone.now(), emit_name=business.name,
+        emit_cnpj=business.document, dest_name='CONSUMIDOR', **extra,
+    )
+
+
+class FiscalNumberSequenceTests(NumberingOnDefaultMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.business = _business(nfe_last_number=50)
+
+    def test_next_number_is_sequential_per_model_and_series(self):
+        self.assertEqual([fiscal_numbers.next_number(self.business, '55', '1') for _ in range(3)], [51, 52, 53])
+        self.assertEqual(fiscal_numbers.next_number(self.business, '55', '2'), 51)
+        self.assertEqual(fiscal_numbers.next_number(self.business, '65', '1'), 1)
+
+        sequence = FiscalNumberSequence.objects.get(business=self.business, model='55', serie='1')
+        self.assertEqual(sequence.last_number, 53)
+
+    def test_seed_from_business_last_number(self):
+        fiscal_numbers.next_number(self.business, '55', '1')
+
+        sequence = FiscalNumberSequence.objects.get(business=self.business, model='55', serie='1')
+        # Histórico anterior à sequência não entra na varredura
+        self.assertEqual((sequence.last_number, sequence.checked_through, sequence.scan_through), (51, 50, 50))
+
+    def test_business_jump_skips_ahead_and_records_checked_block(self):
+        fiscal_numbers.next_number(self.business, '55', '1')   # 51
+
+        self.business.nfe_last_number = 100
+        self.assertEqual(fiscal_numbers.next_number(self.business, '55', '1'), 101)
+
+        skipped = FiscalNumberBlock.objects.get(business=self.business, worker='Business')
+        self.assertEqual((skipped.start, skipped.end, skipped.status), (52, 100, FiscalNumberBlock.Status.CHECKED))
+
+        # Business atrás da sequência não volta a numeração
+        self.business.nfe_last_number = 60
+        self.assertEqual(fiscal_numbers.next_number(self.business, '55', '1'), 102)
+
+    def test_peek_does_not_consume(self):
+        self.assertEqual(fiscal_numbers.peek_next_number(self.business, '55', '1'), 51)
+        self.assertEqual(fiscal_numbers.peek_next_number(self.business, '55', '1'), 51)
+        self.assertEqual(fiscal_numbers.next_number(self.business, '55', '1'), 51)
+        self.assertEqual(fiscal_numbers.peek_next_number(self.business, '55', '1'), 52)
+
+
+class FiscalNumberBlockTests(NumberingOnDefaultMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.business = _business()
+        self.addCleanup(fiscal_numbers._BLOCKS.clear)
+        self.addCleanup(fiscal_numbers.use_blocks, None)
+
+    def test_reserve_block_advances_sequence(self):
+        block = fiscal_numbers.reserve_block(self.business, '65', '1', 10, worker='w1')
+
+        self.assertEqual((block.start, block.end, block.status), (1, 10, FiscalNumberBlock.Status.OPEN))
+        self.assertEqual(fiscal_numbers.next_number(self.business, '65', '1'), 11)
+
+    def test_close_block(self):
+        block = fiscal_numbers.reserve_block(self.business, '65', '1', 10, worker='w1')
+        fiscal_numbers.close_block(block)
+
+        block.refresh_from_db()
+        self.assertEqual(block.status, FiscalNumberBlock.Status.CLOSED)
+        self.assertIsNotNone(block.closed_at)
+
+    @override_settings(NFCE_NUMBER_BLOCK_SIZE=3)
+    def test_take_number_uses_worker_block(self):
+        fiscal_numbers.use_blocks('w1')
+
+        numbers = [fiscal_numbers.take_number(self.business, '65', '1') for _ in range(4)]
+        self.assertEqual(numbers, [1, 2, 3, 4])
+
+        blocks = list(FiscalNumberBlock.objects.order_by('start').values_list('start', 'end', 'status'))
+        self.assertEqual(blocks, [(1, 3, FiscalNumberBlock.Status.CLOSED), (4, 6, FiscalNumberBlock.Status.OPEN)])
+
+        # NF-e não usa bloco
+        self.assertEqual(fiscal_numbers.take_number(self.business, '55', '1'), 1)
+
+        fiscal_numbers.release_blocks()
+        self.assertFalse(FiscalNumberBlock.objects.filter(status=FiscalNumberBlock.Status.OPEN).exists())
+
+
+@override_settings(JOB_STALE_AFTER=600)
+class FindUnusedNumbersTests(NumberingOnDefaultMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.business = _business()
+
+    def _voids(self):
+        return list(FiscalNumberVoid.objects.order_by('start').values_list('start', 'end'))
+
+    def test_sequence_gaps_wait_for_the_margin_and_skip_any_invoice(self):
+        for _ in range(5):
+            fiscal_numbers.next_number(self.business, '55', '1')
+        _invoice(self.business, 2)
+        _invoice(self.business, 4, status=InvoiceStatus.REJEITADA)
+
+        start = timezone.now()
+        self.assertEqual(fiscal_numbers.find_unused_numbers(now=start), [])        # só marca 1..5
+
+        fiscal_numbers.next_number(self.business, '55', '1')                     # 6, depois da marca
+        self.assertEqual(fiscal_numbers.find_unused_numbers(now=start + timedelta(minutes=5)), [])
+        self.assertEqual(self._voids(), [])
+
+        fiscal_numbers.find_unused_numbers(now=start + timedelta(minutes=11))
+        self.assertEqual(self._voids(), [(1, 1), (3, 3), (5, 5)])
+
+    def test_number_with_invoice_is_never_voided(self):
+        for _ in range(3):
+            fiscal_numbers.next_number(self.business, '55', '1')
+
+        start = timezone.now()
+        fiscal_numbers.find_unused_numbers(now=start)
+
+        # NF gravada depois da marca, em qualquer status
+        for number, status in [(1, InvoiceStatus.RASCUNHO), (2, InvoiceStatus.CANCELADA), (3, InvoiceStatus.PENDENTE)]:
+            _invoice(self.business, number, status=status)
+
+        fiscal_numbers.find_unused_numbers(now=start + timedelta(minutes=11))
+        self.assertEqual(self._voids(), [])
+
+    def test_closed_block_leftovers_after_margin(self):
+        block = fiscal_numbers.reserve_block(self.business, '65', '1', 5, worker='w1')
+        _invoice(self.business, 1, model='65')
+        _invoice(self.business, 2, model='65')
+        fiscal_numbers.close_block(block)
+
+        now = timezone.now()
+        fiscal_numbers.find_unused_numbers(now=now)
+        self.assertEqual(self._voids(), [])
+
+        fiscal_numbers.find_unused_numbers(now=now + timedelta(minutes=11))
+        self.assertEqual(self._voids(), [(3, 5)])
+        block.refresh_from_db()
+        self.assertEqual(block.status, FiscalNumberBlock.Status.CHECKED)
+
+    def test_range_is_rechecked_before_sending(self):
+        void = FiscalNumberVoid.objects.create(
+            business=self.business, model='55', serie='1', start=1, end=3,
+            justification=fiscal_numbers.JUSTIFICATIVA,
+        )
+        _invoice(self.business, 2)
+
+        with mock.patch('core.services.fiscal.sefaz_client.inutilizar') as inutilizar:
+            self.assertEqual(fiscal_numbers.inutilizar_pendentes(), (0, 1))
+            inutilizar.assert_not_called()
+
+        void.refresh_from_db()
+        self.assertEqual(void.status, FiscalNumberVoid.Status.ERROR)
+        self.assertEqual(
+            list(FiscalNumberVoid.objects.filter(status=FiscalNumberVoid.Status.PENDING).values_list('start', 'end')),
+            [(1, 1), (3, 3)],
+        )
+
+
+class BusinessFormJumpTests(NumberingOnDefaultMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.business = _business(nfe_last_number=10)
+        for _ in range(5):
+            fiscal_numbers.next_number(self.business, '55', '1')   # 11..15
+        self.business.refresh_from_db()
+
+    def _form(self, **jumps):
+        form = BusinessForm(instance=self.business)
+        data = {
+            name: value for name, value in model_to_dict(self.business).items()
+            if name in form.fields and value is not None
+        }
+        data.update(jumps)
+        return BusinessForm(data, instance=self.business)
+
+    def test_shows_sequence_not_stale_business_value(self):
+        form = BusinessForm(instance=self.business)
+        self.assertNotIn('nfe_last_number', form.fields)
+        self.assertEqual(form.nfe_next_number, 16)
+        self.assertEqual(form.nfce_next_number, 1)
+
+    def test_jump_backwards_is_rejected(self):
+        form = self._form(nfe_jump_to=12)
+        self.assertFalse(form.is_valid())
+        self.assertIn('nfe_jump_to', form.errors)
+
+    def test_save_without_jump_keeps_numbering(self):
+        form = self._form()
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.nfe_last_number, 10)
+        self.assertEqual(fiscal_numbers.next_number(self.business, '55', '1'), 16)
+
+    def test_jump_forward_sets_next_number(self):
+        form = self._form(nfe_jump_to=100)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.nfe_last_number, 99)
+        self.assertEqual(fiscal_numbers.next_number(self.business, '55', '1'), 100)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FISCAL — índice em memória
+# ─────────────────────────────────────────────────────────────────────────────
+
+class FiscalIndexTests(TestCase):
+
+    def setUp(self):
+        for memo in (fiscal_index._INDEXES, fiscal_index._ICMS_MATRIX, fiscal_index._VERSIONS):
+            memo.clear()
+            self.addCleanup(memo.clear)
+        self.business = _business()
+
+    def test_hot_path_does_not_query(self):
+        index, matrix = fiscal_index.get_fiscal_index(self.business.pk)
+
+        with self.assertNumQueries(0):
+            again = fiscal_index.get_fiscal_index(self.business.pk)
+        self.assertEqual(again, (index, matrix))
+
+    def test_version_changed_by_other_process(self):
+        index, _ = fiscal_index.get_fiscal_index(self.business.pk)
+        FiscalIndexVersion.objects.create(scope=f'business:{self.business.pk}', version=1)
+
+        # Dentro do intervalo: segue com o índice carregado, sem consulta
+        with self.assertNumQueries(0):
+            self.assertIs(fiscal_index.get_fiscal_index(self.business.pk)[0], index)
+
+        with override_settings(FISCAL_INDEX_VERSION_CHECK=0):
+            reloaded, _ = fiscal_index.get_fiscal_index(self.business.pk)
+        self.assertIsNot(reloaded, index)
+        self.assertEqual(reloaded.version, (0, 1))
+
+    def test_invalidation_in_this_process_is_immediate(self):
+        index, matrix = fiscal_index.get_fiscal_index(self.business.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fiscal_index.invalidate_fiscal_index()
+
+        new_index, new_matrix = fiscal_index.get_fiscal_index(self.business.pk)
+        self.assertIsNot(new_index, index)
+        self.assertIsNot(new_matrix, matrix)
+        self.assertEqual(FiscalIndexVersion.objects.get(scope='global').version, 1)
+
+    @override_settings(FISCAL_INDEX_MAX_BUSINESSES=2)
+    def test_indexes_are_bounded_lru(self):
+        first, second, third = self.business, _business('B', document='2'), _business('C', document='3')
+
+        fiscal_index.get_fiscal_index(first.pk)
+        fiscal_index.get_fiscal_index(second.pk)
+        fiscal_index.get_fiscal_index(first.pk)    # usado de novo: second vira o mais antigo
+        fiscal_index.get_fiscal_index(third.pk)
+
+        self.assertEqual(list(fiscal_index._INDEXES), [first.pk, third.pk])
+        self.assertLessEqual(len(fiscal_index._VERSIONS), 2)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# API — ingestão de pedidos
+# ─────────────────────────────────────────────────────────────────────────────
+
+INGEST_URL = '/api/orders/ingest/'
+
+
+def _api_user(business, username='api'):
+    plan = Plan.objects.create(name='Marketplace', price=0, has_marketplace_integration=True)
+    business.plan = plan
+    business.save(update_fields=['plan'])
+    return User.objects.create_user(username, f'{username}@teste.com', 'senha', business=business)
+
+
+class OrderIngestApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = _business()
+        cls.user     = _api_user(cls.business)
+        cls.red      = _variant(cls.business, sku='RED')
+        cls.blue     = _variant(cls.business, sku='BLUE')
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _post(self, orders, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.api.post(INGEST_URL, {'orders': orders}, format='json', **headers)
+
+    def _payload(self):
+        return [
+            {'external_id': 'A', 'items': [{'sku': 'RED', 'quantity': 2, 'price': '10.00'}],
+             'payments': [{'total_value': '20.00', 'parcels': 2}]},
+            {'external_id': 'B', 'items': [{'sku': 'NAO-EXISTE', 'quantity': 1, 'price': '5.00'}]},
+            {'external_id': 'C', 'items': []},
+            {'external_id': 'D', 'items': [{'sku': 'BLUE', 'quantity': 1, 'price': '7.50'},
+                                           {'sku': 'RED', 'quantity': 3, 'price': '1.00'}],
+             'payments': [{'total_value': '10.50', 'parcels': 3}]},
+        ]
+
+    def test_invalid_orders_do_not_block_the_others(self):
+        response = self._post(self._payload())
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 2))
+        self.assertEqual([r['ok'] for r in body['results']], [True, False, False, True])
+        self.assertIn('variante não encontrada', body['results'][1]['errors'][0])
+        self.assertIn('items', body['results'][2]['errors'])
+        self.assertEqual(Orders.objects.filter(business=self.business).count(), 2)
+
+    def test_ids_map_to_their_own_items_and_payments(self):
+        results = self._post(self._payload()).json()['results']
+        a, d    = results[0], results[3]
+
+        order_a = Orders.objects.get(pk=a['id'])
+        order_d = Orders.objects.get(pk=d['id'])
+        self.assertEqual(str(order_a.uid), a['uid'])
+        self.assertEqual(str(order_d.uid), d['uid'])
+
+        self.assertEqual(
+            list(order_a.items.values_list('variant__sku', 'quantity')), [('RED', 2)],
+        )
+        self.assertEqual(
+            sorted(order_d.items.values_list('variant__sku', 'quantity')), [('BLUE', 1), ('RED', 3)],
+        )
+        self.assertEqual(order_a.total_amount, Decimal('20.00'))
+        self.assertEqual(order_d.total_amount, Decimal('10.50'))
+
+        payment_d = order_d.payments.get()
+        self.assertEqual(payment_d.total_value, Decimal('10.50'))
+        self.assertEqual(
+            list(OrderPaymentParcel.objects.filter(payment=payment_d).values_list('value', flat=True)),
+            split_installments(Decimal('10.50'), 3),
+        )
+        self.assertEqual(order_a.payments.get().parcels_records.count(), 2)
+
+    def test_same_key_same_body_replays_without_creating(self):
+        first  = self._post(self._payload(), key='lote-1')
+        second = self._post(self._payload(), key='lote-1')
+
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Orders.objects.filter(business=self.business).count(), 2)
+
+    def test_same_key_different_body_is_422(self):
+        self._post(self._payload(), key='lote-1')
+        response = self._post(self._payload()[:1], key='lote-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Orders.objects.filter(business=self.business).count(), 2)
+
+    def test_concurrent_request_with_same_key_replays(self):
+        # Outra requisição gravou a chave depois da consulta inicial desta
+        self._post(self._payload(), key='lote-1')
+        real_filter = IdempotencyKey.objects.filter
+        calls       = []
+
+        def filter_after_race(*args, **kwargs):
+            calls.append(kwargs)
+            qs = real_filter(*args, **kwargs)
+            return qs.none() if len(calls) == 1 else qs
+
+        with mock.patch.object(IdempotencyKey.objects, 'filter', side_effect=filter_after_race):
+            response = self._post(self._payload(), key='lote-1')
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Orders.objects.filter(business=self.business).count(), 2)
+
+    def test_integrity_error_from_ingest_is_reraised(self):
+        # Erro do próprio _ingest desfaz a chave junto: nada para reaproveitar
+        with mock.patch('core.api.OrderIngestView._ingest', side_effect=IntegrityError('duplicado')):
+            with self.assertRaises(IntegrityError):
+                self._post(self._payload(), key='lote-1')
+
+        self.assertFalse(IdempotencyKey.objects.filter(business=self.business).exists())
+
+    def test_plan_without_marketplace_is_forbidden(self):
+        self.business.plan.has_marketplace_integration = False
+        self.business.plan.save()
+
+        self.assertEqual(self._post(self._payload()).status_code, 403)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# API — listagem e detalhe de pedidos
+# ─────────────────────────────────────────────────────────────────────────────
+
+ORDERS_URL = '/api/orders/'
+
+
+class OrderApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = _business()
+        cls.user     = User.objects.create_user('api', 'api@teste.com', 'senha', business=cls.business)
+        cls.variant  = _variant(cls.business)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _orders(self, count):
+        orders = []
+        for _ in range(count):
+            order   = _order(self.business, [(self.variant, 1, '10'), (self.variant, 2, '5')])
+            payment = OrderPayment.objects.create(order=order, total_value=Decimal('20'), parcels=2)
+            OrderPaymentParcel.objects.bulk_create(payment.build_parcels())
+            orders.append(order)
+        return orders
+
+    def _page_queries(self, count):
+        self._orders(count)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(ORDERS_URL)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()['results']
+
+    def test_page_query_count_does_not_grow_with_orders(self):
+        # ETag (agregado) + página + itens + pagamentos + parcelas
+        few, results = self._page_queries(2)
+        self.assertEqual(len(results), 2)
+
+        many, results = self._page_queries(8)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(many, few)
+
+        with self.assertNumQueries(5):
+            self.api.get(ORDERS_URL)
+
+        self.assertEqual(len(results[0]['items']), 2)
+        self.assertEqual(len(results[0]['payments'][0]['parcels_records']), 2)
+
+    def test_sparse_fields_skip_unrequested_relations(self):
+        self._orders(3)
+
+        # ETag + página, sem prefetch de itens/pagamentos
+        with self.assertNumQueries(2):
+            response = self.api.get(ORDERS_URL, {'fields': 'id,status'})
+
+        self.assertEqual(response.status_code, 200)
+        for row in response.json()['results']:
+            self.assertEqual(set(row), {'id', 'status'})
+
+    def test_list_matching_etag_is_304_until_an_order_changes(self):
+        order, _ = self._orders(2)
+        first    = self.api.get(ORDERS_URL)
+        etag     = first['ETag']
+
+        cached = self.api.get(ORDERS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+
+        order.save()
+        changed = self.api.get(ORDERS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        self._orders(1)
+        added = self.api.get(ORDERS_URL, HTTP_IF_NONE_MATCH=changed['ETag'])
+        self.assertEqual(added.status_code, 200)
+        self.assertEqual(len(added.json()['results']), 3)
+
+    def test_retrieve_matching_etag_is_304_until_the_order_changes(self):
+        order, = self._orders(1)
+        url    = f'{ORDERS_URL}{order.pk}/'
+        etag   = self.api.get(url)['ETag']
+
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        order.save()
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], order.pk)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_retrieve_other_business_is_404(self):
+        other = _order(_business('Outra', document='99999999000199'))
+        self.assertEqual(self.api.get(f'{ORDERS_URL}{other.pk}/').status_code, 404)
+
+    def test_updated_since_filters_and_validates(self):
+        old, new = self._orders(2)
+        Orders.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        since    = (timezone.now() - timedelta(days=1)).isoformat()
+
+        response = self.api.get(ORDERS_URL, {'updated_since': since})
+        self.assertEqual([r['id'] for r in response.json()['results']], [new.pk])
+
+        for value in ('ontem', '2024-02-30T10:00:00'):
+            with self.subTest(value=value):
+                response = self.api.get(ORDERS_URL, {'updated_since': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('updated_since', response.json())
+
+    def test_save_with_empty_update_fields_writes_nothing(self):
+        order, = self._orders(1)
+        order.refresh_from_db()
+        updated_at = order.updated_at
+
+        with self.assertNumQueries(0):
+            order.save(update_fields=[])
+
+        order.refresh_from_db()
+        self.assertEqual(order.updated_at, updated_at)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# NF — geração e XML
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _nf(business, items):
+    """NF gerada (gerar_nota_fiscal) de um pedido faturado com os itens dados."""
+    client = Client.objects.create(business=business, name='Cliente', state='RJ', document='12345678901')
+    order  = _order(business, items, client=client, document_model='55')
+    OrderPayment.objects.create(order=order, total_value=sum(q * Decimal(p) for _, q, p in items))
+    Orders.objects.filter(pk=order.pk).update(status=Orders.STATUS_FATURADO)
+    order.refresh_from_db()
+    return gerar_nota_fiscal(order)
+
+
+def _fiscal_business():
+    return _business(
+        street='Rua A', number='1', district='Centro', city='São Paulo',
+        city_code='3550308', zip_code='01000-000',
+    )
+
+
+def _writes(queries):
+    return [
+        q['sql'] for q in queries
+        if q['sql'].split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+class XmlBuilderTests(NumberingOnDefaultMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = _fiscal_business()
+        cls.red      = _variant(cls.business, sku='RED')
+        cls.blue     = _variant(cls.business, sku='BLUE')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.invoice = _nf(self.business, [(self.red, 2, '10.00'), (self.blue, 1, '7.50')])
+
+    def _hash(self):
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        return xml_builder.content_hash(invoice, *xml_builder._conteudo(invoice))
+
+    def _sign(self):
+        signer = mock.Mock(side_effect=lambda invoice, xml: f'<assinado>{xml}')
+        with mock.patch('core.services.fiscal.signer.assinar_xml', signer):
+            xml = xml_builder.build_signed_xml(Invoice.objects.get(pk=self.invoice.pk))
+        return xml, signer.call_count
+
+    def test_freeze_key_is_idempotent(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(code_nf='', access_key='', dv=None)
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+
+        chave = xml_builder.freeze_key(invoice)
+        self.assertEqual(len(chave), 44)
+        self.assertEqual(len(invoice.code_nf), 8)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(xml_builder.freeze_key(invoice), chave)
+
+        stored = Invoice.objects.get(pk=invoice.pk)
+        self.assertEqual((stored.code_nf, stored.access_key), (invoice.code_nf, chave))
+        self.assertEqual(xml_builder.freeze_key(stored), chave)
+
+    def test_build_does_not_write(self):
+        xml_builder.freeze_key(self.invoice)
+
+        with CaptureQueriesContext(connection) as queries:
+            xml_builder.build_xml(Invoice.objects.get(pk=self.invoice.pk))
+            self._sign()
+            self._sign()   # do cache
+
+        self.assertEqual(_writes(queries), [])
+
+    def test_hash_changes_when_an_item_or_payment_changes(self):
+        original = self._hash()
+        self.assertEqual(self._hash(), original)
+
+        item = self.invoice.items.order_by('item_number').first()
+        item.quantity += 1
+        item.save()
+        after_item = self._hash()
+        self.assertNotEqual(after_item, original)
+
+        payment = self.invoice.payments.get()
+        payment.value += 1
+        payment.save()
+        self.assertNotEqual(self._hash(), after_item)
+
+    def test_signed_cache_follows_certificate_not_password(self):
+        first, calls = self._sign()
+        self.assertEqual(calls, 1)
+
+        Business.objects.filter(pk=self.business.pk).update(certificate_password='outra')
+        self.assertEqual(self._sign(), (first, 0))
+
+        Business.objects.filter(pk=self.business.pk).update(
+            certificate_expiration=timezone.now().date() + timedelta(days=365),
+        )
+        self.assertEqual(self._sign()[1], 1)
+
+
+class XmlSerializerCacheTests(NumberingOnDefaultMixin, TestCase):
+    """Serializador do processo (get_serializer/warm_up) × um XmlContext novo."""
+
+    def test_cached_serializer_renders_like_a_fresh_one(self):
+        business = _fiscal_business()
+        invoice  = _nf(business, [(_variant(business, sku='RED'), 2, '10.00'),
+                                  (_variant(business, sku='BLUE'), 1, '7.50')])
+        xml_builder.freeze_key(invoice)
+        tree     = xml_builder.build_nfe(invoice)
+
+        fresh = XmlSerializer(context=XmlContext()).render(tree)
+
+        with mock.patch.dict(xml_builder._SERIALIZER, clear=True):
+            xml_builder.warm_up()
+            self.assertIs(xml_builder.get_serializer(), xml_builder.get_serializer())
+            self.assertEqual(xml_builder.render_xml(tree), fresh)
+            self.assertEqual(xml_builder.render_xml(tree), fresh)
+
+        self.assertEqual(xml_builder.render_xml(tree), fresh)
+        self.assertIn(invoice.access_key, fresh)
+
+
+class GerarNotaFiscalTests(NumberingOnDefaultMixin, TestCase):
+
+    def test_totals_match_the_sum_of_the_items(self):
+        business = _fiscal_business()
+        red, blue, green = (_variant(business, sku=sku) for sku in ('RED', 'BLUE', 'GREEN'))
+        client   = Client.objects.create(business=business, name='Cliente', state='RJ', document='12345678901')
+        order    = _order(business, [(red, 3, '19.99'), (blue, 1, '7.50'), (green, 7, '0.33')],
+                          client=client, document_model='55')
+        OrderItem.objects.filter(order=order, variant=red).update(
+            discount=Decimal('2.00'), icms_base=Decimal('57.97'), icms_value=Decimal('10.43'),
+            pis_value=Decimal('0.38'), cofins_value=Decimal('1.74'),
+        )
+        OrderItem.objects.filter(order=order, variant=green).update(
+            addition=Decimal('0.50'), icms_base=Decimal('2.81'), icms_value=Decimal('0.51'),
+        )
+        Orders.objects.filter(pk=order.pk).update(status=Orders.STATUS_FATURADO)
+        order.refresh_from_db()
+
+        invoice = Invoice.objects.get(pk=gerar_nota_fiscal(order).pk)
+        items   = list(invoice.items.order_by('item_number'))
+
+        def soma(field):
+            return sum((getattr(item, field) for item in items), Decimal('0'))
+
+        self.assertEqual([i.item_number for i in items], [1, 2, 3])
+        self.assertEqual([i.gross_total for i in items], [Decimal('59.97'), Decimal('7.50'), Decimal('2.31')])
+
+        produtos = soma('gross_total') - soma('discount') + soma('addition')
+        self.assertEqual(invoice.total_products, produtos)
+        self.assertEqual(invoice.total_products, Decimal('68.28'))
+        self.assertEqual(invoice.total_discount, soma('discount'))
+        self.assertEqual(invoice.total_bc_icms, soma('icms_bc'))
+        self.assertEqual(invoice.total_icms, soma('icms_value'))
+        self.assertEqual(invoice.total_pis, soma('pis_value'))
+        self.assertEqual(invoice.total_cofins, soma('cofins_value'))
+        self.assertEqual(
+            invoice.total_nf,
+            produtos + soma('freight') + soma('insurance') + soma('other') + soma('icms_st_value'),
+        )
+
+        # Sem pagamento no pedido: um "Outros" com o total da NF
+        self.assertEqual(
+            list(invoice.payments.values_list('payment_code', 'value')), [('99', invoice.total_nf)],
+        )
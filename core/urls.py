@@ -72,6 +72,7 @@ urlpatterns = [
     # Estoque
     path('products/<int:variant_id>/stock/',  stock_movement,    name='stock_movement'),
     path('stock-entry/<int:pk>/delete/',      stock_entry_delete, name='stock_entry_delete'),
+    path('estoque/posicao/',                  stock_report,      name='stock_report'),
 
     # Pedidos
     path('pedidos/',                         order_list,           name='order_list'),
@@ -81,12 +82,14 @@ urlpatterns = [
     path('pedidos/<int:order_id>/status/',   order_change_status,  name='order_change_status'),
     path('pedidos/<int:order_id>/avancar/',  order_advance_status, name='order_advance_status'),
     path('pedidos/<int:order_id>/cancelar/', order_cancel,         name='order_cancel'),
+    path('pedidos/status/lote/',             order_bulk_status,    name='order_bulk_status'),
 
     path('pedidos/<int:order_id>/gerar-nf/', gerar_nfe, name='gerar_nfe'),
 
     # AJAX
     path('ajax/variants/',        ajax_variants,    name='ajax_variants'),
     path('ajax/fiscal/item/',     ajax_fiscal_item, name='ajax_fiscal_item'),  # 🔥 NOVO
+    path('ajax/fiscal/items/',    ajax_fiscal_items, name='ajax_fiscal_items'),  # prévia em lote
 
     # Contas Bancárias
     path('financeiro/bancos/',                  bank_list,   name='bank_list'),
@@ -1,3 +1,4 @@
+import json
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
@@ -17,18 +18,27 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.db import transaction
-from .services.order_stock import reserve_stock, release_stock, finalize_stock, create_variants
-from .services.fiscal_rules import apply_fiscal_rules  # 🔥 FISCAL
+from .services.order_stock import (
+    reserve_stock, release_stock, create_variants, apply_stock_balance,
+    get_stock_levels, sum_stock_levels,
+)
+from .services.stock_snapshot import stock_as_of
+from .services.stock_history import stock_history_page
+from .services.keyset import keyset_page
+from .services.order_status import bulk_change_status
+from .services.order_stats import stats_for, totals_by_status
+from .services.fiscal_rules import apply_fiscal_rules, apply_fiscal_rules_bulk, FISCAL_FIELDS  # 🔥 FISCAL
 from django.core.exceptions import ValidationError
 from django.utils.timezone import make_aware
 from datetime import datetime, date
-from django.db.models import Sum, Count, Q, Prefetch
+from django.db.models import Sum, Q, F, Prefetch, DecimalField
 from django.db.models.functions import TruncMonth
 from django.urls import reverse_lazy, reverse
 from decimal import Decimal
 from .models import Client, Orders, Product, FinancialMovement, FinancialMovementParcel
 import calendar
 from core.services.nf_generator import gerar_nota_fiscal
+from core.services.fiscal_numbers import peek_next_number
 from core.models import Invoice, InvoiceStatus
 from django.views.generic import (
     ListView, CreateView, UpdateView, DeleteView, DetailView, TemplateView  # ← TemplateView aqui
@@ -286,20 +296,22 @@ def home(request):
     total_clients = Client.objects.filter(business=business).count()
     total_products = Product.objects.filter(business=business).count()
 
-    products = Product.objects.filter(business=business)
-    total_stock = sum(p.stock_real for p in products)
+    total_stock = sum_stock_levels(
+        ProductVariant.objects.filter(product__business=business)
+    )['real']
 
     orders = Orders.objects.filter(business=business)
 
-    orders_month_qs = orders.filter(
-        created_at__year=today.year,
-        created_at__month=today.month
-    )
+    # 🔹 Contagens/somas vêm do resumo diário (OrderStats), não do histórico
+    month_start = today.replace(day=1)
+    stats_month = stats_for(business, date__gte=month_start, date__lte=today)
 
-    orders_today = orders.filter(created_at__date=today).count()
-    orders_month = orders_month_qs.count()
+    orders_today = stats_for(business, date=today).aggregate(
+        total=Sum('count')
+    )['total'] or 0
+    orders_month = stats_month.aggregate(total=Sum('count'))['total'] or 0
 
-    revenue_month = orders_month_qs.filter(
+    revenue_month = stats_month.filter(
         status=Orders.STATUS_FATURADO
     ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
 
@@ -335,8 +347,8 @@ def home(request):
     saldo_mes = entradas_recebidas - saidas_pagas
 
     sales_by_month = (
-        orders.filter(status=Orders.STATUS_FATURADO)
-        .annotate(month=TruncMonth('created_at'))
+        stats_for(business, status=Orders.STATUS_FATURADO)
+        .annotate(month=TruncMonth('date'))
         .values('month')
         .annotate(total=Sum('total_amount'))
         .order_by('month')
@@ -347,10 +359,10 @@ def home(request):
         for item in sales_by_month
     ]
 
-    orders_by_status = orders.values('status').annotate(total=Count('id'))
     orders_by_status_data = [
-        {'status': item['status'], 'total': item['total']}
-        for item in orders_by_status
+        {'status': status, 'total': totals['count']}
+        for status, totals in totals_by_status(business).items()
+        if totals['count']
     ]
 
     last_orders = orders.select_related('client').order_by('-created_at')[:8]
@@ -643,7 +655,7 @@ def product_list(request):
         Product.objects
         .filter(business=request.user.business)
         .prefetch_related(
-            'variants__stock_entries',
+            'variants__stock_balance',
             Prefetch('images', queryset=ProductImage.objects.filter(order=0), to_attr='cover_image')
         )
     )
@@ -664,13 +676,20 @@ def product_list(request):
     low_stock_count   = 0
     total_stock_value = 0
 
-    for product in base_qs:
-        for variant in product.variants.all():
-            available          = variant.stock_available
-            total_stock       += available
-            total_stock_value += available * product.cost
-            if available < 5:
-                low_stock_count += 1
+    # 🔹 Resumo: ids+custo numa consulta, saldos em outra
+    variant_costs = dict(
+        ProductVariant.objects
+        .filter(product__in=base_qs.values('id'))
+        .values_list('id', 'product__cost')
+    )
+    levels = get_stock_levels(variant_costs)
+
+    for variant_id, cost in variant_costs.items():
+        available          = levels[variant_id]['available']
+        total_stock       += available
+        total_stock_value += available * cost
+        if available < 5:
+            low_stock_count += 1
 
     paginator = Paginator(base_qs, 10)
     products  = paginator.get_page(request.GET.get('page'))
@@ -738,41 +757,123 @@ def product_delete(request, pk):
 # ─────────────────────────────────────────────────────────────────────────────
 
 @login_required
+@transaction.atomic
 def stock_movement(request, variant_id):
-    variant   = get_object_or_404(ProductVariant, id=variant_id, product__business=request.user.business)
-    movements = variant.stock_entries.order_by('-timestamp')
-    form      = StockEntryForm(request.POST or None)
+    variant = get_object_or_404(
+        ProductVariant.objects.select_related('product', 'product__business', 'size', 'stock_balance'),
+        id=variant_id, product__business=request.user.business,
+    )
+    form = StockEntryForm(request.POST or None)
 
     if request.method == 'POST' and form.is_valid():
         entry         = form.save(commit=False)
         entry.variant = variant
+        # Linha de saldo existe desde a primeira movimentação da variante
         entry.movement_type = (
             StockEntry.MovementType.INITIAL
-            if not variant.stock_entries.exists()
+            if variant._get_stock_balance() is None
             else StockEntry.MovementType.ADJUST
         )
         entry.save()
+        apply_stock_balance([entry])
         return redirect('stock_movement', variant_id=variant.id)
 
+    # 🔹 Filtros + cursor
+    movement_type = request.GET.get('movement_type', '')
+    if movement_type not in StockEntry.MovementType.values:
+        movement_type = ''
+
+    def parse_date(value):
+        try:
+            return date.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+
+    date_from = parse_date(request.GET.get('date_from'))
+    date_to   = parse_date(request.GET.get('date_to'))
+
+    movements, next_cursor = stock_history_page(
+        variant,
+        cursor=request.GET.get('cursor'),
+        movement_type=movement_type,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+
     return render(request, 'stock/movement.html', {
         'variant': variant,
         'movements': movements,
         'form': form,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'filters_query': filters.urlencode(),
+        'movement_type': movement_type,
+        'movement_types': StockEntry.MovementType.choices,
+        'date_from': date_from,
+        'date_to': date_to,
+        'show_balance': not movement_type,
     })
 
 
 @login_required
+@transaction.atomic
 def stock_entry_delete(request, pk):
     entry   = get_object_or_404(StockEntry, pk=pk, variant__product__business=request.user.business)
     variant = entry.variant
 
     if request.method == 'POST':
+        apply_stock_balance([entry], reverse=True)
         entry.delete()
         return redirect('stock_movement', variant_id=variant.id)
 
     return render(request, 'stock/delete.html', {'entry': entry})
 
 
+@login_required
+def stock_report(request):
+    """
+    Posição de estoque em uma data (fechamento do dia), a partir dos
+    snapshots diários + movimentações posteriores ao último dia fechado.
+    """
+    business = request.user.business
+    search   = request.GET.get('q', '')
+
+    try:
+        as_of = date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        as_of = timezone.localdate()
+
+    variants = (
+        ProductVariant.objects
+        .filter(product__business=business)
+        .select_related('product', 'size', 'color')
+        .order_by('product__name', 'id')
+    )
+
+    if search:
+        variants = variants.filter(
+            Q(product__name__icontains=search) |
+            Q(sku__icontains=search) |
+            Q(ean13__icontains=search)
+        )
+
+    paginator = Paginator(variants, 50)
+    page_obj  = paginator.get_page(request.GET.get('page'))
+
+    levels = stock_as_of(business, [v.id for v in page_obj], as_of)
+    rows   = [(v, levels[v.id]) for v in page_obj]
+
+    return render(request, 'stock/report.html', {
+        'page_obj': page_obj,
+        'rows': rows,
+        'as_of': as_of,
+        'search': search,
+    })
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # PEDIDOS
 # ─────────────────────────────────────────────────────────────────────────────
@@ -815,26 +916,46 @@ def order_list(request):
     if end_date:
         orders = orders.filter(created_at__lte=make_aware(datetime.strptime(end_date, '%Y-%m-%d')))
 
-    summary = base_qs.aggregate(
-        total_orders=Count('id'),
-        total_value=Sum('total_amount'),
-        orcamento_value=Sum('total_amount', filter=models.Q(status=Orders.STATUS_ORCAMENTO)),
-        em_separacao_value=Sum('total_amount', filter=models.Q(status=Orders.STATUS_EM_SEPARACAO)),
-        separado_value=Sum('total_amount', filter=models.Q(status=Orders.STATUS_SEPARADO)),
-        faturado_value=Sum('total_amount', filter=models.Q(status=Orders.STATUS_FATURADO)),
-    )
+    totals  = totals_by_status(request.user.business)
+    summary = {
+        'total_orders': sum(t['count'] for t in totals.values()),
+        'total_value': sum((t['total'] for t in totals.values()), Decimal('0.00')),
+        'orcamento_value': totals.get(Orders.STATUS_ORCAMENTO, {}).get('total'),
+        'em_separacao_value': totals.get(Orders.STATUS_EM_SEPARACAO, {}).get('total'),
+        'separado_value': totals.get(Orders.STATUS_SEPARADO, {}).get('total'),
+        'faturado_value': totals.get(Orders.STATUS_FATURADO, {}).get('total'),
+    }
 
-    paginator = Paginator(orders, 15)
-    page_obj  = paginator.get_page(request.GET.get('page'))
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    filters.pop('cursor', None)
 
-    return render(request, 'orders/list.html', {
-        'orders': page_obj,
-        'page_obj': page_obj,
+    context = {
         'clients': Client.objects.filter(business=request.user.business),
         'status_choices': Orders.STATUS_CHOICES,
         'summary': summary,
         'current_status': status,
-    })
+        'filters_query': filters.urlencode(),
+    }
+
+    # 🔹 ?cursor= → paginação por (created_at, id), sem COUNT/OFFSET
+    if 'cursor' in request.GET:
+        rows, next_cursor = keyset_page(orders, request.GET.get('cursor'), 15)
+        context.update({
+            'orders': rows,
+            'cursor_mode': True,
+            'next_cursor': next_cursor,
+            'is_first_page': not request.GET.get('cursor'),
+        })
+    else:
+        paginator = Paginator(orders, 15)
+        page_obj  = paginator.get_page(request.GET.get('page'))
+        context.update({
+            'orders': page_obj,
+            'page_obj': page_obj,
+        })
+
+    return render(request, 'orders/list.html', context)
 
 @login_required
 @transaction.atomic
@@ -848,7 +969,7 @@ def order_update(request, pk):
 
     if request.method == 'POST':
         form            = OrderForm(request.POST, instance=order, user=request.user)
-        formset         = OrderItemFormSet(request.POST, instance=order, prefix='items')
+        formset         = OrderItemFormSet(request.POST, instance=order, prefix='items', business=business)
         payment_formset = OrderPaymentFormSet(request.POST, instance=order, prefix='payments')
 
         # Coleta formsets de parcelas para cada payment (pelo índice do form)
@@ -867,32 +988,52 @@ def order_update(request, pk):
         if form.is_valid() and formset.is_valid() and payments_valid and parcels_valid:
 
             form.save()
-            total = Decimal('0.00')
 
-            # ── ITENS ──────────────────────────────────────────────────
+            # ── ITENS (em lote) ────────────────────────────────────────
+            to_delete, to_create, to_update = [], [], []
+
             for form_item in formset:
+                if not form_item.cleaned_data:
+                    continue
+
                 if form_item.cleaned_data.get('DELETE'):
                     if form_item.instance.pk:
-                        form_item.instance.delete()
+                        to_delete.append(form_item.instance.pk)
                     continue
 
                 item       = form_item.save(commit=False)
                 item.order = order
+                (to_update if item.pk else to_create).append(item)
+
+            if to_delete:
+                # Entradas do item caem em cascata → desfaz no saldo
+                apply_stock_balance(StockEntry.objects.filter(order_item_id__in=to_delete), reverse=True)
+                OrderItem.objects.filter(pk__in=to_delete).delete()
 
-                try:
-                    found = apply_fiscal_rules(item, raise_on_missing=False)
-                    if not found:
-                        messages.warning(
-                            request,
-                            f'Item "{item.variant.product.name}": nenhuma operação fiscal encontrada.'
-                        )
-                except Exception as e:
-                    messages.error(request, f'Erro ao aplicar regra fiscal: {e}')
+            # Variantes (com produto) já vieram numa consulta pelo formset
+            items = to_create + to_update
 
-                item.save()
-                total += item.subtotal
+            try:
+                for item in apply_fiscal_rules_bulk(order, items, raise_on_missing=False):
+                    messages.warning(
+                        request,
+                        f'Item "{item.variant.product.name}": nenhuma operação fiscal encontrada.'
+                    )
+            except Exception as e:
+                messages.error(request, f'Erro ao aplicar regra fiscal: {e}')
+
+            OrderItem.objects.bulk_create(to_create)
+            OrderItem.objects.bulk_update(
+                to_update,
+                ['variant', 'quantity', 'price', 'discount', 'addition'] + FISCAL_FIELDS,
+            )
 
-            order.total_amount = total
+            order.total_amount = order.items.aggregate(
+                total=Sum(
+                    F('quantity') * F('price') - F('discount') + F('addition'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                )
+            )['total'] or Decimal('0.00')
             order.save(update_fields=['total_amount'])
 
             # ── VALIDAÇÃO: soma pagamentos == total ────────────────────
@@ -946,7 +1087,7 @@ def order_update(request, pk):
 
     else:
         form            = OrderForm(instance=order, user=request.user)
-        formset         = OrderItemFormSet(instance=order, prefix='items')
+        formset         = OrderItemFormSet(instance=order, prefix='items', business=business)
         payment_formset = OrderPaymentFormSet(instance=order, prefix='payments')
 
     # Monta parcelas por pagamento para o template
@@ -968,6 +1109,12 @@ def order_update(request, pk):
         status__in=[InvoiceStatus.RASCUNHO, InvoiceStatus.PENDENTE, InvoiceStatus.AUTORIZADA],
     ).first()
 
+    # Numeração vem da sequência por série (pode estar à frente de Business)
+    modelo         = '55' if order.document_model == '55' else '65'
+    proximo_numero = peek_next_number(
+        business, modelo, business.nfe_series if modelo == '55' else business.nfce_series,
+    )
+
     # Config de formas de pagamento para o JS
     import json
     payment_methods_json = json.dumps([
@@ -991,13 +1138,18 @@ def order_update(request, pk):
         'saldo':                      saldo,
         'invoice_ativa':              invoice_ativa,
         'payment_methods_json':       payment_methods_json,
+        'proximo_numero':             proximo_numero,
+        'jobs':                       order.jobs.order_by('id'),
     })
 
 @login_required
+@transaction.atomic
 def order_delete(request, pk):
     order = get_object_or_404(Orders, pk=pk, business=request.user.business)
 
     if request.method == 'POST':
+        # Entradas de estoque dos itens caem em cascata → desfaz no saldo
+        apply_stock_balance(StockEntry.objects.filter(order_item__order=order), reverse=True)
         order.delete()
         return redirect('order_list')
 
@@ -1023,9 +1175,7 @@ def order_change_status(request, order_id):
             reserve_stock(order)
         elif new_status == Orders.STATUS_CANCELADO:
             release_stock(order)
-        elif new_status == Orders.STATUS_FATURADO:
-            finalize_stock(order)
-            order.generate_financial()
+        # FATURADO: baixa, financeiro e NF seguem na fila (Orders.save)
 
         order.status = new_status
         order.save(update_fields=['status'])
@@ -1050,9 +1200,7 @@ def order_advance_status(request, order_id):
     try:
         if next_status == Orders.STATUS_EM_SEPARACAO:
             reserve_stock(order)
-        elif next_status == Orders.STATUS_FATURADO:
-            finalize_stock(order)
-            order.generate_financial()
+        # FATURADO: baixa, financeiro e NF seguem na fila (Orders.save)
 
         order.status = next_status
         order.save(update_fields=['status'])
@@ -1064,20 +1212,78 @@ def order_advance_status(request, order_id):
     return redirect('order_update', order.id)
 
 
+@login_required
+@require_POST
+def order_bulk_status(request):
+    """
+    Troca de status de vários pedidos (ex.: SEPARADO → FATURADO no fim do dia).
+    Aceita formulário (order_ids, status) ou JSON {"order_ids": [...], "status": "..."};
+    JSON responde com o resultado por pedido.
+    """
+    is_json = request.content_type == 'application/json'
+
+    if is_json:
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'JSON inválido.'}, status=400)
+        raw_ids    = payload.get('order_ids') or []
+        new_status = payload.get('status')
+    else:
+        raw_ids    = request.POST.getlist('order_ids')
+        new_status = request.POST.get('status')
+
+    try:
+        order_ids = [int(oid) for oid in raw_ids]
+    except (TypeError, ValueError):
+        order_ids = None
+
+    if not order_ids:
+        if is_json:
+            return JsonResponse({'error': 'Informe os pedidos.'}, status=400)
+        messages.error(request, 'Selecione ao menos um pedido.')
+        return redirect('order_list')
+
+    results = bulk_change_status(request.user.business, order_ids, new_status)
+
+    if is_json:
+        return JsonResponse({'results': results})
+
+    done   = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    if done:
+        messages.success(
+            request,
+            f'{len(done)} pedido(s) alterado(s) para {dict(Orders.STATUS_CHOICES).get(new_status)}.'
+        )
+    for r in failed:
+        messages.error(request, f'Pedido #{r["id"]}: {r["error"]}')
+
+    return redirect('order_list')
+
+
 @login_required
 @transaction.atomic
 def order_cancel(request, order_id):
-    order = get_object_or_404(Orders, id=order_id, business=request.user.business)
+    # Trava o pedido: a baixa na fila (faturamento) também trava antes de gravar SALE
+    order = get_object_or_404(
+        Orders.objects.select_for_update(), id=order_id, business=request.user.business
+    )
 
     if order.status == Orders.STATUS_FATURADO:
-        for item in order.items.select_related('variant'):
-            StockEntry.objects.create(
-                variant=item.variant,
-                order_item=item,
+        # Devolve só o que já saiu (a baixa pode ainda estar na fila)
+        entries = []
+        for sale in StockEntry.objects.filter(
+            order_item__order=order, movement_type=StockEntry.MovementType.SALE
+        ):
+            entries.append(StockEntry.objects.create(
+                variant_id=sale.variant_id,
+                order_item_id=sale.order_item_id,
                 entry_type='in',
                 movement_type=StockEntry.MovementType.ADJUST,
-                quantity=item.quantity
-            )
+                quantity=sale.quantity
+            ))
+        apply_stock_balance(entries)
 
     if order.financial_movements.exists():
         order.financial_movements.all().delete()
@@ -1133,8 +1339,12 @@ def ajax_variants(request):
         Q(ean13__iexact=query)
     ).select_related('product', 'size', 'color')[:30]
 
+    variants = list(variants)
+    levels   = get_stock_levels(v.id for v in variants)
+
     results = []
     for v in variants:
+        stock     = levels[v.id]['available']
         size_text = f' - {v.size.name}' if v.size else ''
         results.append({
             'id':     v.id,
@@ -1143,11 +1353,11 @@ def ajax_variants(request):
                 f'{v.color.name if v.color else ""} '
                 f'| SKU: {v.sku or "-"} '
                 f'| EAN: {v.ean13 or "-"} '
-                f'| Estoque: {v.stock_available}'
+                f'| Estoque: {stock}'
             ),
             'price':  str(v.product.price or 0),
             'price1': str(v.product.price1 or 0),
-            'stock':  v.stock_available,
+            'stock':  stock,
         })
 
     return JsonResponse({'results': results})
@@ -1177,10 +1387,12 @@ def ajax_fiscal_item(request):
 
     try:
         variant = ProductVariant.objects.select_related(
-            'product', 'product__ncm'
+            'product'
         ).get(id=variant_id, product__business=request.user.business)
 
-        order = Orders.objects.get(id=order_id, business=request.user.business)
+        order = Orders.objects.select_related('business', 'client').get(
+            id=order_id, business=request.user.business
+        )
 
     except (ProductVariant.DoesNotExist, Orders.DoesNotExist):
         return JsonResponse({'error': 'Variante ou pedido não encontrado'}, status=404)
@@ -1197,13 +1409,18 @@ def ajax_fiscal_item(request):
 
     found = apply_fiscal_rules(item, raise_on_missing=False)
 
+    return JsonResponse(_fiscal_item_json(item, found))
+
+
+def _fiscal_item_json(item, found):
+    """Campos fiscais calculados de um item (prévia, sem gravar)."""
     if not found:
-        return JsonResponse({
+        return {
             'found':   False,
             'warning': 'Nenhuma operação fiscal encontrada para este produto.',
-        })
+        }
 
-    return JsonResponse({
+    return {
         'found':        True,
         'cfop':         item.cfop,
         'ncm':          item.ncm,
@@ -1218,7 +1435,81 @@ def ajax_fiscal_item(request):
         'cofins_cst':   item.cofins_cst,
         'cofins_rate':  str(item.cofins_rate),
         'cofins_value': str(item.cofins_value),
-    })
+    }
+
+
+@login_required
+@require_POST
+def ajax_fiscal_items(request):
+    """
+    POST JSON:
+      {"order_id": 1, "client_id": 2, "document_model": "55",
+       "items": [{"variant_id", "quantity", "price", "discount", "addition"}, ...]}
+
+    Prévia fiscal de todas as linhas do pedido numa requisição, sem gravar.
+    client_id / document_model (opcionais) valem o que está na tela, ainda
+    não salvo. Variantes numa consulta e regras pelo índice em memória
+    (apply_fiscal_rules_bulk); retorna {"items": [...]} na ordem recebida.
+    """
+    business = request.user.business
+
+    try:
+        data  = json.loads(request.body)
+        lines = data['items']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'JSON inválido: informe "items".'}, status=400)
+
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        return JsonResponse({'error': '"items" deve ser uma lista de objetos.'}, status=400)
+
+    order = (
+        Orders.objects.select_related('business', 'client')
+        .filter(id=data.get('order_id'), business=business).first()
+        if data.get('order_id') else Orders(business=business)
+    )
+    if order is None:
+        return JsonResponse({'error': 'Pedido não encontrado'}, status=404)
+
+    # Valores da tela (ainda não salvos) prevalecem
+    if 'document_model' in data:
+        order.document_model = data['document_model'] or None
+    if 'client_id' in data:
+        order.client = (
+            Client.objects.filter(id=data['client_id'], business=business).first()
+            if data['client_id'] else None
+        )
+
+    variants = ProductVariant.objects.filter(product__business=business).select_related('product').in_bulk(
+        {line.get('variant_id') for line in lines if str(line.get('variant_id') or '').isdigit()}
+    )
+
+    items = []
+    for line in lines:
+        variant = variants.get(int(line['variant_id'])) if str(line.get('variant_id') or '').isdigit() else None
+        if variant is None:
+            items.append(None)
+            continue
+        try:
+            items.append(OrderItem(
+                order=order,
+                variant=variant,
+                quantity=int(float(line.get('quantity') or 1)),
+                price=Decimal(str(line.get('price') or 0)),
+                discount=Decimal(str(line.get('discount') or 0)),
+                addition=Decimal(str(line.get('addition') or 0)),
+            ))
+        except (ValueError, ArithmeticError):
+            return JsonResponse({'error': 'Quantidade ou valores inválidos.'}, status=400)
+
+    missing = {id(item) for item in apply_fiscal_rules_bulk(
+        order, [item for item in items if item], raise_on_missing=False, save=False,
+    )}
+
+    return JsonResponse({'items': [
+        _fiscal_item_json(item, id(item) not in missing) if item
+        else {'found': False, 'warning': 'Variante não encontrada.'}
+        for item in items
+    ]})
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -2323,14 +2614,12 @@ def invoice_transmit(request, pk):
         return redirect('invoice_detail', pk=pk)
 
     try:
-        from core.services.fiscal.xml_builder import build_xml
-        from core.services.fiscal.signer import assinar_xml
+        from core.services.fiscal.xml_builder import build_xml, build_signed_xml
         from core.services.fiscal.sefaz_client import transmitir
         from django.http import HttpResponse
 
-        xml_str = build_xml(invoice)
-
         if debug:
+            xml_str = build_xml(invoice)
             # Retorna o XML formatado no browser — não transmite nem assina
             from lxml import etree
             try:
@@ -2340,7 +2629,7 @@ def invoice_transmit(request, pk):
                 xml_bonito = xml_str
             return HttpResponse(xml_bonito, content_type='text/xml; charset=utf-8')
 
-        xml_assinado = assinar_xml(invoice, xml_str)
+        xml_assinado = build_signed_xml(invoice)
         resultado    = transmitir(invoice, xml_assinado)
 
         if resultado['sucesso']: